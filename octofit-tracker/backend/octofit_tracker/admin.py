@@ -1,25 +1,46 @@
 from django.contrib import admin
+from . import search
 from .models import User, Team, Activity, Leaderboard, Workout
 
 
+class IndexedSearchAdmin(admin.ModelAdmin):
+    """
+    Answer the admin search box from the search index instead of the
+    regex scans ``search_fields`` turns into. ``search_kind`` is the kind of
+    indexed row and ``search_lookup`` the field holding its primary key.
+    """
+    search_kind = None
+    search_lookup = 'pk'
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        refs = search.refs(self.search_kind, search_term)
+        return queryset.filter(**{f'{self.search_lookup}__in': refs}), False
+
+
 @admin.register(User)
-class UserAdmin(admin.ModelAdmin):
+class UserAdmin(IndexedSearchAdmin):
     list_display = ('name', 'email', 'team', 'fitness_level', 'created_at')
     list_filter = ('fitness_level', 'team')
     search_fields = ('name', 'email')
+    search_kind = 'user'
 
 
 @admin.register(Team)
-class TeamAdmin(admin.ModelAdmin):
+class TeamAdmin(IndexedSearchAdmin):
     list_display = ('name', 'description', 'created_at')
     search_fields = ('name',)
+    search_kind = 'team'
 
 
 @admin.register(Activity)
-class ActivityAdmin(admin.ModelAdmin):
+class ActivityAdmin(IndexedSearchAdmin):
     list_display = ('user', 'activity_type', 'duration', 'date')
     list_filter = ('activity_type',)
     search_fields = ('user__name',)
+    search_kind = 'user'
+    search_lookup = 'user_id'
 
 
 @admin.register(Leaderboard)
@@ -29,7 +50,8 @@ class LeaderboardAdmin(admin.ModelAdmin):
 
 
 @admin.register(Workout)
-class WorkoutAdmin(admin.ModelAdmin):
+class WorkoutAdmin(IndexedSearchAdmin):
     list_display = ('name', 'difficulty')
     list_filter = ('difficulty',)
     search_fields = ('name',)
+    search_kind = 'workout'
@@ -0,0 +1,16 @@
+from django.apps import AppConfig
+
+
+class OctofitTrackerConfig(AppConfig):
+    name = 'octofit_tracker'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from pymongo import monitoring
+
+        from . import signals  # noqa: F401
+        from .instrumentation import MongoCommandListener, install_execute_wrapper
+
+        # Registered before djongo opens its client, which picks it up.
+        monitoring.register(MongoCommandListener())
+        connection_created.connect(install_execute_wrapper)
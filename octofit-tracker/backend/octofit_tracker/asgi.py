@@ -2,6 +2,10 @@
 ASGI config for octofit_tracker project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server (e.g. ``uvicorn octofit_tracker.asgi:application``)
+to get the non-blocking read endpoints under ``/api/async/``; the DRF views
+keep running in a thread per request. The live leaderboard streams
+(``live.py``) are served in front of Django.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
@@ -13,4 +17,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'octofit_tracker.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once the app registry is ready.
+from octofit_tracker import live  # noqa: E402
+
+application = live.route(django_application)
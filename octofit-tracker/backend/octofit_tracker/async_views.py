@@ -0,0 +1,105 @@
+"""
+Async read endpoints for ASGI deployments.
+
+The DRF viewsets are synchronous: under ``asgi.py`` Django runs each of
+them in a worker thread, which stays blocked while Mongo answers. The
+views here are native coroutines that read through the Motor client
+(``mongo.get_async_database``), so a request waiting on Mongo or on a slow
+client costs one suspended task instead of a thread. They render with DRF's
+``JSONRenderer`` and so return the same JSON bytes as their synchronous
+counterparts:
+
+* ``/api/async/leaderboard/`` – ``/api/leaderboard/``
+* ``/api/async/activities/`` – ``/api/activities/``, with the same filters
+* ``/api/async/teams/summary/`` – ``/api/teams/summary/``
+
+They are read-only and uncached. Under WSGI they still work, but each call
+runs its own event loop and gains nothing.
+"""
+from django.http import HttpResponse
+from django.views import View
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from . import export, filters, repository, stats
+from .fast_serializers import ActivityLeanSerializer, LeaderboardLeanSerializer
+from .models import Activity, Leaderboard
+from .pagination import KeysetPagination
+from .serializers import selected_fields
+
+
+def _json(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), content_type=JSONRenderer.media_type, status=status)
+
+
+def _error(exc):
+    detail = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    return _json(detail, status=exc.status_code)
+
+
+class AsyncLeanListView(View):
+    """
+    Keyset-paginated list of ``model`` rendered by ``lean_serializer_class``.
+    Subclasses narrow the Mongo query with ``get_query``.
+    """
+    http_method_names = ['get', 'head', 'options']
+    model = None
+    lean_serializer_class = None
+    keyset_ordering = ('id',)
+    pagination_class = KeysetPagination
+
+    async def get_query(self, request):
+        return {}
+
+    async def get(self, request, *args, **kwargs):
+        self.request = request = Request(request)
+        try:
+            return _json(await self.list(request))
+        except APIException as exc:
+            return _error(exc)
+
+    async def list(self, request):
+        model, lean = self.model, self.lean_serializer_class
+        query = await self.get_query(request)
+        paginator = self.pagination_class()
+        fields = selected_fields(request.query_params, lean.field_names())
+        # Pagination reads the keyset ordering columns off the rows.
+        columns = tuple(dict.fromkeys((
+            *lean.columns_for(fields),
+            *(model._meta.get_field(name.lstrip('-')).attname for name in paginator.get_ordering(self)),
+        )))
+
+        async def find(seek, sort, limit):
+            return await repository.afind_rows(model, columns, {'$and': [query, seek]}, sort, limit)
+
+        page = await paginator.apaginate_documents(model, find, request, view=self)
+        if page is not None:
+            return paginator.get_paginated_data(await lean.aserialize(page, fields))
+        sort = repository.sort(model, self.keyset_ordering)
+        return await lean.aserialize(await repository.afind_rows(model, columns, query, sort), fields)
+
+
+class LeaderboardView(AsyncLeanListView):
+    model = Leaderboard
+    lean_serializer_class = LeaderboardLeanSerializer
+    keyset_ordering = ('rank', 'id')
+
+
+class ActivityListView(AsyncLeanListView):
+    model = Activity
+    lean_serializer_class = ActivityLeanSerializer
+    keyset_ordering = ('-date', '-id')
+
+    def get_keyset_ordering(self):
+        return filters.activity_ordering(self.request.query_params, self.keyset_ordering)
+
+    async def get_query(self, request):
+        return await export.aactivity_query(**filters.activity_filters(request.query_params))
+
+
+class TeamSummaryView(View):
+    http_method_names = ['get', 'head', 'options']
+
+    async def get(self, request, *args, **kwargs):
+        return _json(await stats.ateam_summary())
@@ -0,0 +1,123 @@
+"""
+Response caching for read-heavy endpoints.
+
+Each cached resource (``leaderboard``, ``rollups``, ``teams``,
+``workouts``) has a version stamp in Django's cache: the ``time_ns()`` of
+its last write. Cached responses are keyed by that version, so bumping it
+on a write invalidates every cached page of the resource at once without
+enumerating keys. ``rollups`` covers the day/week/month leaderboards,
+which activity writes change without moving the all-time ranks.
+
+Conditional GETs are validated by the ``ETag`` derived from the stamp.
+``Last-Modified`` is sent for information only: at one-second granularity
+it cannot tell apart two writes in the same second, so ``If-Modified-Since``
+alone never earns a 304.
+
+ORM writes bump versions through the model signals in ``signals.py``;
+code that writes with pymongo directly calls ``invalidate`` itself.
+"""
+import hashlib
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+RESOURCES = ('leaderboard', 'rollups', 'teams', 'workouts')
+
+_PREFIX = 'octofit:cache'
+
+
+def _timeout():
+    return getattr(settings, 'OCTOFIT_RESPONSE_CACHE_TIMEOUT', 300)
+
+
+def get_version(resource):
+    key = f'{_PREFIX}:version:{resource}'
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate(*resources):
+    """Mark every cached response of ``resources`` as stale."""
+    now = time.time_ns()
+    cache.set_many({f'{_PREFIX}:version:{resource}': now for resource in resources}, timeout=None)
+
+
+def _count(resource, outcome):
+    key = f'{_PREFIX}:stats:{resource}:{outcome}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+
+def get_stats():
+    """Return ``{resource: {'hits', 'misses', 'not_modified'}}`` counters."""
+    outcomes = ('hits', 'misses', 'not_modified')
+    keys = [f'{_PREFIX}:stats:{r}:{o}' for r in RESOURCES for o in outcomes]
+    values = cache.get_many(keys)
+    return {
+        resource: {outcome: values.get(f'{_PREFIX}:stats:{resource}:{outcome}', 0) for outcome in outcomes}
+        for resource in RESOURCES
+    }
+
+
+class CachedResponseMixin:
+    """
+    Serve ``list`` and ``retrieve`` from the cache, with an ETag validator,
+    for viewsets that set ``cache_resource`` (or ``get_cache_resource()``
+    when it depends on the request).
+    """
+    cache_resource = None
+
+    def get_cache_resource(self, request):
+        return self.cache_resource
+
+    def list(self, request, *args, **kwargs):
+        return self._cached(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached(request, super().retrieve, *args, **kwargs)
+
+    def _cached(self, request, handler, *args, **kwargs):
+        resource = self.get_cache_resource(request)
+        if resource is None:
+            return handler(request, *args, **kwargs)
+
+        version = get_version(resource)
+        digest = hashlib.md5(
+            f'{resource}:{version}:{request.accepted_media_type}:{request.build_absolute_uri()}'.encode()
+        ).hexdigest()
+        etag = f'"{digest}"'
+
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            _count(resource, 'not_modified')
+            return not_modified
+
+        key = f'{_PREFIX}:response:{digest}'
+        data = cache.get(key)
+        if data is None:
+            _count(resource, 'misses')
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            cache.set(key, response.data, timeout=_timeout())
+            response['X-Cache'] = 'MISS'
+        else:
+            _count(resource, 'hits')
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+        response['ETag'] = etag
+        # Rounded up, so it is never earlier than the write it stands for.
+        response['Last-Modified'] = http_date(math.ceil(version / 1_000_000_000))
+        response['Cache-Control'] = 'no-cache'
+        return response
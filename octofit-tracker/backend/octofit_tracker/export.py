@@ -0,0 +1,136 @@
+"""
+Streaming activity export.
+
+Rows are read from a server-side pymongo cursor in ``batch_size`` chunks
+and encoded one chunk at a time, so a worker only ever holds one batch of
+documents plus the user-name lookup, however many rows are exported. Rows
+have the same fields and formatting as ``ActivitySerializer``.
+"""
+import csv
+import json
+from datetime import timezone as dt_timezone
+
+from .models import Activity, User
+from .mongo import get_async_database, get_collection
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+FIELDS = ['id', 'user', 'user_name', 'activity_type', 'duration', 'date', 'notes']
+DEFAULT_BATCH_SIZE = 2000
+# Bound on the user-name lookup kept while streaming.
+MAX_CACHED_USERS = 100000
+
+
+def activity_query(user=None, team=None, date_after=None, date_before=None, activity_type=None):
+    """Build the Mongo filter for an export."""
+    members = None
+    if team is not None:
+        members = [member['id'] for member in get_collection(User).find({'team_id': team}, {'id': True, '_id': False})]
+    return _activity_query(user, members, date_after, date_before, activity_type)
+
+
+async def aactivity_query(user=None, team=None, date_after=None, date_before=None, activity_type=None):
+    """``activity_query`` resolving team members through the Motor client."""
+    members = None
+    if team is not None:
+        cursor = get_async_database()[User._meta.db_table].find({'team_id': team}, {'id': True, '_id': False})
+        members = [member['id'] for member in await cursor.to_list(length=None)]
+    return _activity_query(user, members, date_after, date_before, activity_type)
+
+
+def _activity_query(user, member_ids, date_after, date_before, activity_type):
+    query = {}
+    if activity_type is not None:
+        query['activity_type'] = activity_type
+    if user is not None:
+        query['user_id'] = user
+    if member_ids is not None:
+        if user is not None:
+            member_ids = [user] if user in member_ids else []
+        query['user_id'] = {'$in': member_ids}
+    bounds = {}
+    if date_after is not None:
+        bounds['$gte'] = date_after
+    if date_before is not None:
+        bounds['$lte'] = date_before
+    if bounds:
+        query['date'] = bounds
+    return query
+
+
+def _format_date(value):
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=dt_timezone.utc)
+    value = value.astimezone(dt_timezone.utc).isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+def iter_rows(query, batch_size=DEFAULT_BATCH_SIZE):
+    """Yield lists of row dicts, one list per cursor batch."""
+    projection = {'_id': False, 'id': True, 'user_id': True, 'activity_type': True,
+                  'duration': True, 'date': True, 'notes': True}
+    cursor = get_collection(Activity).find(query, projection, batch_size=batch_size)
+    names = {}
+    batch = []
+    try:
+        for document in cursor:
+            batch.append(document)
+            if len(batch) >= batch_size:
+                yield _rows(batch, names)
+                batch = []
+        if batch:
+            yield _rows(batch, names)
+    finally:
+        cursor.close()
+
+
+def _rows(documents, names):
+    missing = {document['user_id'] for document in documents} - names.keys()
+    if missing:
+        if len(names) + len(missing) > MAX_CACHED_USERS:
+            names.clear()
+        names.update(
+            (user['id'], user['name'])
+            for user in get_collection(User).find(
+                {'id': {'$in': list(missing)}}, {'_id': False, 'id': True, 'name': True}
+            )
+        )
+    return [
+        {
+            'id': str(document['id']),
+            'user': document['user_id'],
+            'user_name': names.get(document['user_id']),
+            'activity_type': document['activity_type'],
+            'duration': document['duration'],
+            'date': _format_date(document.get('date')),
+            'notes': document.get('notes', ''),
+        }
+        for document in documents
+    ]
+
+
+def stream_ndjson(query, batch_size=DEFAULT_BATCH_SIZE):
+    for rows in iter_rows(query, batch_size):
+        yield ''.join(json.dumps(row, separators=(',', ':'), ensure_ascii=False) + '\n' for row in rows)
+
+
+class _Echo:
+    """File-like object whose ``write`` returns the value for streaming."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(query, batch_size=DEFAULT_BATCH_SIZE):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(FIELDS)
+    for rows in iter_rows(query, batch_size):
+        yield ''.join(writer.writerow([row[field] for field in FIELDS]) for row in rows)
+
+
+def stream(output, query, batch_size=DEFAULT_BATCH_SIZE):
+    return {'ndjson': stream_ndjson, 'csv': stream_csv}[output](query, batch_size)
@@ -0,0 +1,336 @@
+"""
+Read-only serializers for list endpoints.
+
+They take ``QuerySet.values()`` rows instead of model instances and build
+each output dict with plain per-field accessors, skipping DRF's field
+machinery and model instantiation. Related names are resolved with one
+batched lookup per page. The output is identical to the matching
+ModelSerializer in ``serializers.py``; the tests compare them row by row.
+"""
+from django.conf import settings
+from django.http import Http404
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from . import repository
+from .instrumentation import timed
+from .models import Team, User
+from .serializers import selected_fields
+
+
+def _datetime_formatter():
+    """
+    Return a function formatting datetimes exactly like DRF's
+    ``DateTimeField``, with the current timezone resolved once per page
+    instead of once per value.
+    """
+    if not settings.USE_TZ or api_settings.DATETIME_FORMAT.lower() != ISO_8601:
+        return serializers.DateTimeField().to_representation
+    tz = timezone.get_current_timezone()
+
+    def format_datetime(value):
+        if not value:
+            return None
+        value = timezone.make_aware(value, tz) if timezone.is_naive(value) else value.astimezone(tz)
+        value = value.isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return format_datetime
+
+
+class LeanSerializer:
+    """
+    Base class. ``columns`` are projected with ``.values()``, ``load``
+    fetches the related-name maps a page needs and ``render`` builds the
+    output dicts from rows and maps, with the ``{field: function(row)}``
+    table each subclass returns from ``getters(related)``.
+
+    ``outputs`` maps every output field, in output order, to the columns it
+    reads and the related maps it needs. With a field selection only those
+    columns are projected, only those maps loaded and only those getters
+    called.
+    """
+    columns = ()
+    outputs = {}
+
+    @classmethod
+    def field_names(cls):
+        return list(cls.outputs)
+
+    @classmethod
+    def columns_for(cls, fields=None):
+        if fields is None:
+            return cls.columns
+        needed = {column for name in fields for column in cls.outputs[name][0]}
+        return tuple(column for column in cls.columns if column in needed)
+
+    @classmethod
+    def lookups_for(cls, fields=None):
+        if fields is None:
+            return None
+        return {lookup for name in fields for lookup in cls.outputs[name][1]}
+
+    @classmethod
+    def project(cls, queryset, columns=None):
+        return queryset.prefetch_related(None).values(*(columns or cls.columns))
+
+    @classmethod
+    def load(cls, rows, lookups=None):
+        """Related maps for ``rows``; ``lookups`` narrows which (default: all)."""
+        return {}
+
+    @classmethod
+    async def aload(cls, rows, lookups=None):
+        """``load`` through the Motor client, for async views."""
+        return {}
+
+    @classmethod
+    def render(cls, rows, related, fields=None):
+        getters = cls.getters(related)
+        chosen = [(name, getters[name]) for name in (cls.outputs if fields is None else fields)]
+        return [{name: get(row) for name, get in chosen} for row in rows]
+
+    @classmethod
+    def serialize(cls, rows, fields=None):
+        related = cls.load(rows, cls.lookups_for(fields))
+        with timed('serialize'):
+            return cls.render(rows, related, fields)
+
+    @classmethod
+    async def aserialize(cls, rows, fields=None):
+        related = await cls.aload(rows, cls.lookups_for(fields))
+        with timed('serialize'):
+            return cls.render(rows, related, fields)
+
+
+def _wants(lookups, name):
+    return lookups is None or name in lookups
+
+
+def _name(names, pk):
+    return names[pk][0] if pk in names else None
+
+
+class UserLeanSerializer(LeanSerializer):
+    columns = ('id', 'name', 'email', 'team_id', 'avatar', 'fitness_level', 'created_at')
+    outputs = {
+        'id': (('id',), ()),
+        'name': (('name',), ()),
+        'email': (('email',), ()),
+        'team': (('team_id',), ()),
+        'team_name': (('team_id',), ('teams',)),
+        'avatar': (('avatar',), ()),
+        'fitness_level': (('fitness_level',), ()),
+        'created_at': (('created_at',), ()),
+    }
+
+    @classmethod
+    def load(cls, rows, lookups=None):
+        if not _wants(lookups, 'teams'):
+            return {}
+        return {'teams': repository.names(Team, {row['team_id'] for row in rows})}
+
+    @classmethod
+    async def aload(cls, rows, lookups=None):
+        if not _wants(lookups, 'teams'):
+            return {}
+        return {'teams': await repository.anames(Team, {row['team_id'] for row in rows})}
+
+    @classmethod
+    def getters(cls, related):
+        teams = related.get('teams')
+        format_datetime = _datetime_formatter()
+        return {
+            'id': lambda row: str(row['id']),
+            'name': lambda row: row['name'],
+            'email': lambda row: row['email'],
+            'team': lambda row: row['team_id'],
+            'team_name': lambda row: _name(teams, row['team_id']),
+            'avatar': lambda row: row['avatar'],
+            'fitness_level': lambda row: row['fitness_level'],
+            'created_at': lambda row: format_datetime(row['created_at']),
+        }
+
+
+class ActivityLeanSerializer(LeanSerializer):
+    columns = ('id', 'user_id', 'activity_type', 'duration', 'date', 'notes')
+    outputs = {
+        'id': (('id',), ()),
+        'user': (('user_id',), ()),
+        'user_name': (('user_id',), ('users',)),
+        'activity_type': (('activity_type',), ()),
+        'duration': (('duration',), ()),
+        'date': (('date',), ()),
+        'notes': (('notes',), ()),
+    }
+
+    @classmethod
+    def load(cls, rows, lookups=None):
+        if not _wants(lookups, 'users'):
+            return {}
+        return {'users': repository.names(User, {row['user_id'] for row in rows})}
+
+    @classmethod
+    async def aload(cls, rows, lookups=None):
+        if not _wants(lookups, 'users'):
+            return {}
+        return {'users': await repository.anames(User, {row['user_id'] for row in rows})}
+
+    @classmethod
+    def getters(cls, related):
+        users = related.get('users')
+        format_datetime = _datetime_formatter()
+        return {
+            'id': lambda row: str(row['id']),
+            'user': lambda row: row['user_id'],
+            'user_name': lambda row: _name(users, row['user_id']),
+            'activity_type': lambda row: row['activity_type'],
+            'duration': lambda row: float(row['duration']),
+            'date': lambda row: format_datetime(row['date']),
+            'notes': lambda row: row['notes'],
+        }
+
+
+class LeaderboardLeanSerializer(LeanSerializer):
+    columns = ('id', 'user_id', 'score', 'rank')
+    outputs = {
+        'id': (('id',), ()),
+        'user': (('user_id',), ()),
+        'user_name': (('user_id',), ('users',)),
+        'team_name': (('user_id',), ('users', 'teams')),
+        'score': (('score',), ()),
+        'rank': (('rank',), ()),
+    }
+
+    @classmethod
+    def load(cls, rows, lookups=None):
+        if not _wants(lookups, 'users'):
+            return {}
+        users = repository.names(User, {row['user_id'] for row in rows}, 'team_id')
+        if not _wants(lookups, 'teams'):
+            return {'users': users}
+        return {'users': users, 'teams': repository.names(Team, {team_id for _, team_id in users.values()})}
+
+    @classmethod
+    async def aload(cls, rows, lookups=None):
+        if not _wants(lookups, 'users'):
+            return {}
+        users = await repository.anames(User, {row['user_id'] for row in rows}, 'team_id')
+        if not _wants(lookups, 'teams'):
+            return {'users': users}
+        return {'users': users, 'teams': await repository.anames(Team, {team_id for _, team_id in users.values()})}
+
+    @classmethod
+    def getters(cls, related):
+        users, teams = related.get('users'), related.get('teams')
+        return {
+            'id': lambda row: str(row['id']),
+            'user': lambda row: row['user_id'],
+            'user_name': lambda row: users.get(row['user_id'], (None, None))[0],
+            'team_name': lambda row: _name(teams, users.get(row['user_id'], (None, None))[1]),
+            'score': lambda row: float(row['score']),
+            'rank': lambda row: int(row['rank']),
+        }
+
+
+class WindowedLeaderboardLeanSerializer(LeaderboardLeanSerializer):
+    """Entries of ``leaderboard.windowed``, which have no row id."""
+    columns = ('user_id', 'score', 'count', 'rank')
+    outputs = {
+        'user': (('user_id',), ()),
+        'user_name': (('user_id',), ('users',)),
+        'team_name': (('user_id',), ('users', 'teams')),
+        'score': (('score',), ()),
+        'count': (('count',), ()),
+        'rank': (('rank',), ()),
+    }
+
+    @classmethod
+    def getters(cls, related):
+        return {**super().getters(related), 'count': lambda row: int(row['count'])}
+
+
+class LeanListMixin:
+    """
+    Serve ``list`` through ``lean_serializer_class`` when the viewset sets
+    one; other actions keep the regular serializer. With the native data
+    backend ``list`` and ``retrieve`` read the collection with pymongo;
+    filter backends take part through a ``filter_documents`` method.
+    ``?fields=``/``?exclude=`` narrow the columns read and the related
+    names looked up, not just the output.
+    """
+    lean_serializer_class = None
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method in SAFE_METHODS and (
+            self.request.query_params.get('fields') or self.request.query_params.get('exclude')
+        ):
+            # The serializer loads only the relations its selected fields need.
+            queryset = queryset.prefetch_related(None)
+        return queryset
+
+    def _lean_fields(self, request, lean):
+        return selected_fields(request.query_params, lean.field_names())
+
+    def _lean_columns(self, lean, fields):
+        """Columns to read for ``fields``, plus the keyset ordering columns pagination needs."""
+        model = self.queryset.model
+        ordering = getattr(self.paginator, 'get_ordering', lambda view: ())(self)
+        extra = [model._meta.get_field(name.lstrip('-')).attname for name in ordering]
+        return tuple(dict.fromkeys((*lean.columns_for(fields), *extra)))
+
+    def list(self, request, *args, **kwargs):
+        lean = self.lean_serializer_class
+        if lean is None:
+            return super().list(request, *args, **kwargs)
+        fields = self._lean_fields(request, lean)
+        if repository.native_enabled():
+            return self._native_list(request, lean, fields)
+        rows = lean.project(self.filter_queryset(self.get_queryset()), self._lean_columns(lean, fields))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(lean.serialize(page, fields))
+        return Response(lean.serialize(list(rows), fields))
+
+    def retrieve(self, request, *args, **kwargs):
+        lean = self.lean_serializer_class
+        if lean is None or not repository.native_enabled():
+            return super().retrieve(request, *args, **kwargs)
+        fields = self._lean_fields(request, lean)
+        try:
+            pk = int(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        except ValueError:
+            raise Http404
+        row = repository.find_row(
+            self.queryset.model, lean.columns_for(fields), {**self.filter_documents(request), 'id': pk},
+        )
+        if row is None:
+            raise Http404
+        return Response(lean.serialize([row], fields)[0])
+
+    def filter_documents(self, request):
+        query = {}
+        for backend in self.filter_backends:
+            backend = backend()
+            if hasattr(backend, 'filter_documents'):
+                query = backend.filter_documents(request, query, self)
+        return query
+
+    def _native_list(self, request, lean, fields):
+        model = self.queryset.model
+        query = self.filter_documents(request)
+        columns = self._lean_columns(lean, fields)
+
+        def find(seek, sort, limit):
+            return repository.find_rows(model, columns, {'$and': [query, seek]}, sort, limit)
+
+        paginate = getattr(self.paginator, 'paginate_documents', None)
+        if paginate is not None:
+            page = paginate(model, find, request, view=self)
+            if page is not None:
+                return self.get_paginated_response(lean.serialize(page, fields))
+        sort = repository.sort(model, getattr(self, 'keyset_ordering', ('id',)))
+        return Response(lean.serialize(repository.find_rows(model, columns, query, sort), fields))
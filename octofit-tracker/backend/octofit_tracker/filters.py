@@ -0,0 +1,89 @@
+"""Query-parameter filtering for the activity endpoints."""
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from .export import activity_query
+from .models import Activity, User
+from .stats import parse_date_bound
+
+ACTIVITY_TYPES = [value for value, _ in Activity.ACTIVITY_TYPES]
+
+# ?ordering= values and the keyset order each maps to. Only orderings served
+# by an index are offered; (-date, -id) is walked in either direction.
+ACTIVITY_ORDERINGS = {
+    '-date': ('-date', '-id'),
+    'date': ('date', 'id'),
+}
+
+
+def int_param(query_params, name):
+    value = query_params.get(name)
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError({name: 'A valid integer is required.'})
+
+
+def date_bounds(query_params):
+    """Parse ``date_after``/``date_before`` into ``{name: datetime}``."""
+    bounds = {}
+    for name, end in (('date_after', False), ('date_before', True)):
+        value = query_params.get(name)
+        if value:
+            try:
+                bounds[name] = parse_date_bound(value, end=end)
+            except ValueError:
+                raise ValidationError({name: 'Enter a valid date or datetime.'})
+    return bounds
+
+
+def activity_ordering(query_params, default):
+    value = query_params.get('ordering')
+    if not value:
+        return default
+    try:
+        return ACTIVITY_ORDERINGS[value]
+    except KeyError:
+        raise ValidationError({'ordering': f'Must be one of: {", ".join(ACTIVITY_ORDERINGS)}.'})
+
+
+def activity_filters(query_params):
+    """Parse the activity filters into ``activity_query`` keyword arguments."""
+    filters = {'user': int_param(query_params, 'user'), 'team': int_param(query_params, 'team')}
+    activity_type = query_params.get('activity_type')
+    if activity_type:
+        if activity_type not in ACTIVITY_TYPES:
+            raise ValidationError({'activity_type': f'Must be one of: {", ".join(ACTIVITY_TYPES)}.'})
+        filters['activity_type'] = activity_type
+    filters.update(date_bounds(query_params))
+    return filters
+
+
+class ActivityFilterBackend(BaseFilterBackend):
+    """
+    ``?user=``, ``?team=``, ``?activity_type=`` and
+    ``?date_after=``/``?date_before=`` as ORM filters, which djongo turns
+    into a Mongo ``find`` served by the activity indexes. ``team`` is
+    resolved to its member ids first so no join is needed.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        filters = activity_filters(request.query_params)
+        if filters['user'] is not None:
+            queryset = queryset.filter(user_id=filters['user'])
+        if filters['team'] is not None:
+            members = list(User.objects.filter(team_id=filters['team']).values_list('id', flat=True))
+            queryset = queryset.filter(user_id__in=members)
+        if 'activity_type' in filters:
+            queryset = queryset.filter(activity_type=filters['activity_type'])
+        if 'date_after' in filters:
+            queryset = queryset.filter(date__gte=filters['date_after'])
+        if 'date_before' in filters:
+            queryset = queryset.filter(date__lte=filters['date_before'])
+        return queryset
+
+    def filter_documents(self, request, query, view):
+        """The same filters as a Mongo query, for the native data backend."""
+        return {**query, **activity_query(**activity_filters(request.query_params))}
@@ -0,0 +1,89 @@
+"""
+Bulk activity ingestion for device syncs.
+
+Validated activities are written with a single ``insert_many``. An item
+that carries a client ``dedupe_key`` is stored under the ``_id``
+``"<user_id>:<dedupe_key>"``, so Mongo's always-present unique ``_id`` index
+rejects a retried upload atomically, even when two retries race, and the
+leaderboard and rollups are only credited for rows that were actually
+inserted. That holds when another write error aborts the request too: the
+rows Mongo did insert are credited before the error is raised.
+"""
+from collections import defaultdict
+
+from pymongo.errors import BulkWriteError
+
+from . import leaderboard, rollups, tasks
+from .models import Activity
+from .mongo import get_collection, reserve_ids
+
+DUPLICATE_KEY = 11000
+
+
+def dedupe_id(user_id, dedupe_key):
+    return f'{user_id}:{dedupe_key}'
+
+
+def insert_activities(items):
+    """
+    Insert ``(validated_data, dedupe_key)`` pairs and return one
+    ``(status, activity_id)`` tuple per item, where status is ``created`` or
+    ``duplicate``. Duplicates report the id of the row stored first.
+    """
+    if not items:
+        return []
+    first_id = reserve_ids(Activity, len(items))
+    documents = []
+    for offset, (data, dedupe_key) in enumerate(items):
+        document = {
+            'id': first_id + offset,
+            'user_id': data['user'].pk,
+            'activity_type': data['activity_type'],
+            'duration': data['duration'],
+            'date': data['date'],
+            'notes': data.get('notes', ''),
+        }
+        if dedupe_key is not None:
+            document['_id'] = dedupe_id(document['user_id'], dedupe_key)
+        documents.append(document)
+
+    rejected, failure = set(), None
+    try:
+        get_collection(Activity).insert_many(documents, ordered=False)
+    except BulkWriteError as exc:
+        for error in exc.details['writeErrors']:
+            rejected.add(error['index'])
+            if error['code'] != DUPLICATE_KEY:
+                failure = exc
+    inserted = [document for index, document in enumerate(documents) if index not in rejected]
+    if failure is not None:
+        _credit(inserted)
+        raise failure
+
+    existing = {}
+    if rejected:
+        cursor = get_collection(Activity).find(
+            {'_id': {'$in': [documents[index]['_id'] for index in rejected]}},
+            {'id': True},
+        )
+        existing = {document['_id']: document['id'] for document in cursor}
+
+    results = []
+    for index, document in enumerate(documents):
+        if index in rejected:
+            results.append(('duplicate', existing.get(document['_id'])))
+        else:
+            results.append(('created', document['id']))
+    _credit(inserted)
+    return results
+
+
+def _credit(inserted):
+    """Bring the leaderboard, rollups and profiles up to date with ``inserted``."""
+    credited = defaultdict(float)
+    for document in inserted:
+        credited[document['user_id']] += document['duration']
+    for user_id, duration in credited.items():
+        leaderboard.apply_score_delta(user_id, duration)
+    rollups.activities_inserted(inserted)
+    tasks.users_changed(*credited)
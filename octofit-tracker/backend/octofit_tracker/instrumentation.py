@@ -0,0 +1,308 @@
+"""
+Per-request performance instrumentation.
+
+``PerformanceMiddleware`` breaks a sampled request down into:
+
+* ``db`` – time in Django cursors (djongo's SQL translation plus Mongo),
+  and the number of queries;
+* ``mongo`` – time Mongo itself spent on commands, from a pymongo command
+  listener, which also covers the pymongo code paths that bypass the ORM;
+* ``serialize`` – time in serializers, recorded with ``timed('serialize')``;
+* ``render`` – time in ``response.render()``, which ends before outer
+  middleware such as ``CompressionMiddleware`` touch the body;
+* response bytes and total time.
+
+The breakdown goes out as a ``Server-Timing`` header and a JSON log line on
+the ``octofit_tracker.performance`` logger (INFO, or WARNING for requests
+slower than ``OCTOFIT_SLOW_REQUEST_MS``), and is aggregated into histograms
+served by ``metrics`` in the Prometheus text format, next to the counters
+of the shared Mongo connection pool. Only a fraction
+``OCTOFIT_METRICS_SAMPLE_RATE`` of requests is instrumented; the rest pay
+for one counter increment. Histograms live in process memory, so each
+worker process exposes its own.
+
+The request being measured is found through a context variable, which
+``sync_to_async`` carries into its executor thread. Every database
+connection gets ``execute_wrapper`` when it opens (``apps.py``), so the
+queries of sync views that ASGI runs in that thread count as well. Motor
+runs its commands on its own executor without the caller's context, so the
+``mongo`` time of async views is not recorded.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.deprecation import MiddlewareMixin
+from pymongo import monitoring
+
+from .mongo import pool_stats
+
+logger = logging.getLogger('octofit_tracker.performance')
+
+_current = ContextVar('octofit_request_metrics', default=None)
+
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+BYTES_BUCKETS = (1024, 10240, 102400, 1048576, 10485760)
+
+
+class RequestMetrics:
+    """Timings collected while one sampled request is handled."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.mongo = 0.0
+        self.phases = {}
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    """Time a query for the request being measured, in whichever thread runs it."""
+    record = _current.get()
+    if record is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        record.db += time.perf_counter() - started
+        record.queries += 1
+
+
+def install_execute_wrapper(sender, connection, **kwargs):
+    """``connection_created`` receiver that adds ``execute_wrapper`` once."""
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(execute_wrapper)
+
+
+@contextmanager
+def timed(phase):
+    """Add the time spent in the block to ``phase`` of the current request."""
+    record = _current.get()
+    if record is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record.add(phase, time.perf_counter() - started)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Credit Mongo command durations to the request that issued them."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        record = _current.get()
+        if record is not None:
+            record.mongo += event.duration_micros / 1e6
+
+    def failed(self, event):
+        self.succeeded(event)
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        counts, total = self.series.get(labels) or ([0] * (len(self.buckets) + 1), 0.0)
+        counts[bisect_left(self.buckets, value)] += 1
+        self.series[labels] = (counts, total + value)
+
+    def exposition(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_labels(labels, le=bound)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(labels)} {total}')
+            lines.append(f'{self.name}_count{_labels(labels)} {cumulative}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.series = {}
+
+    def inc(self, labels):
+        self.series[labels] = self.series.get(labels, 0) + 1
+
+    def exposition(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        lines.extend(f'{self.name}{_labels(labels)} {value}' for labels, value in sorted(self.series.items()))
+        return lines
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}'
+
+
+_lock = threading.Lock()
+REQUESTS = Counter('octofit_http_requests_total', 'Requests handled, sampled or not.')
+HISTOGRAMS = {
+    'total': Histogram('octofit_request_duration_seconds', 'Time to handle a request.', DURATION_BUCKETS),
+    'db': Histogram('octofit_db_duration_seconds', 'Time in database cursors per request.', DURATION_BUCKETS),
+    'mongo': Histogram('octofit_mongo_duration_seconds', 'Time in Mongo commands per request.', DURATION_BUCKETS),
+    'serialize': Histogram('octofit_serialize_duration_seconds', 'Time serializing per request.', DURATION_BUCKETS),
+    'render': Histogram('octofit_render_duration_seconds', 'Time rendering per request.', DURATION_BUCKETS),
+    'queries': Histogram('octofit_db_queries', 'Database queries per request.', QUERY_BUCKETS),
+    'bytes': Histogram('octofit_response_bytes', 'Response body size.', BYTES_BUCKETS),
+}
+
+
+# Shared Mongo connection pool: (metric, type, pool_stats key, help).
+POOL_METRICS = (
+    ('octofit_mongo_pool_open_connections', 'gauge', 'open_connections', 'Open pooled connections.'),
+    ('octofit_mongo_pool_checked_out', 'gauge', 'checked_out', 'Connections currently in use.'),
+    ('octofit_mongo_pool_checkouts_total', 'counter', 'checkouts', 'Connection check-outs.'),
+    ('octofit_mongo_pool_checkout_failures_total', 'counter', 'checkout_failures',
+     'Check-outs that failed or timed out waiting.'),
+    ('octofit_mongo_pool_wait_seconds_total', 'counter', 'wait_seconds_total', 'Time spent waiting for a connection.'),
+    ('octofit_mongo_pool_wait_seconds_max', 'gauge', 'wait_seconds_max', 'Longest wait for a connection.'),
+)
+
+
+def exposition():
+    with _lock:
+        lines = REQUESTS.exposition()
+        for histogram in HISTOGRAMS.values():
+            lines.extend(histogram.exposition())
+    stats = pool_stats()
+    for name, kind, key, documentation in POOL_METRICS:
+        lines.extend([f'# HELP {name} {documentation}', f'# TYPE {name} {kind}', f'{name} {stats[key]}'])
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    with _lock:
+        REQUESTS.series.clear()
+        for histogram in HISTOGRAMS.values():
+            histogram.series.clear()
+
+
+def metrics(request):
+    """Aggregated request histograms in the Prometheus text format."""
+    return HttpResponse(exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class PerformanceMiddleware(MiddlewareMixin):
+    """Sync and async capable, so ASGI requests do not detour through a thread."""
+
+    def __call__(self, request):
+        if self._is_coroutine:
+            return self.__acall__(request)
+        if not self._sampled(request):
+            response = self.get_response(request)
+            self._count(request, response)
+            return response
+
+        record = RequestMetrics()
+        started = time.perf_counter()
+        with self._instrumented(record):
+            response = self.get_response(request)
+        self._finish(request, response, record, started)
+        return response
+
+    async def __acall__(self, request):
+        if not self._sampled(request):
+            response = await self.get_response(request)
+            self._count(request, response)
+            return response
+
+        record = RequestMetrics()
+        started = time.perf_counter()
+        with self._instrumented(record):
+            response = await self.get_response(request)
+        self._finish(request, response, record, started)
+        return response
+
+    @staticmethod
+    def _sampled(request):
+        return request.path_info != '/metrics' and random.random() < settings.OCTOFIT_METRICS_SAMPLE_RATE
+
+    @staticmethod
+    @contextmanager
+    def _instrumented(record):
+        token = _current.set(record)
+        try:
+            yield
+        finally:
+            _current.reset(token)
+
+    def _finish(self, request, response, record, started):
+        self._count(request, response)
+        self._record(request, response, record, time.perf_counter() - started)
+
+    def process_template_response(self, request, response):
+        # Called after the view and before ``response.render()``.
+        record = _current.get()
+        if record is not None:
+            started = time.perf_counter()
+            response.add_post_render_callback(lambda rendered: record.add('render', time.perf_counter() - started))
+        return response
+
+    @staticmethod
+    def _view(request):
+        match = getattr(request, 'resolver_match', None)
+        return (match.view_name or match.url_name or 'unnamed') if match else 'unmatched'
+
+    def _count(self, request, response):
+        with _lock:
+            REQUESTS.inc((('view', self._view(request)), ('method', request.method),
+                          ('status', response.status_code)))
+
+    def _record(self, request, response, record, total):
+        size = None if response.streaming else len(response.content)
+        values = {
+            'total': total,
+            'db': record.db,
+            'mongo': record.mongo,
+            'serialize': record.phases.get('serialize', 0.0),
+            'render': record.phases.get('render', 0.0),
+        }
+        labels = (('view', self._view(request)), ('method', request.method))
+        with _lock:
+            for name, seconds in values.items():
+                HISTOGRAMS[name].observe(labels, seconds)
+            HISTOGRAMS['queries'].observe(labels, record.queries)
+            if size is not None:
+                HISTOGRAMS['bytes'].observe(labels, size)
+
+        timing = [f'{name};dur={seconds * 1000:.2f}' for name, seconds in values.items()]
+        timing[1] += f';desc="{record.queries} queries"'
+        if size is not None:
+            timing.append(f'size;desc="{size} bytes"')
+        response['Server-Timing'] = ', '.join(timing)
+
+        entry = {
+            'method': request.method,
+            'path': request.path,
+            'view': self._view(request),
+            'status': response.status_code,
+            'queries': record.queries,
+            'bytes': size,
+            **{f'{name}_ms': round(seconds * 1000, 2) for name, seconds in values.items()},
+        }
+        slow = total * 1000 >= settings.OCTOFIT_SLOW_REQUEST_MS
+        logger.log(logging.WARNING if slow else logging.INFO, json.dumps(entry), extra={'performance': entry})
@@ -0,0 +1,277 @@
+"""
+Incremental leaderboard maintenance.
+
+Ranks follow score descending, ties broken by ascending ``user_id``. The
+activity model signals (``signals.py``) keep it current, next to the
+rollups, so every ORM write counts; ``ingest`` credits the rows it inserts
+with pymongo itself. When an activity write changes a user's score, the score is adjusted in place with
+``$inc`` and only the entries between the user's old and new position are
+shifted by one rank, in a single ``update_many`` over the score index. That
+costs O(entries moved), not O(log n): Mongo has no order-statistic index,
+so a new user entering near the top still shifts almost every entry.
+
+Each shift is relative to the rank the user held when the score changed,
+so two movers must not interleave. ``ranking_lock`` serializes every
+writer of ranks, across threads and processes, through a lease document
+in ``leaderboard_lock``.
+
+``rebuild_leaderboard`` recomputes everything from the activities and is
+only needed after bulk loads or to repair drift.
+
+``windowed`` ranks the current day, week or month from the period
+partial sums in ``rollups``, following the same ranking rules.
+"""
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from datetime import timezone as dt_timezone
+
+from bson import ObjectId
+from django.utils import timezone
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from . import caching, live, rollups
+from .models import Activity, Leaderboard, User
+from .mongo import get_collection, get_database, reserve_ids
+
+RANK_LOCK = 'leaderboard_lock'
+LOCK_LEASE = timedelta(seconds=30)
+REBUILD_LEASE = timedelta(minutes=10)
+LOCK_POLL_SECONDS = 0.005
+
+
+@contextmanager
+def ranking_lock(lease=LOCK_LEASE):
+    """
+    Hold the leaderboard's rank lock for the block. A holder that dies
+    without releasing it is taken over once its ``lease`` runs out.
+    """
+    locks = get_database()[RANK_LOCK]
+    token = ObjectId()
+    while True:
+        now = timezone.now()
+        try:
+            # Matches only a free or expired lock; otherwise the upsert
+            # collides with the held one on ``_id``.
+            locks.find_one_and_update(
+                {'_id': 'ranks', '$or': [{'owner': None}, {'expires_at': {'$lt': now}}]},
+                {'$set': {'owner': token, 'expires_at': now + lease}},
+                upsert=True,
+            )
+            break
+        except DuplicateKeyError:
+            time.sleep(LOCK_POLL_SECONDS)
+    try:
+        yield
+    finally:
+        locks.update_one({'_id': 'ranks', 'owner': token}, {'$set': {'owner': None}})
+
+
+def _ranked_before(score, user_id):
+    return {'$or': [
+        {'score': {'$gt': score}},
+        {'score': score, 'user_id': {'$lt': user_id}},
+    ]}
+
+
+def _ranked_after(score, user_id):
+    return {'$or': [
+        {'score': {'$lt': score}},
+        {'score': score, 'user_id': {'$gt': user_id}},
+    ]}
+
+
+def _shift(collection, user_id, *bounds, step):
+    """Move every other entry matching all ``bounds`` by ``step`` ranks."""
+    query = {'$and': [{'user_id': {'$ne': user_id}}, *bounds]}
+    return collection.update_many(query, {'$inc': {'rank': step}}).modified_count
+
+
+def apply_score_delta(user_id, delta):
+    """Add ``delta`` to a user's score and move them to their new rank."""
+    if not delta:
+        return
+    collection = get_collection(Leaderboard)
+    with ranking_lock():
+        before = collection.find_one_and_update(
+            {'user_id': user_id},
+            {'$inc': {'score': delta}},
+            projection={'score': True, 'rank': True},
+            return_document=ReturnDocument.BEFORE,
+        )
+
+        if before is None:
+            if delta < 0:
+                # Nothing to take away from: the entry went with its user.
+                return
+            last = collection.find_one({}, projection={'rank': True}, sort=[('rank', -1)])
+            last_rank = last['rank'] if last else 0
+            moved = _shift(collection, user_id, _ranked_after(delta, user_id), step=1)
+            new_rank = last_rank + 1 - moved
+            Leaderboard.objects.create(user_id=user_id, score=delta, rank=new_rank)
+            live.ranks_changed(new_rank)
+            return
+        _move(collection, user_id, before['score'], before['rank'], before['score'] + delta)
+
+
+def _move(collection, user_id, old_score, old_rank, new_score):
+    """Re-rank a user whose score went from ``old_score`` to ``new_score``."""
+    if new_score > old_score:
+        moved = _shift(
+            collection, user_id,
+            _ranked_after(new_score, user_id), _ranked_before(old_score, user_id),
+            step=1,
+        )
+        new_rank = old_rank - moved
+    else:
+        moved = _shift(
+            collection, user_id,
+            _ranked_before(new_score, user_id), _ranked_after(old_score, user_id),
+            step=-1,
+        )
+        new_rank = old_rank + moved
+    if new_rank != old_rank:
+        collection.update_one({'user_id': user_id}, {'$set': {'rank': new_rank}})
+    caching.invalidate('leaderboard')
+    live.ranks_changed(min(old_rank, new_rank), max(old_rank, new_rank))
+
+
+def activity_created(activity):
+    apply_score_delta(activity.user_id, activity.duration)
+
+
+def activity_updated(previous, activity):
+    """``previous`` is a copy of the activity taken before the update."""
+    if previous.user_id == activity.user_id:
+        apply_score_delta(activity.user_id, activity.duration - previous.duration)
+    else:
+        apply_score_delta(previous.user_id, -previous.duration)
+        apply_score_delta(activity.user_id, activity.duration)
+
+
+def activity_deleted(activity):
+    apply_score_delta(activity.user_id, -activity.duration)
+
+
+def entry_deleted(entry):
+    """
+    Close the rank gap a deleted leaderboard entry leaves behind. The gap is
+    looked up rather than taken from ``entry.rank``: a cascade reads the
+    entry before deleting the user's activities, which move it.
+    """
+    collection = get_collection(Leaderboard)
+    with ranking_lock():
+        # The smallest rank k with fewer than k entries at or above it.
+        low, high = 1, collection.count_documents({}) + 1
+        while low < high:
+            middle = (low + high) // 2
+            if collection.count_documents({'rank': {'$lte': middle}}) < middle:
+                high = middle
+            else:
+                low = middle + 1
+        _shift(collection, entry.user_id, {'rank': {'$gt': low}}, step=-1)
+
+
+def rebuild_leaderboard():
+    """
+    Recompute every score and rank from the activities collection.
+
+    Totals are summed by Mongo in one ``$group`` pass; users without any
+    activity are ranked last with a score of zero. Returns the number of
+    leaderboard entries.
+    """
+    totals = {
+        row['_id']: row['score']
+        for row in get_collection(Activity).aggregate([
+            {'$group': {'_id': '$user_id', 'score': {'$sum': '$duration'}}},
+        ])
+    }
+    scores = [
+        (totals.get(user['id'], 0.0), user['id'])
+        for user in get_collection(User).find({}, {'id': True, '_id': False})
+    ]
+    scores.sort(key=lambda entry: (-entry[0], entry[1]))
+
+    collection = get_collection(Leaderboard)
+    with ranking_lock(REBUILD_LEASE):
+        existing = set(collection.distinct('user_id'))
+        updates, inserts = [], []
+        for rank, (score, user_id) in enumerate(scores, start=1):
+            if user_id in existing:
+                updates.append(UpdateOne({'user_id': user_id}, {'$set': {'score': score, 'rank': rank}}))
+            else:
+                inserts.append({'user_id': user_id, 'score': score, 'rank': rank})
+        if updates:
+            collection.bulk_write(updates, ordered=False)
+        if inserts:
+            first_id = reserve_ids(Leaderboard, len(inserts))
+            for offset, document in enumerate(inserts):
+                document['id'] = first_id + offset
+            collection.insert_many(inserts, ordered=False)
+    caching.invalidate('leaderboard')
+    live.table_changed()
+    return len(scores)
+
+
+def _period_entries(window, key, limit, user_id):
+    collection = rollups.collection(rollups.USER_PERIODS)
+    query = {'window': window, 'period': key}
+    top = list(
+        collection.find(query, {'_id': False, 'user_id': True, 'score': True, 'count': True})
+        .sort([('score', -1), ('user_id', 1)]).limit(limit)
+    )
+    me = None
+    if user_id is not None:
+        me = collection.find_one({**query, 'user_id': user_id}, {'_id': False, 'score': True, 'count': True})
+        if me is not None:
+            # Counts along the rank index, like the shift window above.
+            me['rank'] = collection.count_documents({**query, **_ranked_before(me['score'], user_id)}) + 1
+    return top, me
+
+
+def _activity_entries(first, following, limit, user_id):
+    collection = get_collection(Activity)
+    totals = [
+        {'$match': {'date': {'$gte': first, '$lt': following}}},
+        {'$group': {'_id': '$user_id', 'score': {'$sum': '$duration'}, 'count': {'$sum': 1}}},
+        {'$project': {'_id': False, 'user_id': '$_id', 'score': True, 'count': True}},
+    ]
+    top = list(collection.aggregate(totals + [{'$sort': {'score': -1, 'user_id': 1}}, {'$limit': limit}]))
+    me = None
+    if user_id is not None:
+        mine = list(collection.aggregate([{'$match': {'user_id': user_id}}] + totals))
+        if mine:
+            me = mine[0]
+            ahead = list(collection.aggregate(
+                totals + [{'$match': _ranked_before(me['score'], user_id)}, {'$count': 'ahead'}]
+            ))
+            me['rank'] = (ahead[0]['ahead'] if ahead else 0) + 1
+    return top, me
+
+
+def windowed(window, limit=10, user_id=None, now=None):
+    """
+    Top ``limit`` entries of the current ``window`` period and, with
+    ``user_id``, that user's entry (``None`` without activity in the period).
+
+    Reads the period rollups once they are built; before that the period's
+    activities are grouped on every call.
+    """
+    key, first, following = rollups.period(window, now or timezone.now())
+    if rollups.ready():
+        top, me = _period_entries(window, key, limit, user_id)
+    else:
+        top, me = _activity_entries(first, following, limit, user_id)
+    for rank, entry in enumerate(top, start=1):
+        entry['rank'] = rank
+    if me is not None:
+        me['user_id'] = user_id
+    return {
+        'window': window,
+        'period': key,
+        'since': first.replace(tzinfo=dt_timezone.utc),
+        'until': following.replace(tzinfo=dt_timezone.utc),
+        'results': top,
+        'me': me,
+    }
@@ -0,0 +1,485 @@
+"""
+Live leaderboard updates pushed over Server-Sent Events and WebSocket.
+
+Writes that move leaderboard scores (``leaderboard.apply_score_delta``,
+``rebuild_leaderboard`` and the model signals) publish a small
+invalidation to the broker: the range of ranks that changed, or
+``full``. Invalidations are idempotent, so a message delivered twice only
+costs a re-read, and a lost one is repaired by the next full refresh.
+
+Each ASGI worker runs one ``LeaderboardFeed`` per event loop while it has
+subscribers. The feed covers the top ``OCTOFIT_LIVE_TOP_N`` ranks only, so
+its memory and snapshots stay the same size however many users there are;
+deeper ranks are for the paginated REST list. It keeps those rows
+serialized in memory, gathers invalidations for
+``OCTOFIT_LIVE_COALESCE_MS``, re-reads only the dirty rank range that falls
+within the top N with Motor, and broadcasts the rows that actually changed
+as one delta, encoded once for every subscriber. Clients get:
+
+* ``snapshot`` – the top N rows, on connect and whenever they fell behind;
+* ``delta`` – changed rows (upsert by ``id``) and the ``removed`` ids of
+  rows that left the top N.
+
+Each message has an id ``<epoch>-<version>``. A client reconnecting with
+``Last-Event-ID`` (SSE) or ``?last_event_id=`` gets the deltas it missed if
+the feed still holds them (``OCTOFIT_LIVE_HISTORY``), else a snapshot.
+
+``OCTOFIT_LIVE_BROKER`` picks the backend: ``InProcessBroker`` when writes
+and streams share a process, ``MongoBroker`` (a capped collection tailed
+by every worker) for multi-worker deployments. The streams are plain ASGI
+endpoints wrapped around Django in ``asgi.py``:
+
+* ``GET /api/leaderboard/live/`` – ``text/event-stream``
+* ``/ws/leaderboard/`` – WebSocket, one JSON message per event
+"""
+import asyncio
+import json
+import logging
+import secrets
+import threading
+import weakref
+from collections import deque
+from urllib.parse import parse_qs
+
+from bson import ObjectId
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.module_loading import import_string
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+from . import repository
+from .fast_serializers import LeaderboardLeanSerializer
+from .models import Leaderboard
+from .mongo import get_async_database, get_database
+
+logger = logging.getLogger(__name__)
+
+SSE_PATH = '/api/leaderboard/live/'
+WEBSOCKET_PATH = '/ws/leaderboard/'
+FULL = {'full': True}
+
+_feeds = weakref.WeakKeyDictionary()
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.OCTOFIT_LIVE_BROKER)()
+    return _broker
+
+
+def _publish(message):
+    try:
+        get_broker().publish(message)
+    except PyMongoError:
+        # The write itself succeeded; feeds catch up on the next full refresh.
+        logger.warning('Could not publish a live leaderboard update', exc_info=True)
+
+
+def ranks_changed(first, last=None):
+    """Publish that ranks ``first`` to ``last`` (or the end) changed."""
+    _publish({'first': first, 'last': last})
+
+
+def table_changed():
+    """Publish that any row may have changed, or been removed."""
+    _publish(FULL)
+
+
+class InProcessBroker:
+    """Fans invalidations out to the event loops of this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._listeners = set()
+
+    def publish(self, message):
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            if listener.loop.is_closed():
+                self._remove(listener)
+                continue
+            # Writes run on request threads; listeners live on event loops.
+            listener.loop.call_soon_threadsafe(listener.put, message)
+
+    async def subscribe(self):
+        listener = _QueueListener(self)
+        with self._lock:
+            self._listeners.add(listener)
+        return listener
+
+    def _remove(self, listener):
+        with self._lock:
+            self._listeners.discard(listener)
+
+
+class _QueueListener:
+    def __init__(self, broker):
+        self.broker = broker
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+
+    def put(self, message):
+        self.queue.put_nowait(message)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def drain(self):
+        messages = []
+        while not self.queue.empty():
+            messages.append(self.queue.get_nowait())
+        return messages
+
+    def close(self):
+        self.broker._remove(self)
+
+
+class MongoBroker:
+    """
+    Invalidations through a capped collection, so writes in any process
+    reach the feeds of every ASGI worker.
+    """
+    collection_name = 'leaderboard_events'
+    size = 1024 * 1024
+    poll_interval = 0.1
+
+    def __init__(self):
+        self._created = False
+
+    def _ensure_collection(self):
+        if not self._created:
+            try:
+                get_database().create_collection(self.collection_name, capped=True, size=self.size)
+            except CollectionInvalid:
+                pass
+            self._created = True
+
+    def publish(self, message):
+        self._ensure_collection()
+        get_database()[self.collection_name].insert_one(dict(message))
+
+    async def subscribe(self):
+        self._ensure_collection()
+        collection = get_async_database()[self.collection_name]
+        newest = await collection.find_one({}, sort=[('$natural', -1)])
+        return _TailingListener(collection, newest['_id'] if newest else ObjectId('0' * 24), self.poll_interval)
+
+
+class _TailingListener:
+    def __init__(self, collection, last_id, poll_interval):
+        self.collection = collection
+        self.last_id = last_id
+        self.poll_interval = poll_interval
+        self.cursor = None
+        self.buffer = deque()
+
+    async def get(self):
+        while not self.buffer:
+            if self.cursor is None or not self.cursor.alive:
+                if self.cursor is not None:
+                    # Messages may have been missed while reconnecting.
+                    self.buffer.append(FULL)
+                self.cursor = self.collection.find(
+                    {'_id': {'$gt': self.last_id}}, cursor_type=CursorType.TAILABLE_AWAIT,
+                )
+            documents = await self.cursor.to_list(length=100)
+            if documents:
+                self.last_id = documents[-1]['_id']
+                self.buffer.extend(documents)
+            elif not self.buffer:
+                await asyncio.sleep(self.poll_interval)
+        return self.buffer.popleft()
+
+    def drain(self):
+        messages = list(self.buffer)
+        self.buffer.clear()
+        return messages
+
+    def close(self):
+        if self.cursor is not None:
+            self.cursor.close()
+
+
+class _Dirty:
+    """Merged extent of a burst of invalidations."""
+
+    def __init__(self):
+        self.full = False
+        self.first = None
+        self.last = None
+        self.to_end = False
+
+    def add(self, message):
+        if message.get('full'):
+            self.full = True
+            return
+        first, last = message['first'], message.get('last')
+        self.first = first if self.first is None else min(self.first, first)
+        if last is None:
+            self.to_end = True
+        else:
+            self.last = last if self.last is None else max(self.last, last)
+
+    def ranks(self, top):
+        """The ``(first, last)`` dirty ranks within the top ``top``, or ``None``."""
+        if self.full:
+            return 1, top
+        last = top if self.to_end else min(self.last, top)
+        return (self.first, last) if self.first <= last else None
+
+
+class Message:
+    """One event, JSON-encoded once for every subscriber."""
+
+    def __init__(self, kind, epoch, version, **payload):
+        self.kind = kind
+        self.version = version
+        self.id = f'{epoch}-{version}'
+        self.data = json.dumps({'type': kind, 'id': self.id, **payload}, separators=(',', ':'))
+
+    def sse(self):
+        return f'event: {self.kind}\nid: {self.id}\ndata: {self.data}\n\n'.encode()
+
+
+class Subscription:
+    def __init__(self, feed, limit):
+        self.feed = feed
+        self.limit = limit
+        self.pending = deque()
+        self.resync = False
+        self.wake = asyncio.Event()
+
+    def push(self, message):
+        if len(self.pending) >= self.limit:
+            # Too far behind for deltas; start over from a snapshot.
+            self.pending.clear()
+            self.resync = True
+        else:
+            self.pending.append(message)
+        self.wake.set()
+
+    async def get(self, timeout=None):
+        """Return the next message, or ``None`` after ``timeout`` seconds."""
+        while not (self.pending or self.resync):
+            self.wake.clear()
+            try:
+                await asyncio.wait_for(self.wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        if self.resync:
+            self.resync = False
+            return self.feed.snapshot()
+        return self.pending.popleft()
+
+    def close(self):
+        self.feed.unsubscribe(self)
+
+
+class LeaderboardFeed:
+    """The leaderboard of one event loop and the subscribers watching it."""
+
+    def __init__(self):
+        self.subscribers = set()
+        self.top = settings.OCTOFIT_LIVE_TOP_N
+        self.history = deque(maxlen=settings.OCTOFIT_LIVE_HISTORY)
+        self.rows = {}
+        self.epoch = None
+        self.version = 0
+        self.listener = None
+        self.task = None
+        self._snapshot = None
+        self._lock = asyncio.Lock()
+
+    async def subscribe(self, last_event_id=None):
+        async with self._lock:
+            if self.task is None:
+                await self._start()
+        subscription = Subscription(self, settings.OCTOFIT_LIVE_HISTORY)
+        self.subscribers.add(subscription)
+        for message in self._resume(last_event_id):
+            subscription.push(message)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscribers.discard(subscription)
+        if not self.subscribers and self.task is not None:
+            self.task.cancel()
+            self.task = None
+            self.listener.close()
+            self.listener = None
+
+    def snapshot(self):
+        if self._snapshot is None or self._snapshot.id != f'{self.epoch}-{self.version}':
+            rows = sorted(self.rows.values(), key=lambda row: row['rank'])
+            self._snapshot = Message('snapshot', self.epoch, self.version, rows=rows)
+        return self._snapshot
+
+    def _resume(self, last_event_id):
+        epoch, _, version = (last_event_id or '').partition('-')
+        if epoch == self.epoch and version.isdigit():
+            version = int(version)
+            if version == self.version:
+                return []
+            if self.history and self.history[0].version <= version + 1 <= self.version:
+                return [message for message in self.history if message.version > version]
+        return [self.snapshot()]
+
+    async def _start(self):
+        # Listen before reading, so no write between the two is missed.
+        self.listener = await get_broker().subscribe()
+        self.epoch = secrets.token_hex(4)
+        self.version = 0
+        self.history.clear()
+        self.rows = {row['id']: row for row in await self._read(1, self.top)}
+        self.task = asyncio.ensure_future(self._run())
+
+    async def _read(self, first, last):
+        rows = await repository.afind_rows(
+            Leaderboard, LeaderboardLeanSerializer.columns, {'rank': {'$gte': first, '$lte': last}},
+            sort=[('rank', 1)],
+        )
+        return await LeaderboardLeanSerializer.aserialize(rows)
+
+    async def _run(self):
+        dirty = _Dirty()
+        while True:
+            dirty.add(await self.listener.get())
+            # Let the rest of the burst arrive, then refresh once.
+            await asyncio.sleep(settings.OCTOFIT_LIVE_COALESCE_MS / 1000)
+            for message in self.listener.drain():
+                dirty.add(message)
+            try:
+                await self._refresh(dirty)
+            except Exception:
+                logger.exception('Live leaderboard refresh failed; retrying with a full refresh')
+                dirty = _Dirty()
+                dirty.add(FULL)
+                continue
+            dirty = _Dirty()
+
+    async def _refresh(self, dirty):
+        ranks = dirty.ranks(self.top)
+        if ranks is None:
+            return
+        rows = await self._read(*ranks)
+        changed = [row for row in rows if self.rows.get(row['id']) != row]
+        # Rows outside the dirty range kept their rank, so a held row inside
+        # it that was not read back has moved below the top N (or is gone).
+        first, last = ranks
+        seen = {row['id'] for row in rows}
+        removed = [
+            row_id for row_id, row in self.rows.items()
+            if row_id not in seen and (dirty.full or first <= row['rank'] <= last)
+        ]
+        if not changed and not removed:
+            return
+        for row_id in removed:
+            del self.rows[row_id]
+        self.rows.update((row['id'], row) for row in changed)
+        self.version += 1
+        message = Message('delta', self.epoch, self.version, rows=changed, removed=removed)
+        self.history.append(message)
+        for subscription in list(self.subscribers):
+            subscription.push(message)
+
+
+def get_feed():
+    loop = asyncio.get_running_loop()
+    feed = _feeds.get(loop)
+    if feed is None:
+        feed = _feeds[loop] = LeaderboardFeed()
+    return feed
+
+
+def _headers(scope):
+    return {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope.get('headers', [])}
+
+
+def _last_event_id(scope):
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    return _headers(scope).get('last-event-id') or query.get('last_event_id', [None])[0]
+
+
+async def _until_disconnected(receive, disconnect_type):
+    while (await receive())['type'] != disconnect_type:
+        pass
+
+
+async def _serve(subscription, send_message, receive, disconnect_type):
+    """Forward ``subscription`` until the client disconnects."""
+    keepalive = settings.OCTOFIT_LIVE_KEEPALIVE_SECONDS
+
+    async def forward():
+        while True:
+            await send_message(await subscription.get(timeout=keepalive))
+
+    tasks = [asyncio.ensure_future(forward()), asyncio.ensure_future(_until_disconnected(receive, disconnect_type))]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        subscription.close()
+
+
+async def sse(scope, receive, send):
+    if scope['method'] not in ('GET', 'HEAD'):
+        await send({'type': 'http.response.start', 'status': 405, 'headers': [(b'allow', b'GET')]})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+    headers = [
+        (b'content-type', b'text/event-stream'),
+        (b'cache-control', b'no-cache'),
+        (b'x-accel-buffering', b'no'),
+    ]
+    if settings.CORS_ALLOW_ALL_ORIGINS:
+        headers.append((b'access-control-allow-origin', b'*'))
+    subscription = await get_feed().subscribe(_last_event_id(scope))
+    await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+
+    async def send_message(message):
+        body = b': keepalive\n\n' if message is None else message.sse()
+        await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+
+    await _serve(subscription, send_message, receive, 'http.disconnect')
+
+
+async def websocket(scope, receive, send):
+    if (await receive())['type'] != 'websocket.connect':
+        return
+    subscription = await get_feed().subscribe(_last_event_id(scope))
+    await send({'type': 'websocket.accept'})
+
+    async def send_message(message):
+        if message is not None:
+            await send({'type': 'websocket.send', 'text': message.data})
+
+    await _serve(subscription, send_message, receive, 'websocket.disconnect')
+
+
+def route(application):
+    """Serve the live endpoints in front of the Django ASGI ``application``."""
+    async def router(scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] == SSE_PATH:
+            return await sse(scope, receive, send)
+        if scope['type'] == 'websocket' and scope['path'] == WEBSOCKET_PATH:
+            return await websocket(scope, receive, send)
+        return await application(scope, receive, send)
+    return router
+
+
+def unavailable(request):
+    """``SSE_PATH`` outside the ASGI application."""
+    return JsonResponse(
+        {'detail': 'Live updates are served by the ASGI application (octofit_tracker.asgi).'}, status=503,
+    )
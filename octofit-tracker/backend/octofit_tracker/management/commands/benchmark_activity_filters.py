@@ -0,0 +1,89 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from octofit_tracker.export import activity_query
+from octofit_tracker.filters import ACTIVITY_ORDERINGS, activity_filters
+from octofit_tracker.management.commands.ensure_indexes import plan_indexes
+from octofit_tracker.models import Activity, Team
+from octofit_tracker.mongo import get_collection
+
+from .benchmark_api import _percentile
+
+
+def _combinations(user, team, activity_type, date_after):
+    """``(label, params)`` for every filter combination worth timing."""
+    return [
+        ('no filter', {}),
+        ('user', {'user': user}),
+        ('team', {'team': team}),
+        ('activity_type', {'activity_type': activity_type}),
+        ('date range', {'date_after': date_after}),
+        ('user + date range', {'user': user, 'date_after': date_after}),
+        ('team + activity_type', {'team': team, 'activity_type': activity_type}),
+        ('activity_type + date range', {'activity_type': activity_type, 'date_after': date_after}),
+        ('ordering=date', {'ordering': 'date'}),
+        ('user + ordering=date', {'user': user, 'ordering': 'date'}),
+    ]
+
+
+def _winning_index(params):
+    """Index used by the Mongo query the filters translate to."""
+    query = activity_query(**activity_filters(params))
+    ordering = ACTIVITY_ORDERINGS[params.get('ordering', '-date')]
+    sort = [(name.lstrip('-'), -1 if name.startswith('-') else 1) for name in ordering]
+    plan = get_collection(Activity).find(query).sort(sort).explain()['queryPlanner']['winningPlan']
+    return ', '.join(dict.fromkeys(plan_indexes(plan))) or plan.get('stage', '?')
+
+
+class Command(BaseCommand):
+    help = 'Time /api/activities/ under each filter combination against the current database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='Requests per combination (default: 50).')
+        parser.add_argument('--page-size', type=int, default=100, help='page_size of each request (default: 100).')
+        parser.add_argument(
+            '--explain', action='store_true',
+            help='Also report the index each combination uses (needs a real MongoDB).',
+        )
+
+    def handle(self, *args, **options):
+        newest = Activity.objects.order_by('-date', '-id').values('user_id', 'activity_type', 'date').first()
+        if newest is None:
+            raise CommandError('No activities; seed some with populate_db --users N first')
+        team = Team.objects.values_list('id', flat=True).first()
+        date_after = (newest['date'] - timedelta(days=30)).date().isoformat()
+        combinations = _combinations(newest['user_id'], team, newest['activity_type'], date_after)
+        if team is None:
+            combinations = [(label, params) for label, params in combinations if 'team' not in params]
+
+        client = APIClient(SERVER_NAME='localhost')
+        self.stdout.write(f"{get_collection(Activity).estimated_document_count():,} activities, {options['requests']} requests each\n")
+        self.stdout.write(f"{'combination':<28} {'rows':>5} {'queries':>7} {'p50 ms':>8} {'p95 ms':>8}")
+        for label, params in combinations:
+            params = {**params, 'page_size': options['page_size']}
+            # The test client fires request_started, which empties the
+            # query log CaptureQueriesContext indexes into.
+            reset_queries()
+            with CaptureQueriesContext(connection) as captured:
+                response = client.get('/api/activities/', params)
+            # Read now: captured_queries slices the live log, which later requests reset.
+            queries = len(captured)
+            if response.status_code != 200:
+                raise CommandError(f'{label}: HTTP {response.status_code} {response.content[:200]!r}')
+            timings = []
+            for _ in range(options['requests']):
+                started = time.perf_counter()
+                client.get('/api/activities/', params)
+                timings.append((time.perf_counter() - started) * 1000)
+            line = (
+                f"{label:<28} {len(response.json()['results']):>5} {queries:>7} "
+                f"{_percentile(timings, 0.5):>8.1f} {_percentile(timings, 0.95):>8.1f}"
+            )
+            if options['explain']:
+                line += f'  {_winning_index(params)}'
+            self.stdout.write(line)
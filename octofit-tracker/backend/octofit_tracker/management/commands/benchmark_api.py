@@ -0,0 +1,206 @@
+import json
+import time
+import tracemalloc
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from octofit_tracker.models import Activity, Leaderboard, Team, User, Workout
+from octofit_tracker.mongo import get_collection
+from octofit_tracker.repository import BACKENDS
+from octofit_tracker.urls import router
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmark_baseline.json'
+# Metrics allowed to grow by --tolerance, plus this absolute slack so that
+# sub-millisecond endpoints do not fail on noise. Query counts may never grow.
+SLACK = {'p50_ms': 2.0, 'p95_ms': 2.0, 'p99_ms': 2.0, 'peak_kib': 64.0}
+
+
+def endpoints(page_size):
+    """
+    ``(name, url, params)`` for every GET route the router exposes: list,
+    detail of the first row and each list-level ``@action``.
+    """
+    first_user = User.objects.values_list('pk', flat=True).order_by('pk').first()
+    # Actions that need query parameters to answer 200.
+    action_params = {'workout-recommended': {'user': first_user}}
+    found = []
+    for prefix, viewset, basename in router.registry:
+        found.append((f'{basename}-list', reverse(f'{basename}-list'), {'page_size': page_size}))
+        pk = viewset.queryset.model.objects.values_list('pk', flat=True).order_by('pk').first()
+        if pk is not None:
+            found.append((f'{basename}-detail', reverse(f'{basename}-detail', args=[pk]), {}))
+        for extra in viewset.get_extra_actions():
+            if not extra.detail and 'get' in extra.mapping:
+                name = f'{basename}-{extra.url_name}'
+                found.append((name, reverse(name), action_params.get(name, {})))
+    return found
+
+
+def _percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def _get(client, url, params):
+    response = client.get(url, params)
+    if response.status_code != 200:
+        raise CommandError(f'{url}: HTTP {response.status_code}')
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+def measure(client, url, params, requests):
+    """
+    Latency percentiles, queries of a cold request and peak memory. Run with
+    the response cache disabled so every request reaches the read path.
+    """
+    cache.clear()
+    # The test client fires request_started, which empties the query log
+    # CaptureQueriesContext indexes into.
+    reset_queries()
+    with CaptureQueriesContext(connection) as captured:
+        _get(client, url, params)
+    # Read now: captured_queries slices the live log, which later requests reset.
+    queries = len(captured)
+
+    tracemalloc.start()
+    try:
+        _get(client, url, params)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    timings = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        _get(client, url, params)
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        'p50_ms': round(_percentile(timings, 0.50), 2),
+        'p95_ms': round(_percentile(timings, 0.95), 2),
+        'p99_ms': round(_percentile(timings, 0.99), 2),
+        'queries': queries,
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def regressions(results, baseline, tolerance):
+    """Describe every metric that is worse than ``baseline`` allows."""
+    found = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if current['queries'] > previous['queries']:
+            found.append(f"{name}: queries {previous['queries']} -> {current['queries']}")
+        for metric, slack in SLACK.items():
+            limit = previous[metric] * (1 + tolerance) + slack
+            if current[metric] > limit:
+                found.append(f'{name}: {metric} {previous[metric]} -> {current[metric]} (limit {limit:.2f})')
+    return found
+
+
+def reseed(options, stdout):
+    """Run ``populate_db`` for ``--users``, refusing to wipe the development database."""
+    if settings.DATABASES['default']['NAME'] == 'octofit_db':
+        raise CommandError(
+            '--users wipes the database; run with DJANGO_SETTINGS_MODULE=octofit_tracker.settings_benchmark'
+        )
+    call_command(
+        'populate_db', users=options['users'], activities_per_user=options['activities_per_user'],
+        seed=options['seed'], stdout=stdout,
+    )
+
+
+def dataset():
+    return {
+        model._meta.db_table: get_collection(model).estimated_document_count()
+        for model in (User, Team, Activity, Leaderboard, Workout)
+    }
+
+
+class Command(BaseCommand):
+    help = ('Benchmark every API endpoint (p50/p95/p99 latency, queries, peak memory) '
+            'and fail on regressions against a stored baseline')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=0,
+            help='Reseed with populate_db and this many synthetic users first (wipes the database).',
+        )
+        parser.add_argument('--activities-per-user', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1, help='Random seed for --users (default: 1).')
+        parser.add_argument('--requests', type=int, default=30, help='Timed requests per endpoint (default: 30).')
+        parser.add_argument('--page-size', type=int, default=100, help='page_size of list requests (default: 100).')
+        parser.add_argument(
+            '--data-backend', choices=BACKENDS, default=None,
+            help='Read path to benchmark (default: the OCTOFIT_DATA_BACKEND setting).',
+        )
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help='Baseline JSON file.')
+        parser.add_argument('--save-baseline', action='store_true', help='Write the results as the new baseline.')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.5,
+            help='Allowed slowdown of latency and memory over the baseline, as a fraction (default: 0.5).',
+        )
+
+    def handle(self, *args, **options):
+        if options['users']:
+            reseed(options, self.stdout)
+        current_dataset = dataset()
+        if not current_dataset['activities']:
+            raise CommandError('The database is empty; pass --users N to seed it')
+
+        backend = options['data_backend'] or settings.OCTOFIT_DATA_BACKEND
+        client = APIClient(SERVER_NAME='localhost')
+        self.stdout.write(
+            f"\n{', '.join(f'{count:,} {table}' for table, count in current_dataset.items())}; "
+            f"{backend} data backend, {options['requests']} requests per endpoint\n"
+        )
+        self.stdout.write(
+            f"{'endpoint':<22} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>7} {'peak KiB':>9}"
+        )
+        results = {}
+        for name, url, params in endpoints(options['page_size']):
+            with override_settings(OCTOFIT_DATA_BACKEND=backend, OCTOFIT_RESPONSE_CACHE_TIMEOUT=0):
+                result = results[name] = measure(client, url, params, options['requests'])
+            self.stdout.write(
+                f"{name:<22} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f} "
+                f"{result['queries']:>7} {result['peak_kib']:>9.1f}"
+            )
+
+        path = Path(options['baseline'])
+        if options['save_baseline']:
+            path.write_text(json.dumps(
+                {'dataset': current_dataset, 'data_backend': backend, 'endpoints': results}, indent=2
+            ) + '\n')
+            self.stdout.write(self.style.SUCCESS(f'\nBaseline written to {path}'))
+            return
+        if not path.exists():
+            self.stdout.write(self.style.WARNING(f'\nNo baseline at {path}; record one with --save-baseline'))
+            return
+
+        baseline = json.loads(path.read_text())
+        if baseline['dataset'] != current_dataset:
+            raise CommandError(
+                f"Baseline {path} was recorded on a different dataset ({baseline['dataset']}); "
+                'reseed with the same --users/--activities-per-user/--seed or save a new baseline'
+            )
+        recorded = baseline.get('data_backend', 'orm')
+        if recorded != backend:
+            raise CommandError(
+                f'Baseline {path} was recorded with the {recorded} data backend; '
+                'pass --data-backend to match or save a new baseline'
+            )
+        found = regressions(results, baseline['endpoints'], options['tolerance'])
+        if found:
+            raise CommandError('Performance regressions:\n  ' + '\n  '.join(found))
+        self.stdout.write(self.style.SUCCESS(f'\nNo regressions against {path}'))
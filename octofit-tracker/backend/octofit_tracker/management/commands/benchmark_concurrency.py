@@ -0,0 +1,185 @@
+import asyncio
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from octofit_tracker.repository import BACKENDS
+
+from .benchmark_api import _percentile, dataset, reseed
+
+# (name, synchronous DRF url, async url)
+ENDPOINTS = (
+    ('leaderboard', '/api/leaderboard/', '/api/async/leaderboard/'),
+    ('activities', '/api/activities/', '/api/async/activities/'),
+    ('team-summary', '/api/teams/summary/', '/api/async/teams/summary/'),
+)
+MODES = ('wsgi', 'asgi-sync', 'asgi')
+
+
+class _Transport:
+    """Calls a WSGI or ASGI application in-process, like a server would."""
+
+    def __init__(self, threads, client_delay):
+        self.wsgi = WSGIHandler()
+        self.asgi = ASGIHandler()
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+        self.client_delay = client_delay
+
+    def _wsgi_get(self, path, query):
+        # Runs on a worker thread, which stays busy until the client has
+        # read the whole body.
+        status = []
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+            'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost',
+            'SERVER_PROTOCOL': 'HTTP/1.1', 'wsgi.input': io.BytesIO(b''), 'wsgi.url_scheme': 'http',
+        }
+        body = self.wsgi(environ, lambda code, headers: status.append(int(code.split()[0])))
+        try:
+            for _ in body:
+                if self.client_delay:
+                    time.sleep(self.client_delay)
+        finally:
+            body.close()
+        return status[0]
+
+    async def wsgi_get(self, path, query):
+        return await asyncio.get_running_loop().run_in_executor(self.pool, self._wsgi_get, path, query)
+
+    async def asgi_get(self, path, query):
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+            'root_path': '', 'headers': [(b'host', b'localhost')],
+            'server': ('localhost', 80), 'client': ('127.0.0.1', 0),
+        }
+        status = []
+        requested = False
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await asyncio.Event().wait()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+            elif message['type'] == 'http.response.body' and self.client_delay:
+                await asyncio.sleep(self.client_delay)
+
+        await self.asgi(scope, receive, send)
+        return status[0]
+
+
+async def _run(get, path, query, concurrency, requests):
+    """``concurrency`` clients issuing ``requests`` requests back to back."""
+    timings = []
+    errors = 0
+    remaining = requests
+
+    async def client():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            if await get(path, query) != 200:
+                errors += 1
+            timings.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(min(concurrency, requests))))
+    elapsed = time.perf_counter() - started
+    return {
+        'rps': round(requests / elapsed, 1),
+        'p50_ms': round(_percentile(timings, 0.50), 2),
+        'p95_ms': round(_percentile(timings, 0.95), 2),
+        'p99_ms': round(_percentile(timings, 0.99), 2),
+        'errors': errors,
+    }
+
+
+class Command(BaseCommand):
+    help = ('Compare throughput and latency of the read endpoints under concurrent clients: '
+            'sync views on WSGI threads, sync views on ASGI, and the async views on ASGI')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=0,
+            help='Reseed with populate_db and this many synthetic users first (wipes the database).',
+        )
+        parser.add_argument('--activities-per-user', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1, help='Random seed for --users (default: 1).')
+        parser.add_argument(
+            '--concurrency', default='1,10,100',
+            help='Comma-separated numbers of concurrent clients (default: 1,10,100).',
+        )
+        parser.add_argument('--requests', type=int, default=200, help='Requests per level (default: 200).')
+        parser.add_argument('--threads', type=int, default=8, help='WSGI worker threads (default: 8).')
+        parser.add_argument(
+            '--client-delay-ms', type=float, default=0.0,
+            help='Time each client takes to read a response body, to simulate slow clients (default: 0).',
+        )
+        parser.add_argument('--page-size', type=int, default=100, help='page_size of list requests (default: 100).')
+        parser.add_argument(
+            '--data-backend', choices=BACKENDS, default=None,
+            help='Read path of the sync views (default: the OCTOFIT_DATA_BACKEND setting).',
+        )
+        parser.add_argument('--mode', choices=MODES, action='append', help='Only run these modes.')
+        parser.add_argument('--endpoint', choices=[name for name, _, _ in ENDPOINTS], action='append',
+                            help='Only run these endpoints.')
+
+    def handle(self, *args, **options):
+        try:
+            levels = [int(level) for level in options['concurrency'].split(',')]
+        except ValueError:
+            raise CommandError('--concurrency must be comma-separated integers')
+        if options['users']:
+            reseed(options, self.stdout)
+        current_dataset = dataset()
+        if not current_dataset['activities']:
+            raise CommandError('The database is empty; pass --users N to seed it')
+
+        backend = options['data_backend'] or settings.OCTOFIT_DATA_BACKEND
+        modes = options['mode'] or MODES
+        query = f"page_size={options['page_size']}"
+        self.stdout.write(
+            f"\n{', '.join(f'{count:,} {table}' for table, count in current_dataset.items())}; "
+            f"{backend} data backend for sync views, {options['threads']} WSGI threads, "
+            f"{options['client_delay_ms']} ms client delay, {options['requests']} requests per level\n"
+        )
+        self.stdout.write(
+            f"{'endpoint':<14} {'mode':<10} {'clients':>7} {'req/s':>8} "
+            f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6}"
+        )
+        # Both sides read Mongo on every request: no response cache, no sampling.
+        with override_settings(
+            OCTOFIT_DATA_BACKEND=backend, OCTOFIT_RESPONSE_CACHE_TIMEOUT=0, OCTOFIT_METRICS_SAMPLE_RATE=0,
+        ):
+            transport = _Transport(options['threads'], options['client_delay_ms'] / 1000)
+            try:
+                asyncio.run(self._benchmark(transport, modes, levels, query, options))
+            finally:
+                transport.pool.shutdown()
+
+    async def _benchmark(self, transport, modes, levels, query, options):
+        for name, sync_path, async_path in ENDPOINTS:
+            if options['endpoint'] and name not in options['endpoint']:
+                continue
+            for mode in modes:
+                get = transport.wsgi_get if mode == 'wsgi' else transport.asgi_get
+                path = async_path if mode == 'asgi' else sync_path
+                await get(path, query)  # warm up
+                for level in levels:
+                    result = await _run(get, path, query, level, options['requests'])
+                    self.stdout.write(
+                        f"{name:<14} {mode:<10} {level:>7} {result['rps']:>8.1f} {result['p50_ms']:>8.1f} "
+                        f"{result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f} {result['errors']:>6}"
+                    )
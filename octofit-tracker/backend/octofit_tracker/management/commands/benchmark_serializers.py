@@ -0,0 +1,74 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from octofit_tracker.fast_serializers import (
+    ActivityLeanSerializer, LeaderboardLeanSerializer, UserLeanSerializer
+)
+from octofit_tracker.models import Activity, Leaderboard, Team, User
+from octofit_tracker.serializers import ActivitySerializer, LeaderboardSerializer, UserSerializer
+
+
+def _dataset(rows):
+    """Build unsaved instances with their relations already cached, plus the
+    matching ``.values()`` rows and related-name maps."""
+    now = timezone.now()
+    teams = [Team(id=i, name=f'Team {i}') for i in range(1, 11)]
+    users = [
+        User(id=i, name=f'Athlete {i}', email=f'athlete{i}@octofit.test', team=teams[i % len(teams)],
+             avatar='', fitness_level='intermediate', created_at=now)
+        for i in range(1, rows + 1)
+    ]
+    activities = [
+        Activity(id=i, user=user, activity_type='running', duration=30.0,
+                 date=now - timedelta(minutes=i), notes='')
+        for i, user in enumerate(users, start=1)
+    ]
+    entries = [Leaderboard(id=i, user=user, score=float(rows - i), rank=i) for i, user in enumerate(users, start=1)]
+
+    team_names = {team.id: (team.name,) for team in teams}
+    return {
+        'users': (UserSerializer, users, UserLeanSerializer, {'teams': team_names}),
+        'activities': (ActivitySerializer, activities, ActivityLeanSerializer,
+                       {'users': {user.id: (user.name,) for user in users}}),
+        'leaderboard': (LeaderboardSerializer, entries, LeaderboardLeanSerializer,
+                        {'users': {user.id: (user.name, user.team_id) for user in users}, 'teams': team_names}),
+    }
+
+
+def _values(lean, instance):
+    return {column: getattr(instance, column) for column in lean.columns}
+
+
+def _rate(rows, repeat, func):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return rows / best
+
+
+class Command(BaseCommand):
+    help = 'Compare rows/sec of the ModelSerializer and lean list serializers (no database needed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000, help='Rows per run (default: 5000).')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per serializer; the best is kept.')
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        self.stdout.write(f'{rows:,} rows, best of {repeat} runs\n')
+        self.stdout.write(f"{'endpoint':<12} {'ModelSerializer':>18} {'lean':>14} {'speedup':>8}")
+        for name, (serializer_class, instances, lean, related) in _dataset(rows).items():
+            values = [_values(lean, instance) for instance in instances]
+            if lean.render(values, related) != serializer_class(instances, many=True).data:
+                self.stdout.write(self.style.ERROR(f'{name}: lean output differs from {serializer_class.__name__}'))
+                continue
+            before = _rate(rows, repeat, lambda: serializer_class(instances, many=True).data)
+            after = _rate(rows, repeat, lambda: lean.render(values, related))
+            self.stdout.write(
+                f'{name:<12} {before:>12,.0f} rows/s {after:>8,.0f} rows/s {after / before:>7.1f}x'
+            )
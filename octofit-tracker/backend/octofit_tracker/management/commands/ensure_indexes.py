@@ -0,0 +1,121 @@
+from datetime import datetime
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from pymongo import ASCENDING, DESCENDING
+
+from octofit_tracker import rollups, search, tasks
+from octofit_tracker.models import Activity, Leaderboard, User
+from octofit_tracker.mongo import get_collection, get_database
+
+# Representative filters/sorts issued by the API, checked with --explain.
+NEWEST_FIRST = [('date', DESCENDING), ('id', DESCENDING)]
+
+QUERY_SHAPES = [
+    (Activity, 'activities of a user, newest first', {'user_id': 1}, NEWEST_FIRST),
+    (Activity, 'activities of a team, newest first', {'user_id': {'$in': [1, 2, 3]}}, NEWEST_FIRST),
+    (Activity, 'activity page (keyset on date, id)', {'date': {'$lt': datetime(2100, 1, 1)}}, NEWEST_FIRST),
+    (Activity, 'activities of a type in a date range',
+     {'activity_type': 'running', 'date': {'$gte': datetime(2000, 1, 1)}}, NEWEST_FIRST),
+    (User, 'members of a team', {'team_id': 1}, None),
+    (Leaderboard, 'leaderboard page by rank', {}, [('rank', ASCENDING)]),
+    (Leaderboard, 'entry of a user', {'user_id': 1}, None),
+    (Leaderboard, 'rank shift window', {'score': {'$gt': 0, '$lt': 100}}, None),
+]
+
+
+def expected_indexes(model):
+    """
+    Return ``(name, keys, options)`` for every index the model declares:
+    ``Meta.indexes`` plus single-field ``db_index``/``unique`` fields such as
+    foreign keys.
+    """
+    table = model._meta.db_table
+    indexes = []
+    for field in model._meta.local_fields:
+        if field.primary_key or not (field.db_index or field.unique):
+            continue
+        indexes.append((f'{table}_{field.column}_idx', [(field.column, ASCENDING)], {'unique': field.unique}))
+    for index in model._meta.indexes:
+        keys = [
+            (model._meta.get_field(name).column, DESCENDING if order == 'DESC' else ASCENDING)
+            for name, order in index.fields_orders
+        ]
+        indexes.append((index.name, keys, {}))
+    return indexes
+
+
+def plan_indexes(plan):
+    """Yield the index name (or ``COLLSCAN``) of every leaf in a query plan."""
+    if plan.get('stage') == 'COLLSCAN':
+        yield 'COLLSCAN'
+    if 'indexName' in plan:
+        yield plan['indexName']
+    for child in [plan.get('inputStage')] + plan.get('inputStages', []):
+        if child:
+            yield from plan_indexes(child)
+
+
+class Command(BaseCommand):
+    help = 'Create or verify the MongoDB indexes declared by the octofit_tracker models, rollups and search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only verify; exit with an error if any index is missing.',
+        )
+        parser.add_argument(
+            '--explain', action='store_true',
+            help='Report which index the winning plan of each API query shape uses.',
+        )
+
+    def handle(self, *args, **options):
+        missing = []
+        targets = [
+            (get_collection(model), expected_indexes(model))
+            for model in apps.get_app_config('octofit_tracker').get_models()
+        ]
+        targets += [
+            (get_database()[name], indexes)
+            for name, indexes in {**rollups.INDEXES, **search.INDEXES, **tasks.INDEXES}.items()
+        ]
+        for collection, expected in targets:
+            existing = {
+                name: tuple(
+                    (key, direction if isinstance(direction, str) else int(direction))
+                    for key, direction in info['key']
+                )
+                for name, info in collection.index_information().items()
+            }
+            by_keys = {keys: name for name, keys in existing.items()}
+            for name, keys, index_options in expected:
+                keys = tuple(keys)
+                label = f"{collection.name}: {', '.join(f'{k} {d:+d}' for k, d in keys)}"
+                if keys in by_keys:
+                    self.stdout.write(f'  ok       {label} ({by_keys[keys]})')
+                    continue
+                if options['check']:
+                    missing.append(label)
+                    self.stdout.write(self.style.ERROR(f'  missing  {label}'))
+                    continue
+                # djongo's SQL translation turns "date DESC" into a key
+                # literally named 'date" DESC', so an index created by
+                # migrate can carry the right name over the wrong keys.
+                if name in existing:
+                    collection.drop_index(name)
+                collection.create_index(list(keys), name=name, **index_options)
+                self.stdout.write(self.style.SUCCESS(f'  created  {label} ({name})'))
+
+        if options['explain']:
+            self.stdout.write('\nQuery shapes:')
+            for model, description, query, sort in QUERY_SHAPES:
+                cursor = get_collection(model).find(query)
+                if sort:
+                    cursor = cursor.sort(sort)
+                plan = cursor.explain()['queryPlanner']['winningPlan']
+                used = ', '.join(dict.fromkeys(plan_indexes(plan))) or plan.get('stage', '?')
+                style = self.style.WARNING if 'COLLSCAN' in used else self.style.SUCCESS
+                self.stdout.write(style(f'  {model._meta.db_table}: {description} -> {used}'))
+
+        if missing:
+            raise CommandError(f'{len(missing)} index(es) missing; run without --check to create them')
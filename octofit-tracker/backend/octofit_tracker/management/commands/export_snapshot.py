@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from octofit_tracker import snapshot
+
+
+class Command(BaseCommand):
+    help = ('Append new activities to the columnar, memory-mapped snapshot read by snapshot.Snapshot '
+            'and ?source=snapshot stats')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--directory', default=None,
+            help='Snapshot directory (default: the OCTOFIT_SNAPSHOT_DIR setting, or backend/snapshot).',
+        )
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Rewrite the snapshot from scratch, picking up edited and deleted activities.',
+        )
+        parser.add_argument('--batch-size', type=int, default=100_000, help='Rows per appended batch.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        appended, total = snapshot.export(options['directory'], full=options['full'],
+                                          batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+        rate = f'{appended / elapsed:,.0f} rows/s' if elapsed and appended else 'n/a'
+        self.stdout.write(self.style.SUCCESS(
+            f'Appended {appended:,} activities ({total:,} in the snapshot) in {elapsed:.1f}s ({rate})'
+        ))
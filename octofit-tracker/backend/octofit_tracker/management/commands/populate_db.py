@@ -1,108 +1,97 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
 from datetime import timedelta
+from itertools import islice
 import random
-from pymongo import MongoClient
+import time
+from octofit_tracker import rollups, search, tasks
+from octofit_tracker.leaderboard import rebuild_leaderboard
 from octofit_tracker.models import User, Team, Activity, Leaderboard, Workout
+from octofit_tracker.mongo import get_collection, reserve_ids
+
+ACTIVITY_TYPES = [value for value, _ in Activity.ACTIVITY_TYPES]
+FITNESS_LEVELS = ['beginner', 'intermediate', 'advanced', 'god-tier']
+# Seconds between progress lines while bulk inserting.
+PROGRESS_INTERVAL = 2.0
 
 
 class Command(BaseCommand):
     help = 'Populate the octofit_db database with test data'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=0,
+            help='Generate this many synthetic users instead of the superhero roster.',
+        )
+        parser.add_argument(
+            '--activities-per-user', type=int, default=50,
+            help='Synthetic activities generated per user (default: 50).',
+        )
+        parser.add_argument(
+            '--teams', type=int, default=10,
+            help='Synthetic teams the users are spread across (default: 10).',
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='Spread synthetic activities over this many past days (default: 365).',
+        )
+        parser.add_argument(
+            '--seed', type=int, default=None,
+            help='Random seed, for reproducible datasets.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=10000,
+            help='Documents per insert_many call (default: 10000).',
+        )
+        parser.add_argument(
+            '--defer-rebuilds', action='store_true',
+            help='Queue the rollup and leaderboard rebuilds for the task workers instead of running them here.',
+        )
+
     def handle(self, *args, **options):
         # Clear existing data directly via pymongo to avoid ORM issues with
         # malformed documents that may have non-integer primary keys.
         self.stdout.write('Clearing existing data...')
-        _client = MongoClient('localhost', 27017)
-        _db = _client['octofit_db']
-        for col in ['users', 'teams', 'activities', 'leaderboard', 'workouts']:
-            _db[col].delete_many({})
-        _client.close()
-
-        # Create Teams using Django ORM
-        self.stdout.write('Inserting teams...')
-        Team.objects.create(
-            id=1,
-            name='Team Marvel',
-            description="Earth's Mightiest Heroes",
-        )
-        Team.objects.create(
-            id=2,
-            name='Team DC',
-            description='Justice League United',
-        )
-        # Re-fetch to get clean integer PKs (djongo can return ObjectId on save)
-        team_marvel = Team.objects.get(pk=1)
-        team_dc = Team.objects.get(pk=2)
-        self.stdout.write(self.style.SUCCESS('Inserted 2 teams'))
-
-        # Create Users using Django ORM
-        self.stdout.write('Inserting users...')
-        users_info = [
-            # Team Marvel
-            (1, 'Tony Stark', 'ironman@avengers.com', team_marvel, '🦾', 'advanced'),
-            (2, 'Steve Rogers', 'captain@avengers.com', team_marvel, '🛡️', 'advanced'),
-            (3, 'Natasha Romanoff', 'blackwidow@avengers.com', team_marvel, '🕷️', 'advanced'),
-            (4, 'Bruce Banner', 'hulk@avengers.com', team_marvel, '💚', 'advanced'),
-            (5, 'Thor Odinson', 'thor@asgard.com', team_marvel, '⚡', 'god-tier'),
-            # Team DC
-            (6, 'Clark Kent', 'superman@justiceleague.com', team_dc, '🦸', 'god-tier'),
-            (7, 'Bruce Wayne', 'batman@gotham.com', team_dc, '🦇', 'advanced'),
-            (8, 'Diana Prince', 'wonderwoman@themyscira.com', team_dc, '⭐', 'god-tier'),
-            (9, 'Barry Allen', 'flash@speedforce.com', team_dc, '⚡', 'advanced'),
-            (10, 'Arthur Curry', 'aquaman@atlantis.com', team_dc, '🔱', 'advanced'),
-        ]
+        for model in (User, Team, Activity, Leaderboard, Workout):
+            get_collection(model).delete_many({})
+        # Derived data of the old dataset: without this, rollups would stay
+        # "ready" (and stale) until a deferred rebuild runs.
+        rollups.clear()
+        search.collection().delete_many({})
+        tasks.collection().delete_many({})
 
-        users = []
-        for uid, name, email, team, avatar, fitness_level in users_info:
-            User.objects.create(
-                id=uid,
-                name=name,
-                email=email,
-                team=team,
-                avatar=avatar,
-                fitness_level=fitness_level,
+        if options['users']:
+            self.seed_synthetic(
+                users=options['users'],
+                activities_per_user=options['activities_per_user'],
+                teams=options['teams'],
+                days=options['days'],
+                seed=options['seed'],
+                batch_size=options['batch_size'],
             )
-        # Re-fetch users with clean integer PKs
-        users = list(User.objects.all().order_by('id'))
-        self.stdout.write(self.style.SUCCESS(f'Inserted {len(users)} users'))
-
-        # Create Activities using Django ORM
-        self.stdout.write('Inserting activities...')
-        activity_types = ['running', 'cycling', 'swimming', 'strength_training', 'yoga']
-        activities_created = 0
-        activity_id = 1
-        for user in users:
-            num_activities = random.randint(5, 10)
-            for j in range(num_activities):
-                days_ago = random.randint(0, 30)
-                activity_date = timezone.now() - timedelta(days=days_ago)
-                Activity.objects.create(
-                    id=activity_id,
-                    user=user,
-                    activity_type=random.choice(activity_types),
-                    duration=random.randint(15, 120),
-                    date=activity_date,
-                    notes=f'Great workout session #{j + 1}',
-                )
-                activity_id += 1
-                activities_created += 1
-        self.stdout.write(self.style.SUCCESS(f'Inserted {activities_created} activities'))
+        else:
+            random.seed(options['seed'])
+            self.seed_heroes()
 
-        # Create Leaderboard entries using Django ORM
-        self.stdout.write('Calculating leaderboard...')
-        leaderboard_entries = []
-        for user in users:
-            total_duration = sum(
-                a.duration for a in Activity.objects.filter(user=user)
-            )
-            leaderboard_entries.append((user, total_duration))
+        if options['defer_rebuilds']:
+            for name in ('rebuild_rollups', 'rebuild_leaderboard'):
+                job = tasks.enqueue(name, key=name, defer=True)
+                self.stdout.write(f"Queued {name} as task {job['_id']}")
+        else:
+            self.stdout.write('Building daily rollups...')
+            started = time.perf_counter()
+            documents = rollups.rebuild()
+            self.stdout.write(self.style.SUCCESS(
+                f'Built {documents:,} rollup documents in {time.perf_counter() - started:.1f}s'
+            ))
 
-        # Sort by total duration descending and assign ranks
-        leaderboard_entries.sort(key=lambda x: x[1], reverse=True)
-        for rank, (user, score) in enumerate(leaderboard_entries, start=1):
-            Leaderboard.objects.create(id=rank, user=user, score=score, rank=rank)
-        self.stdout.write(self.style.SUCCESS(f'Inserted {len(leaderboard_entries)} leaderboard entries'))
+            # Rank every user from the activity totals summed by Mongo
+            self.stdout.write('Calculating leaderboard...')
+            started = time.perf_counter()
+            entries = rebuild_leaderboard()
+            self.stdout.write(self.style.SUCCESS(
+                f'Inserted {entries:,} leaderboard entries in {time.perf_counter() - started:.1f}s'
+            ))
 
         # Create Workout suggestions using Django ORM
         self.stdout.write('Inserting workout suggestions...')
@@ -193,14 +182,169 @@ class Command(BaseCommand):
             )
         self.stdout.write(self.style.SUCCESS(f'Inserted {len(workouts_data)} workout suggestions'))
 
+        self.stdout.write('Building search index...')
+        started = time.perf_counter()
+        entries = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {entries:,} users, teams and workouts in {time.perf_counter() - started:.1f}s'
+        ))
+
         # Summary
         self.stdout.write('\n' + '=' * 50)
         self.stdout.write(self.style.SUCCESS('DATABASE POPULATION COMPLETE!'))
         self.stdout.write('=' * 50 + '\n')
         self.stdout.write('Collection counts:')
-        self.stdout.write(f'  Users: {User.objects.count()}')
-        self.stdout.write(f'  Teams: {Team.objects.count()}')
-        self.stdout.write(f'  Activities: {Activity.objects.count()}')
-        self.stdout.write(f'  Leaderboard: {Leaderboard.objects.count()}')
-        self.stdout.write(f'  Workouts: {Workout.objects.count()}')
+        # Collection metadata counts stay instant at tens of millions of rows
+        for label, model in (('Users', User), ('Teams', Team), ('Activities', Activity),
+                             ('Leaderboard', Leaderboard), ('Workouts', Workout)):
+            self.stdout.write(f'  {label}: {get_collection(model).estimated_document_count():,}')
 
+    def seed_heroes(self):
+        """Insert the Marvel vs DC roster and a few random activities each."""
+        # Create Teams using Django ORM
+        self.stdout.write('Inserting teams...')
+        Team.objects.create(
+            id=1,
+            name='Team Marvel',
+            description="Earth's Mightiest Heroes",
+        )
+        Team.objects.create(
+            id=2,
+            name='Team DC',
+            description='Justice League United',
+        )
+        # Re-fetch to get clean integer PKs (djongo can return ObjectId on save)
+        team_marvel = Team.objects.get(pk=1)
+        team_dc = Team.objects.get(pk=2)
+        self.stdout.write(self.style.SUCCESS('Inserted 2 teams'))
+
+        # Create Users using Django ORM
+        self.stdout.write('Inserting users...')
+        users_info = [
+            # Team Marvel
+            (1, 'Tony Stark', 'ironman@avengers.com', team_marvel, '🦾', 'advanced'),
+            (2, 'Steve Rogers', 'captain@avengers.com', team_marvel, '🛡️', 'advanced'),
+            (3, 'Natasha Romanoff', 'blackwidow@avengers.com', team_marvel, '🕷️', 'advanced'),
+            (4, 'Bruce Banner', 'hulk@avengers.com', team_marvel, '💚', 'advanced'),
+            (5, 'Thor Odinson', 'thor@asgard.com', team_marvel, '⚡', 'god-tier'),
+            # Team DC
+            (6, 'Clark Kent', 'superman@justiceleague.com', team_dc, '🦸', 'god-tier'),
+            (7, 'Bruce Wayne', 'batman@gotham.com', team_dc, '🦇', 'advanced'),
+            (8, 'Diana Prince', 'wonderwoman@themyscira.com', team_dc, '⭐', 'god-tier'),
+            (9, 'Barry Allen', 'flash@speedforce.com', team_dc, '⚡', 'advanced'),
+            (10, 'Arthur Curry', 'aquaman@atlantis.com', team_dc, '🔱', 'advanced'),
+        ]
+
+        users = []
+        for uid, name, email, team, avatar, fitness_level in users_info:
+            User.objects.create(
+                id=uid,
+                name=name,
+                email=email,
+                team=team,
+                avatar=avatar,
+                fitness_level=fitness_level,
+            )
+        # Re-fetch users with clean integer PKs
+        users = list(User.objects.all().order_by('id'))
+        self.stdout.write(self.style.SUCCESS(f'Inserted {len(users)} users'))
+
+        # Create Activities using Django ORM
+        self.stdout.write('Inserting activities...')
+        activity_types = ['running', 'cycling', 'swimming', 'strength_training', 'yoga']
+        activities_created = 0
+        activity_id = 1
+        for user in users:
+            num_activities = random.randint(5, 10)
+            for j in range(num_activities):
+                days_ago = random.randint(0, 30)
+                activity_date = timezone.now() - timedelta(days=days_ago)
+                Activity.objects.create(
+                    id=activity_id,
+                    user=user,
+                    activity_type=random.choice(activity_types),
+                    duration=random.randint(15, 120),
+                    date=activity_date,
+                    notes=f'Great workout session #{j + 1}',
+                )
+                activity_id += 1
+                activities_created += 1
+        self.stdout.write(self.style.SUCCESS(f'Inserted {activities_created} activities'))
+
+    def seed_synthetic(self, users, activities_per_user, teams, days, seed, batch_size):
+        """Generate a synthetic dataset of any size with pymongo insert_many."""
+        if min(users, activities_per_user, teams, days - 1, batch_size - 1) < 0:
+            raise CommandError('--users, --activities-per-user and --teams must be >= 0; '
+                               '--days and --batch-size must be >= 1')
+        rng = random.Random(seed)
+        now = timezone.now()
+        total_activities = users * activities_per_user
+        self.stdout.write(
+            f'Generating {teams:,} teams, {users:,} users and {total_activities:,} activities '
+            f'in batches of {batch_size:,}...'
+        )
+
+        first_team = reserve_ids(Team, teams) if teams else None
+        self._insert(Team, (
+            {
+                'id': first_team + i,
+                'name': f'Team {i + 1}',
+                'description': f'Synthetic team #{i + 1}',
+                'created_at': now,
+            }
+            for i in range(teams)
+        ), teams, batch_size)
+
+        first_user = reserve_ids(User, users) if users else None
+        self._insert(User, (
+            {
+                'id': first_user + i,
+                'name': f'Athlete {first_user + i}',
+                'email': f'athlete{first_user + i}@octofit.test',
+                'team_id': first_team + rng.randrange(teams) if teams else None,
+                'avatar': '',
+                'fitness_level': rng.choice(FITNESS_LEVELS),
+                'created_at': now,
+            }
+            for i in range(users)
+        ), users, batch_size)
+
+        def activities():
+            activity_id = reserve_ids(Activity, total_activities) if total_activities else None
+            span = days * 24 * 60 * 60
+            for user_id in range(first_user or 0, (first_user or 0) + users):
+                for _ in range(activities_per_user):
+                    yield {
+                        'id': activity_id,
+                        'user_id': user_id,
+                        'activity_type': rng.choice(ACTIVITY_TYPES),
+                        'duration': float(rng.randint(15, 120)),
+                        'date': now - timedelta(seconds=rng.randrange(span)),
+                        'notes': '',
+                    }
+                    activity_id += 1
+
+        self._insert(Activity, activities(), total_activities, batch_size)
+
+    def _insert(self, model, documents, total, batch_size):
+        """Write ``documents`` in ``batch_size`` chunks, reporting throughput."""
+        collection = get_collection(model)
+        label = model._meta.db_table
+        started = last_report = time.perf_counter()
+        inserted = 0
+        while True:
+            batch = list(islice(documents, batch_size))
+            if not batch:
+                break
+            collection.insert_many(batch, ordered=False)
+            inserted += len(batch)
+            now = time.perf_counter()
+            if now - last_report >= PROGRESS_INTERVAL and inserted < total:
+                last_report = now
+                self.stdout.write(
+                    f'  {label}: {inserted:,}/{total:,} '
+                    f'({inserted / total:.0%}, {inserted / (now - started):,.0f} docs/s)'
+                )
+        elapsed = time.perf_counter() - started
+        rate = f'{inserted / elapsed:,.0f} docs/s' if elapsed else 'n/a'
+        self.stdout.write(self.style.SUCCESS(f'Inserted {inserted:,} {label} in {elapsed:.1f}s ({rate})'))
@@ -0,0 +1,16 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from octofit_tracker import rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily and per-period activity rollups from the activities'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        documents = rollups.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Built {documents:,} rollup documents in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,16 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from octofit_tracker import search
+
+
+class Command(BaseCommand):
+    help = 'Re-index every user, team and workout for /api/search/'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        entries = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {entries:,} users, teams and workouts in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from octofit_tracker import tasks
+
+
+class Command(BaseCommand):
+    help = 'Work off queued background jobs (leaderboard and rollup recomputation)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Worker threads (default: OCTOFIT_TASK_WORKERS, at least 1).',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Run the jobs that are due now in this thread and exit.',
+        )
+
+    def handle(self, *args, **options):
+        if options['once']:
+            started = time.perf_counter()
+            ran = tasks.run_pending()
+            self.stdout.write(self.style.SUCCESS(f'Ran {ran:,} jobs in {time.perf_counter() - started:.1f}s'))
+            return
+
+        size = options['workers'] or max(1, settings.OCTOFIT_TASK_WORKERS)
+        pool = tasks.WorkerPool(size).start()
+        self.stdout.write(f'Running {size} task workers; press Ctrl-C to stop.')
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping...')
+            pool.stop()
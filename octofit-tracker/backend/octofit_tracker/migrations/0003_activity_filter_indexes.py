@@ -0,0 +1,29 @@
+# Generated by Django 4.1.7 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0002_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='activity',
+            name='activity_user_date_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='activity',
+            name='activity_type_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['user', '-date', '-id'], name='activity_user_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['activity_type', '-date', '-id'], name='activity_type_date_id_idx'),
+        ),
+    ]
@@ -46,6 +46,11 @@ class Activity(models.Model):
 
     class Meta:
         db_table = 'activities'
+        indexes = [
+            models.Index(fields=['user', '-date', '-id'], name='activity_user_date_id_idx'),
+            models.Index(fields=['activity_type', '-date', '-id'], name='activity_type_date_id_idx'),
+            models.Index(fields=['-date', '-id'], name='activity_date_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.name} - {self.activity_type} ({self.duration} min)"
@@ -59,6 +64,10 @@ class Leaderboard(models.Model):
     class Meta:
         db_table = 'leaderboard'
         ordering = ['rank']
+        indexes = [
+            models.Index(fields=['rank'], name='leaderboard_rank_idx'),
+            models.Index(fields=['-score', 'user'], name='leaderboard_score_user_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.name} - Rank {self.rank} (Score: {self.score})"
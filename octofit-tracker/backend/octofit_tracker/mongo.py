@@ -0,0 +1,167 @@
+"""
+Direct pymongo access to the collections behind the djongo models.
+
+``get_client`` is the one ``MongoClient`` of the process per database
+alias, built from ``DATABASES[alias]['CLIENT']`` (pool size, timeouts,
+write concern, read preference). The ORM gets it through the
+``octofit_tracker.mongo_backend`` database engine, and pymongo code,
+management commands and the health check through ``get_database``, so
+they all share one tuned connection pool. Async views use a Motor client
+built from the same options (``get_async_database``). ``pool_stats``
+reports how the pools are used.
+"""
+import asyncio
+import os
+import threading
+import time
+import weakref
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.module_loading import import_string
+from pymongo import ReturnDocument, monitoring
+
+_clients = {}
+_clients_lock = threading.Lock()
+# Motor clients are bound to the event loop they were created on.
+_async_clients = weakref.WeakKeyDictionary()
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Connection pool counters, fed by pymongo's CMAP events."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.open = 0
+        self.checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'open_connections': self.open,
+                'checked_out': self.checked_out,
+                'checkouts': self.checkouts,
+                'checkout_failures': self.checkout_failures,
+                'wait_seconds_total': self.wait_seconds,
+                'wait_seconds_max': self.max_wait_seconds,
+            }
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open -= 1
+
+    def connection_check_out_started(self, event):
+        # Check-out happens on the thread that runs the operation.
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        waited = time.perf_counter() - getattr(self._local, 'started', time.perf_counter())
+        with self._lock:
+            self.checked_out += 1
+            self.checkouts += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+
+POOL_STATS = PoolStats()
+
+
+def pool_stats():
+    """Return the counters of the shared connection pools."""
+    return POOL_STATS.snapshot()
+
+
+def get_client(using=DEFAULT_DB_ALIAS):
+    """
+    Return the process-wide ``MongoClient`` for ``using``. A forked worker
+    gets a fresh client, since pymongo clients must not cross a fork.
+    """
+    key = (using, os.getpid())
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                options = dict(settings.DATABASES[using].get('CLIENT', {}))
+                client_class = import_string(settings.OCTOFIT_MONGO_CLIENT_CLASS)
+                client = _clients[key] = client_class(
+                    connect=False, event_listeners=[POOL_STATS], **options
+                )
+    return client
+
+
+def get_async_database(using=DEFAULT_DB_ALIAS):
+    """
+    Return the Motor database for ``using``, with one client per process
+    and event loop, on the same ``CLIENT`` options as ``get_client``.
+    """
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.setdefault(loop, {})
+    if using not in clients:
+        options = dict(settings.DATABASES[using].get('CLIENT', {}))
+        client_class = import_string(settings.OCTOFIT_MONGO_ASYNC_CLIENT_CLASS)
+        clients[using] = client_class(event_listeners=[POOL_STATS], **options)
+    return clients[using][connections[using].settings_dict['NAME']]
+
+
+def get_database(using=DEFAULT_DB_ALIAS):
+    """Return the pymongo ``Database`` djongo is connected to."""
+    connection = connections[using]
+    connection.ensure_connection()
+    return connection.connection
+
+
+def get_collection(model, using=DEFAULT_DB_ALIAS):
+    """Return the pymongo ``Collection`` that stores ``model``."""
+    return get_database(using)[model._meta.db_table]
+
+
+def reserve_ids(model, count, using=DEFAULT_DB_ALIAS):
+    """
+    Reserve ``count`` consecutive primary keys for documents inserted with
+    pymongo, and return the first one.
+
+    djongo keeps its auto-increment counters in the ``__schema__``
+    collection; bumping the same counter keeps later ORM inserts from
+    reusing the reserved ids. The counter is created if migrate has not
+    run yet.
+    """
+    schema = get_database(using)['__schema__'].find_one_and_update(
+        {'name': model._meta.db_table},
+        {
+            '$inc': {'auto.seq': count},
+            '$setOnInsert': {'auto.field_names': [model._meta.pk.column]},
+        },
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return schema['auto']['seq'] - count + 1
@@ -0,0 +1,28 @@
+"""
+djongo on the process-wide client from ``octofit_tracker.mongo``.
+
+djongo builds its own ``MongoClient`` with default pool settings and closes
+it whenever Django closes a connection, which by default is at the end of
+every request. This backend hands djongo the shared, tuned client instead
+and leaves it open, so its pool survives requests and is shared by every
+thread.
+"""
+from django.db import DEFAULT_DB_ALIAS
+from django.db.backends.base.base import NO_DB_ALIAS
+from djongo import base
+
+from octofit_tracker.mongo import get_client
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_new_connection(self, connection_params):
+        # Django's "no database" connection (creating the test database)
+        # has no settings of its own.
+        self.client_connection = get_client(DEFAULT_DB_ALIAS if self.alias == NO_DB_ALIAS else self.alias)
+        database = self.client_connection[connection_params['name']]
+        self.djongo_connection = base.DjongoClient(database, connection_params['enforce_schema'])
+        return database
+
+    def _close(self):
+        # The client is shared by every thread and connection alias.
+        pass
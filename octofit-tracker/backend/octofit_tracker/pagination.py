@@ -0,0 +1,237 @@
+import base64
+import json
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class PageState:
+    """What one ``paginate_*`` call read from the request and fetched."""
+
+    def __init__(self, request, page_size, ordering, fields):
+        self.request = request
+        self.page_size = page_size
+        self.ordering = ordering
+        self.fields = fields
+        self.page = []
+        self.has_next = False
+        self.has_previous = False
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination over a composite ordering.
+
+    Each cursor encodes the ordering values of the row it points at, so the
+    next page is fetched with a range filter such as
+    ``date < d OR (date = d AND id < i)`` instead of an offset. Pages stay
+    stable while rows are inserted and no COUNT query is ever issued.
+
+    Views pick their ordering with a ``keyset_ordering`` attribute, or a
+    ``get_keyset_ordering()`` method when it depends on the request; the
+    last field must be unique (normally ``id``) so that ties are broken.
+
+    Cursors hold ordering values, not positions: when the values themselves
+    change between requests, as leaderboard ranks do when scores move, a
+    walk over ``(rank, id)`` can skip or repeat the entries that moved
+    across the cursor.
+
+    Each call keeps its request state in a fresh ``PageState`` (read back
+    by ``get_paginated_response``), so a reused paginator never carries one
+    request's page size or ordering into the next.
+    """
+    ordering = ('id',)
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    state = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        def fetch(state, ordering, position, reverse, limit):
+            page = queryset.order_by(*ordering)
+            if position is not None:
+                page = page.filter(self._seek_filter(state, position, reverse))
+            return list(page[:limit])
+        return self._paginate(queryset.model, fetch, request, view)
+
+    def paginate_documents(self, model, find, request, view=None):
+        """
+        Paginate a pymongo query instead of a queryset. ``find(query, sort,
+        limit)`` returns row dicts keyed by column for the extra seek
+        ``query``; the rows need the ordering columns.
+        """
+        def fetch(state, ordering, position, reverse, limit):
+            return find(self._seek_documents(state, position, reverse), self._sort(state, ordering), limit)
+        return self._paginate(model, fetch, request, view)
+
+    async def apaginate_documents(self, model, find, request, view=None):
+        """``paginate_documents`` for an async ``find`` coroutine."""
+        started = self._start(model, request, view)
+        if started is None:
+            return None
+        state, ordering, position, reverse = started
+        rows = await find(
+            self._seek_documents(state, position, reverse), self._sort(state, ordering), state.page_size + 1,
+        )
+        return self._finish(state, rows, position, reverse)
+
+    def _paginate(self, model, fetch, request, view):
+        started = self._start(model, request, view)
+        if started is None:
+            return None
+        state, ordering, position, reverse = started
+        return self._finish(state, fetch(state, ordering, position, reverse, state.page_size + 1), position, reverse)
+
+    def _start(self, model, request, view):
+        """Read page size, ordering and cursor; return the state and fetch ordering."""
+        self.state = None
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        ordering = tuple(self.get_ordering(view))
+        fields = [model._meta.get_field(name.lstrip('-')) for name in ordering]
+        state = PageState(request, page_size, ordering, fields)
+
+        position, reverse = self.decode_cursor(request, fields)
+        fetch_ordering = [self._flip(name) for name in ordering] if reverse else ordering
+        return state, fetch_ordering, position, reverse
+
+    def _finish(self, state, rows, position, reverse):
+        has_more = len(rows) > state.page_size
+        rows = rows[:state.page_size]
+
+        if reverse:
+            rows.reverse()
+            state.has_next = position is not None
+            state.has_previous = has_more
+        else:
+            state.has_next = has_more
+            state.has_previous = position is not None
+
+        state.page = rows
+        self.state = state
+        return rows
+
+    def get_ordering(self, view):
+        if hasattr(view, 'get_keyset_ordering'):
+            return view.get_keyset_ordering()
+        return getattr(view, 'keyset_ordering', self.ordering)
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                value = int(request.query_params[self.page_size_query_param])
+            except (KeyError, ValueError):
+                pass
+            else:
+                if value > 0:
+                    return min(value, self.max_page_size)
+        return min(self.page_size, self.max_page_size) if self.page_size else None
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        state = self.state
+        if state is None or not state.has_next or not state.page:
+            return None
+        return self.encode_cursor(state, state.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        state = self.state
+        if state is None or not state.has_previous or not state.page:
+            return None
+        return self.encode_cursor(state, state.page[0], reverse=True)
+
+    def decode_cursor(self, request, fields):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            values = payload['v']
+            if len(values) != len(fields):
+                raise ValueError(encoded)
+            position = [field.to_python(value) for field, value in zip(fields, values)]
+            return position, bool(payload.get('r'))
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, state, obj, reverse):
+        payload = {'v': [self._position_value(field, obj) for field in state.fields]}
+        if reverse:
+            payload['r'] = 1
+        encoded = base64.urlsafe_b64encode(
+            json.dumps(payload, separators=(',', ':')).encode('ascii')
+        ).decode('ascii')
+        url = state.request.build_absolute_uri()
+        url = remove_query_param(url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    @staticmethod
+    def _seek_filter(state, position, reverse):
+        """Build ``(a > x) OR (a = x AND b > y) OR ...`` for the ordering."""
+        ordering = state.ordering
+        clauses = []
+        for i, name in enumerate(ordering):
+            descending = name.startswith('-') != reverse
+            lookup = f"{name.lstrip('-')}__{'lt' if descending else 'gt'}"
+            equal = {
+                ordering[j].lstrip('-'): position[j] for j in range(i)
+            }
+            clauses.append(Q(**equal, **{lookup: position[i]}))
+        return reduce(or_, clauses)
+
+    @staticmethod
+    def _sort(state, ordering):
+        return [(field.column, -1 if name.startswith('-') else 1) for name, field in zip(ordering, state.fields)]
+
+    @staticmethod
+    def _seek_documents(state, position, reverse):
+        """Mongo form of ``_seek_filter``, on the fields' columns."""
+        if position is None:
+            return {}
+        clauses = []
+        for i, (name, field) in enumerate(zip(state.ordering, state.fields)):
+            descending = name.startswith('-') != reverse
+            clause = {state.fields[j].column: position[j] for j in range(i)}
+            clause[field.column] = {'$lt' if descending else '$gt': position[i]}
+            clauses.append(clause)
+        return {'$or': clauses}
+
+    @staticmethod
+    def _position_value(field, obj):
+        """Ordering value of a model instance or a ``.values()`` row."""
+        value = obj[field.attname] if isinstance(obj, dict) else field.value_from_object(obj)
+        return value.isoformat() if hasattr(value, 'isoformat') else value
+
+    @staticmethod
+    def _flip(name):
+        return name[1:] if name.startswith('-') else f'-{name}'
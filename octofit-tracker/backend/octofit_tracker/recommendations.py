@@ -0,0 +1,210 @@
+"""
+Workout recommendations.
+
+Every workout is described by a feature vector: how much of it trains each
+activity type (from keywords in its exercises, name and description,
+weighted by sets) and its difficulty. A user's profile is the duration
+share of each activity type over their recent activities plus their
+``fitness_level``. A recommendation scores all workouts at once::
+
+    score = SIMILARITY_WEIGHT * (workouts @ mix) + (1 - SIMILARITY_WEIGHT) * difficulty_fit
+
+The workout matrix is built once per process and rebuilt when the
+``workouts`` cache version moves. Profiles live in Django's cache and are
+dropped by ``profiles_changed`` when a user's activities or fitness level
+change, so the next request recomputes them unless the ``refresh_profile``
+job (``tasks.users_changed``) has already done so.
+"""
+import json
+import threading
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import caching
+from .models import Activity, User, Workout
+from .mongo import get_collection
+
+ACTIVITY_TYPES = [activity_type for activity_type, _ in Activity.ACTIVITY_TYPES]
+LEVELS = [level for level, _ in Workout.DIFFICULTY_CHOICES]
+SIMILARITY_WEIGHT = 0.7
+
+# Substrings of exercise, name and description text that train each type.
+KEYWORDS = {
+    'running': ('run', 'sprint', 'jog', 'high knees', 'mountain climber', 'parkour', 'cardio'),
+    'cycling': ('cycl', 'bike', 'spin'),
+    'swimming': ('swim', 'water', 'freestyle', 'stroke', 'breath'),
+    'strength_training': (
+        'push-up', 'pull-up', 'squat', 'burpee', 'weight', 'press', 'rope', 'lift', 'lunge',
+        'swing', 'hold', 'jump', 'climb', 'strength', 'circuit',
+    ),
+    'yoga': ('yoga', 'pose', 'salutation', 'stretch', 'flow', 'zen'),
+    'walking': ('walk', 'hike', 'step'),
+}
+
+_PROFILE_KEY = 'octofit:recommend:profile:{}'
+_lock = threading.Lock()
+_index = None
+
+
+def _types_of(text):
+    text = text.lower()
+    return [activity_type for activity_type, words in KEYWORDS.items() if any(word in text for word in words)]
+
+
+def _exercises(value):
+    """The exercise list of a workout document; djongo stores it as JSON text."""
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return []
+    return value if isinstance(value, list) else []
+
+
+def workout_vector(workout):
+    """Unit vector over ``ACTIVITY_TYPES`` of a workout document."""
+    vector = np.zeros(len(ACTIVITY_TYPES))
+    exercises = [exercise for exercise in workout['exercises'] if isinstance(exercise, dict)]
+    for exercise in exercises:
+        types = _types_of(str(exercise.get('name', ''))) or ['other']
+        sets = exercise.get('sets')
+        weight = sets if isinstance(sets, (int, float)) and sets > 0 else 1
+        for activity_type in types:
+            vector[ACTIVITY_TYPES.index(activity_type)] += weight / len(types)
+    # The name and description count like one more, average exercise.
+    title_weight = vector.sum() / len(exercises) if exercises else 1.0
+    for activity_type in _types_of(f"{workout.get('name', '')} {workout.get('description', '')}"):
+        vector[ACTIVITY_TYPES.index(activity_type)] += title_weight
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class WorkoutIndex:
+    """The workouts as parallel arrays, ready for vectorized scoring."""
+
+    def __init__(self, workouts):
+        for workout in workouts:
+            workout['exercises'] = _exercises(workout.get('exercises'))
+        self.workouts = workouts
+        self.vectors = np.array([workout_vector(workout) for workout in workouts]).reshape(-1, len(ACTIVITY_TYPES))
+        self.levels = np.array([_level(workout.get('difficulty'), LEVELS) for workout in workouts], dtype=float)
+
+    def score(self, mix, level):
+        """Return ``(scores, similarities, difficulty_fits)`` of every workout."""
+        similarities = self.vectors @ mix
+        fits = 1.0 - np.abs(self.levels - level) / (len(LEVELS) - 1)
+        return SIMILARITY_WEIGHT * similarities + (1 - SIMILARITY_WEIGHT) * fits, similarities, fits
+
+
+def _level(value, levels):
+    return levels.index(value) if value in levels else 0
+
+
+def get_index():
+    """The ``WorkoutIndex`` of the current workouts, rebuilt after workout writes."""
+    global _index
+    version = caching.get_version('workouts')
+    index = _index
+    if index is None or index[0] != version:
+        with _lock:
+            if _index is None or _index[0] != version:
+                workouts = list(get_collection(Workout).find(
+                    {}, {'_id': False, 'id': True, 'name': True, 'description': True,
+                         'exercises': True, 'difficulty': True},
+                ).sort('id', 1))
+                _index = (version, WorkoutIndex(workouts))
+            index = _index
+    return index[1]
+
+
+def _profile_days():
+    return getattr(settings, 'OCTOFIT_RECOMMENDATION_PROFILE_DAYS', 28)
+
+
+def build_profile(user_id):
+    """
+    ``{'level', 'mix'}`` of a user, or ``None`` if the user does not exist.
+    ``mix`` is the unit vector of their activity duration per type over the
+    last ``OCTOFIT_RECOMMENDATION_PROFILE_DAYS`` days.
+    """
+    user = get_collection(User).find_one({'id': user_id}, {'_id': False, 'fitness_level': True})
+    if user is None:
+        return None
+    since = timezone.now() - timedelta(days=_profile_days())
+    mix = np.zeros(len(ACTIVITY_TYPES))
+    for row in get_collection(Activity).aggregate([
+        {'$match': {'user_id': user_id, 'date': {'$gte': since}}},
+        {'$group': {'_id': '$activity_type', 'duration': {'$sum': '$duration'}}},
+    ]):
+        if row['_id'] in ACTIVITY_TYPES:
+            mix[ACTIVITY_TYPES.index(row['_id'])] = row['duration']
+    norm = np.linalg.norm(mix)
+    return {
+        'level': _level(user.get('fitness_level'), LEVELS),
+        'mix': (mix / norm if norm else mix).tolist(),
+    }
+
+
+def get_profile(user_id):
+    profile = cache.get(_PROFILE_KEY.format(user_id))
+    if profile is None:
+        profile = refresh_profile(user_id)
+    return profile
+
+
+def refresh_profile(user_id):
+    """Build and cache the profile of ``user_id``; ``None`` if the user does not exist."""
+    profile = build_profile(user_id)
+    if profile is not None:
+        cache.set(
+            _PROFILE_KEY.format(user_id), profile,
+            timeout=getattr(settings, 'OCTOFIT_RECOMMENDATION_PROFILE_TIMEOUT', 3600),
+        )
+    return profile
+
+
+def profiles_changed(*user_ids):
+    """Drop the cached profiles of ``user_ids``; the next request rebuilds them."""
+    cache.delete_many([_PROFILE_KEY.format(user_id) for user_id in set(user_ids)])
+
+
+def recommend(user_id, limit=10):
+    """
+    The ``limit`` best workouts for a user, best first, or ``None`` if the
+    user does not exist.
+    """
+    profile = get_profile(user_id)
+    if profile is None:
+        return None
+    index = get_index()
+    mix = np.array(profile['mix'])
+    scores, similarities, fits = index.score(mix, profile['level'])
+    limit = min(limit, len(scores))
+    if limit < len(scores):
+        top = np.argpartition(-scores, limit - 1)[:limit]
+    else:
+        top = np.arange(len(scores))
+    # Best score first; ties keep the lower workout id first.
+    top = top[np.lexsort((top, -scores[top]))]
+    return {
+        'user': user_id,
+        'fitness_level': LEVELS[profile['level']],
+        'profile': {activity_type: round(share, 4) for activity_type, share in zip(ACTIVITY_TYPES, mix) if share},
+        'results': [
+            {
+                'id': str(index.workouts[position]['id']),
+                'name': index.workouts[position]['name'],
+                'description': index.workouts[position].get('description', ''),
+                'exercises': index.workouts[position]['exercises'],
+                'difficulty': index.workouts[position].get('difficulty'),
+                'score': round(float(scores[position]), 4),
+                'similarity': round(float(similarities[position]), 4),
+                'difficulty_fit': round(float(fits[position]), 4),
+            }
+            for position in top
+        ],
+    }
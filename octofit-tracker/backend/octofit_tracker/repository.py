@@ -0,0 +1,95 @@
+"""
+Native pymongo reads for the hot API paths.
+
+djongo parses every ORM query as SQL with sqlparse before translating it
+to Mongo, which dominates simple lookups. With ``OCTOFIT_DATA_BACKEND =
+'native'`` the list and retrieve endpoints of users, activities and the
+leaderboard, and the name lookups of the stats aggregates, query the
+collections directly, projecting only the columns the lean serializers
+render. Rows have the same keys and types as ``QuerySet.values()``, so the
+API output is identical either way; ``'orm'`` (the default) keeps the ORM
+so the two can be benchmarked against each other. ``afind_rows`` and
+``anames`` are the Motor equivalents used by the async views.
+"""
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db import models
+
+from .mongo import get_async_database, get_collection
+
+BACKENDS = ('orm', 'native')
+
+
+def native_enabled():
+    return settings.OCTOFIT_DATA_BACKEND == 'native'
+
+
+def _datetime_columns(model):
+    return [field.column for field in model._meta.concrete_fields if isinstance(field, models.DateTimeField)]
+
+
+def _rows(model, cursor, columns):
+    """Turn documents into ``.values()``-style rows; Mongo hands back naive UTC."""
+    datetime_columns = [column for column in _datetime_columns(model) if column in columns]
+    rows = []
+    for document in cursor:
+        row = {column: document.get(column) for column in columns}
+        for column in datetime_columns:
+            if row[column] is not None and row[column].tzinfo is None:
+                row[column] = row[column].replace(tzinfo=dt_timezone.utc)
+        rows.append(row)
+    return rows
+
+
+def sort(model, ordering):
+    """Mongo sort spec for ORM-style ``ordering`` field names."""
+    return [
+        (model._meta.get_field(name.lstrip('-')).column, -1 if name.startswith('-') else 1)
+        for name in ordering
+    ]
+
+
+def find_rows(model, columns, query, sort=None, limit=None):
+    projection = dict.fromkeys(columns, True)
+    projection['_id'] = False
+    cursor = get_collection(model).find(query, projection, sort=sort, limit=limit or 0)
+    return _rows(model, cursor, columns)
+
+
+def find_row(model, columns, query):
+    rows = find_rows(model, columns, query, limit=1)
+    return rows[0] if rows else None
+
+
+def names(model, pks, *extra):
+    """Return ``{pk: (name, *extra)}`` for ``pks`` in one query."""
+    pks = [pk for pk in pks if pk is not None]
+    if not pks:
+        return {}
+    if not native_enabled():
+        return {
+            row[0]: row[1:]
+            for row in model.objects.filter(pk__in=pks).values_list('id', 'name', *extra)
+        }
+    columns = [model._meta.get_field(name).column for name in ('id', 'name', *extra)]
+    rows = find_rows(model, columns, {'id': {'$in': pks}})
+    return {row['id']: tuple(row[column] for column in columns[1:]) for row in rows}
+
+
+async def afind_rows(model, columns, query, sort=None, limit=None):
+    """``find_rows`` on the Motor client, for async views."""
+    projection = dict.fromkeys(columns, True)
+    projection['_id'] = False
+    cursor = get_async_database()[model._meta.db_table].find(query, projection, sort=sort, limit=limit or 0)
+    return _rows(model, await cursor.to_list(length=None), columns)
+
+
+async def anames(model, pks, *extra):
+    """``names`` on the Motor client, for async views."""
+    pks = [pk for pk in pks if pk is not None]
+    if not pks:
+        return {}
+    columns = [model._meta.get_field(name).column for name in ('id', 'name', *extra)]
+    rows = await afind_rows(model, columns, {'id': {'$in': pks}})
+    return {row['id']: tuple(row[column] for column in columns[1:]) for row in rows}
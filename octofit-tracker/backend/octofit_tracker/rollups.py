@@ -0,0 +1,363 @@
+"""
+Per-user and per-team daily activity rollups.
+
+Two collections hold one document per user (``rollups_user_daily``) and
+per team (``rollups_team_daily``) and UTC day::
+
+    {'_id': '7:2026-03-02', 'user_id': 7, 'team_id': 2, 'day': datetime(2026, 3, 2),
+     'total_duration': 75.0, 'count': 2,
+     'types': {'running': {'duration': 45.0, 'count': 1}, 'yoga': {...}}}
+
+Activity writes adjust them with ``$inc`` upserts, batched into one
+``bulk_write`` per collection, so dashboards aggregate O(days) documents
+instead of O(activities). ORM writes reach them through the model signals
+in ``signals.py``; code that inserts activities with pymongo calls
+``activities_inserted`` itself. Team documents credit the user's team;
+when a user switches teams or a team is deleted, the history moves with
+them. Users without a team are rolled up under ``team_id: None``.
+
+A third collection (``rollups_user_periods``) keeps each user's score for
+the current and previous day, ISO week and calendar month::
+
+    {'_id': 'week:2026-W10:7', 'window': 'week', 'period': '2026-W10', 'user_id': 7,
+     'score': 75.0, 'count': 2, 'expires_at': datetime(2026, 3, 16)}
+
+Writes credit the period their activity falls in, so a new period starts
+empty and fills as activities arrive; nothing is rescanned when a period
+ends. A TTL index drops each period one period length after it ends.
+
+``rebuild`` recomputes the collections from the activities (the
+``rebuild_rollups`` command) and marks them ready; until then readers fall
+back to scanning activities. Like ``rebuild_leaderboard`` it is meant for
+bulk loads and repairing drift, and writes made while it runs may be lost.
+"""
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.utils import timezone
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+
+from . import caching
+from .models import Activity, User
+from .mongo import get_async_database, get_collection, get_database
+
+USER_DAILY = 'rollups_user_daily'
+TEAM_DAILY = 'rollups_team_daily'
+USER_PERIODS = 'rollups_user_periods'
+STATE = 'rollups_state'
+
+WINDOWS = ('day', 'week', 'month')
+
+# Collection -> (name, keys, options) of the indexes readers rely on.
+INDEXES = {
+    USER_DAILY: [
+        (f'{USER_DAILY}_user_day_idx', [('user_id', ASCENDING), ('day', ASCENDING)], {}),
+        (f'{USER_DAILY}_day_idx', [('day', ASCENDING)], {}),
+    ],
+    TEAM_DAILY: [
+        (f'{TEAM_DAILY}_team_day_idx', [('team_id', ASCENDING), ('day', ASCENDING)], {}),
+        (f'{TEAM_DAILY}_day_idx', [('day', ASCENDING)], {}),
+    ],
+    USER_PERIODS: [
+        (f'{USER_PERIODS}_rank_idx', [
+            ('window', ASCENDING), ('period', ASCENDING), ('score', DESCENDING), ('user_id', ASCENDING),
+        ], {}),
+        (f'{USER_PERIODS}_expiry_idx', [('expires_at', ASCENDING)], {'expireAfterSeconds': 0}),
+    ],
+}
+
+
+def _utc(value):
+    return value.astimezone(dt_timezone.utc).replace(tzinfo=None) if timezone.is_aware(value) else value
+
+
+def day_of(value):
+    """The UTC day of ``value``, as the naive midnight Mongo stores."""
+    value = _utc(value)
+    return datetime(value.year, value.month, value.day)
+
+
+def day_range(date_after=None, date_before=None):
+    """
+    Return ``(first_day, last_day)`` when the bounds fall on UTC day
+    boundaries, as bare ``YYYY-MM-DD`` bounds do, or ``None`` when only
+    the raw activities can answer them.
+    """
+    first = last = None
+    if date_after is not None:
+        first = day_of(date_after)
+        if _utc(date_after) != first:
+            return None
+    if date_before is not None:
+        last = day_of(date_before)
+        end = _utc(date_before)
+        if (end.hour, end.minute, end.second, end.microsecond) != (23, 59, 59, 999999):
+            return None
+    return first, last
+
+
+def day_match(date_after=None, date_before=None):
+    """``$match`` stages on ``day``; the bounds must pass ``day_range``."""
+    first, last = day_range(date_after, date_before)
+    bounds = {}
+    if first is not None:
+        bounds['$gte'] = first
+    if last is not None:
+        bounds['$lte'] = last
+    return [{'$match': {'day': bounds}}] if bounds else []
+
+
+def period(window, moment):
+    """``(key, first_day, next_first_day)`` of the ``window`` period containing ``moment``."""
+    day = day_of(moment)
+    if window == 'day':
+        first, following = day, day + timedelta(days=1)
+    elif window == 'week':
+        first = day - timedelta(days=day.weekday())
+        following = first + timedelta(days=7)
+    elif window == 'month':
+        first = day.replace(day=1)
+        following = (first + timedelta(days=32)).replace(day=1)
+    else:
+        raise ValueError(window)
+    key = {'day': '%Y-%m-%d', 'week': '%G-W%V', 'month': '%Y-%m'}[window]
+    return first.strftime(key), first, following
+
+
+def _period_documents(user_id, day, now):
+    """
+    Yield ``(_id, fields)`` of the period documents that ``day`` belongs
+    to, skipping periods that have already expired.
+    """
+    for window in WINDOWS:
+        key, first, following = period(window, day)
+        expires_at = following + (following - first)
+        if expires_at > now:
+            yield f'{window}:{key}:{user_id}', {
+                'window': window, 'period': key, 'user_id': user_id, 'expires_at': expires_at,
+            }
+
+
+def ready():
+    """Whether ``rebuild`` has populated the rollups."""
+    return get_database()[STATE].find_one({'_id': 'daily'}) is not None
+
+
+async def aready():
+    return await get_async_database()[STATE].find_one({'_id': 'daily'}) is not None
+
+
+def collection(name):
+    return get_database()[name]
+
+
+def _key(owner_id, day):
+    return f"{'none' if owner_id is None else owner_id}:{day:%Y-%m-%d}"
+
+
+def _add(increments, activity_type, duration, count):
+    increments['total_duration'] += duration
+    increments['count'] += count
+    increments[f'types.{activity_type}.duration'] += duration
+    increments[f'types.{activity_type}.count'] += count
+
+
+def _flatten(document, sign=1):
+    """The ``$inc`` that adds (or with ``sign=-1`` removes) a rollup document."""
+    increments = Counter()
+    for activity_type, totals in document.get('types', {}).items():
+        _add(increments, activity_type, sign * totals['duration'], sign * totals['count'])
+    return dict(increments)
+
+
+def apply(changes):
+    """
+    Apply ``(user_id, activity_type, duration, date, sign)`` changes, where
+    ``sign`` is 1 for an added activity and -1 for a removed one.
+    """
+    changes = list(changes)
+    if not changes:
+        return
+    teams = {
+        user['id']: user.get('team_id')
+        for user in get_collection(User).find(
+            {'id': {'$in': list({change[0] for change in changes})}}, {'_id': False, 'id': True, 'team_id': True}
+        )
+    }
+    users, team_totals = defaultdict(Counter), defaultdict(Counter)
+    for user_id, activity_type, duration, date, sign in changes:
+        day = day_of(date)
+        _add(users[user_id, day], activity_type, sign * duration, sign)
+        _add(team_totals[teams.get(user_id), day], activity_type, sign * duration, sign)
+
+    periods, fields = defaultdict(Counter), {}
+    now = _utc(timezone.now())
+    for (user_id, day), increments in users.items():
+        for key, document in _period_documents(user_id, day, now):
+            periods[key]['score'] += increments['total_duration']
+            periods[key]['count'] += increments['count']
+            fields[key] = document
+
+    updates = {
+        USER_DAILY: {
+            _key(user_id, day): {
+                '$inc': dict(increments),
+                '$set': {'user_id': user_id, 'day': day, 'team_id': teams.get(user_id)},
+            }
+            for (user_id, day), increments in users.items()
+        },
+        TEAM_DAILY: {
+            _key(team_id, day): {'$inc': dict(increments), '$set': {'team_id': team_id, 'day': day}}
+            for (team_id, day), increments in team_totals.items()
+        },
+        USER_PERIODS: {
+            key: {'$inc': dict(increments), '$set': fields[key]} for key, increments in periods.items()
+        },
+    }
+    removed = any(change[4] < 0 for change in changes)
+    for name, documents in updates.items():
+        if not documents:
+            continue
+        collection(name).bulk_write(
+            [UpdateOne({'_id': key}, update, upsert=True) for key, update in documents.items()], ordered=False,
+        )
+        if removed:
+            collection(name).delete_many({'_id': {'$in': list(documents)}, 'count': {'$lte': 0}})
+    # Only the period boards read these; ranks that move are invalidated
+    # by whoever moves them (``leaderboard.apply_score_delta``).
+    caching.invalidate('rollups')
+
+
+def _change(activity, sign):
+    return (activity.user_id, activity.activity_type, activity.duration, activity.date, sign)
+
+
+def activity_created(activity):
+    apply([_change(activity, 1)])
+
+
+def activity_updated(previous, activity):
+    """``previous`` is a copy of the activity taken before the update."""
+    apply([_change(previous, -1), _change(activity, 1)])
+
+
+def activity_deleted(activity):
+    apply([_change(activity, -1)])
+
+
+def activities_inserted(documents):
+    """Credit activity documents inserted with pymongo."""
+    apply(
+        (document['user_id'], document['activity_type'], document['duration'], document['date'], 1)
+        for document in documents
+    )
+
+
+def user_team_changed(user_id, old_team_id, new_team_id):
+    """Move a user's daily totals from their old team to the new one."""
+    if old_team_id == new_team_id:
+        return
+    operations = []
+    for document in collection(USER_DAILY).find({'user_id': user_id}):
+        for team_id, sign in ((old_team_id, -1), (new_team_id, 1)):
+            operations.append(UpdateOne(
+                {'_id': _key(team_id, document['day'])},
+                {'$inc': _flatten(document, sign), '$set': {'team_id': team_id, 'day': document['day']}},
+                upsert=True,
+            ))
+    if operations:
+        collection(TEAM_DAILY).bulk_write(operations, ordered=False)
+        collection(TEAM_DAILY).delete_many({'team_id': old_team_id, 'count': {'$lte': 0}})
+    collection(USER_DAILY).update_many({'user_id': user_id}, {'$set': {'team_id': new_team_id}})
+
+
+def team_deleted(team_id):
+    """Move a deleted team's totals to ``team_id: None``, like its members."""
+    documents = list(collection(TEAM_DAILY).find({'team_id': team_id}))
+    if documents:
+        collection(TEAM_DAILY).bulk_write([
+            UpdateOne(
+                {'_id': _key(None, document['day'])},
+                {'$inc': _flatten(document), '$set': {'team_id': None, 'day': document['day']}},
+                upsert=True,
+            )
+            for document in documents
+        ], ordered=False)
+        collection(TEAM_DAILY).delete_many({'team_id': team_id})
+    collection(USER_DAILY).update_many({'team_id': team_id}, {'$set': {'team_id': None}})
+
+
+def clear():
+    """Drop the rollups; readers fall back to the activities until ``rebuild``."""
+    for name in (STATE, USER_DAILY, TEAM_DAILY, USER_PERIODS):
+        collection(name).drop()
+    caching.invalidate('leaderboard', 'rollups')
+
+
+def rebuild():
+    """
+    Recompute the rollups from the activities in one ``$group`` pass and
+    swap them in. Returns the number of rollup documents.
+    """
+    teams = {
+        user['id']: user.get('team_id')
+        for user in get_collection(User).find({}, {'_id': False, 'id': True, 'team_id': True})
+    }
+    users, team_totals = defaultdict(Counter), defaultdict(Counter)
+    for row in get_collection(Activity).aggregate([
+        {'$group': {
+            '_id': {
+                'user_id': '$user_id',
+                'day': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$date'}},
+                'activity_type': '$activity_type',
+            },
+            'duration': {'$sum': '$duration'},
+            'count': {'$sum': 1},
+        }},
+    ], allowDiskUse=True):
+        key = row['_id']
+        day = datetime.strptime(key['day'], '%Y-%m-%d')
+        _add(users[key['user_id'], day], key['activity_type'], row['duration'], row['count'])
+        _add(team_totals[teams.get(key['user_id']), day], key['activity_type'], row['duration'], row['count'])
+
+    built = {USER_DAILY: [], TEAM_DAILY: [], USER_PERIODS: {}}
+    for name, owner, totals in ((USER_DAILY, 'user_id', users), (TEAM_DAILY, 'team_id', team_totals)):
+        for (owner_id, day), increments in totals.items():
+            document = {'_id': _key(owner_id, day), owner: owner_id, 'day': day, 'types': {}}
+            if owner == 'user_id':
+                document['team_id'] = teams.get(owner_id)
+            for field, value in increments.items():
+                if field.startswith('types.'):
+                    _, activity_type, metric = field.split('.')
+                    document['types'].setdefault(activity_type, {})[metric] = value
+                else:
+                    document[field] = value
+            built[name].append(document)
+
+    now = _utc(timezone.now())
+    for (user_id, day), increments in users.items():
+        for key, fields in _period_documents(user_id, day, now):
+            document = built[USER_PERIODS].setdefault(key, {'_id': key, **fields, 'score': 0, 'count': 0})
+            document['score'] += increments['total_duration']
+            document['count'] += increments['count']
+    built[USER_PERIODS] = list(built[USER_PERIODS].values())
+
+    for name, documents in built.items():
+        staging = collection(f'{name}_rebuild')
+        staging.drop()
+        if documents:
+            staging.insert_many(documents, ordered=False)
+        for index_name, keys, options in INDEXES[name]:
+            staging.create_index(keys, name=index_name, **options)
+        if documents:
+            staging.rename(name, dropTarget=True)
+        else:
+            staging.drop()
+            collection(name).delete_many({})
+
+    collection(STATE).replace_one(
+        {'_id': 'daily'}, {'_id': 'daily', 'built_at': timezone.now()}, upsert=True,
+    )
+    # The all-time team board reads the rollups too once they are ready.
+    caching.invalidate('leaderboard', 'rollups')
+    return sum(len(documents) for documents in built.values())
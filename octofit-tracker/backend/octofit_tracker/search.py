@@ -0,0 +1,149 @@
+"""
+Typeahead search over users, teams and workouts.
+
+The ``search_index`` collection holds one document per searchable row::
+
+    {'_id': 'user:7', 'kind': 'user', 'ref': 7, 'label': 'Peter Parker',
+     'detail': 'spidey@avengers.com', 'terms': ['peter', 'parker', 'spidey', 'avengers', 'com']}
+
+``terms`` carries a multikey index. Every word of a query but the last
+must be a term; the last one is a prefix, matched as a range on the index
+(``'par'`` -> ``{'$elemMatch': {'$gte': 'par', '$lt': 'pas'}}``), so a
+lookup reads only the index entries it returns instead of scanning the
+collections with regexes.
+
+ORM writes keep it current through the model signals in ``signals.py``.
+Rows inserted with pymongo are picked up by ``rebuild`` (the
+``rebuild_search_index`` command, also run by ``populate_db``).
+"""
+import re
+import unicodedata
+
+from pymongo import ASCENDING
+
+from .models import Team, User, Workout
+from .mongo import get_collection, get_database
+
+SEARCH_INDEX = 'search_index'
+KINDS = ('user', 'team', 'workout')
+
+INDEXES = {
+    SEARCH_INDEX: [
+        (f'{SEARCH_INDEX}_terms_idx', [('terms', ASCENDING)], {}),
+        (f'{SEARCH_INDEX}_kind_terms_idx', [('kind', ASCENDING), ('terms', ASCENDING)], {}),
+    ],
+}
+
+# kind -> (model, label field, fields whose words are indexed, detail field)
+SOURCES = {
+    'user': (User, 'name', ('name', 'email'), 'email'),
+    'team': (Team, 'name', ('name',), 'description'),
+    'workout': (Workout, 'name', ('name', 'description'), 'description'),
+}
+KIND_OF = {model: kind for kind, (model, *_) in SOURCES.items()}
+
+_WORD = re.compile(r'\w+')
+_REBUILD_BATCH = 10000
+
+
+def words(text):
+    """Lowercased words of ``text`` with accents stripped."""
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode()
+    return _WORD.findall(text.lower())
+
+
+def collection():
+    return get_database()[SEARCH_INDEX]
+
+
+def _document(kind, row):
+    _, label, indexed, detail = SOURCES[kind]
+    terms = []
+    for field in indexed:
+        terms.extend(words(row.get(field)))
+    return {
+        '_id': f"{kind}:{row['id']}",
+        'kind': kind,
+        'ref': row['id'],
+        'label': row.get(label) or '',
+        'detail': row.get(detail) or '',
+        'terms': list(dict.fromkeys(terms)),
+    }
+
+
+def _projection(kind):
+    _, label, indexed, detail = SOURCES[kind]
+    return {'_id': False, 'id': True, **{field: True for field in (label, detail, *indexed)}}
+
+
+def instance_saved(instance):
+    kind = KIND_OF[type(instance)]
+    _, label, indexed, detail = SOURCES[kind]
+    row = {'id': instance.pk, **{field: getattr(instance, field) for field in (label, detail, *indexed)}}
+    collection().replace_one({'_id': f'{kind}:{instance.pk}'}, _document(kind, row), upsert=True)
+
+
+def instance_deleted(instance):
+    collection().delete_one({'_id': f'{KIND_OF[type(instance)]}:{instance.pk}'})
+
+
+def _successor(prefix):
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def lookup(query, kinds=KINDS, limit=10):
+    """
+    Entries matching ``query`` as you type, at most ``limit``: labels that
+    start with the query first, then shorter labels.
+    """
+    *complete, prefix = words(query) or ['']
+    if not prefix:
+        return []
+    conditions = [{'terms': word} for word in complete]
+    # $elemMatch keeps both bounds on the same term (and tight index bounds).
+    conditions.append({'terms': {'$elemMatch': {'$gte': prefix, '$lt': _successor(prefix)}}})
+    if set(kinds) != set(KINDS):
+        conditions.append({'kind': {'$in': list(kinds)}})
+    # Over-fetch a little so the ordering below has a choice to make.
+    entries = list(collection().find(
+        {'$and': conditions}, {'_id': False, 'kind': True, 'ref': True, 'label': True, 'detail': True},
+    ).limit(limit * 4))
+    typed = ' '.join(words(query))
+    entries.sort(key=lambda entry: (
+        not ' '.join(words(entry['label'])).startswith(typed), len(entry['label']), entry['label'], entry['ref'],
+    ))
+    return entries[:limit]
+
+
+def refs(kind, query, limit=1000):
+    """Primary keys of ``kind`` rows matching ``query``, for admin searches."""
+    return [entry['ref'] for entry in lookup(query, (kind,), limit)]
+
+
+def rebuild():
+    """
+    Re-index every user, team and workout into a staging collection and swap
+    it in. Returns the number of entries.
+    """
+    staging = get_database()[f'{SEARCH_INDEX}_rebuild']
+    staging.drop()
+    total = 0
+    for kind, (model, *_) in SOURCES.items():
+        batch = []
+        for row in get_collection(model).find({}, _projection(kind)).batch_size(_REBUILD_BATCH):
+            batch.append(_document(kind, row))
+            if len(batch) == _REBUILD_BATCH:
+                staging.insert_many(batch, ordered=False)
+                total += len(batch)
+                batch = []
+        if batch:
+            staging.insert_many(batch, ordered=False)
+            total += len(batch)
+    for index_name, keys, options in INDEXES[SEARCH_INDEX]:
+        staging.create_index(keys, name=index_name, **options)
+    if total:
+        staging.rename(SEARCH_INDEX, dropTarget=True)
+    else:
+        staging.drop()
+        collection().delete_many({})
+    return total
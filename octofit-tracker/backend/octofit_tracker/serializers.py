@@ -1,5 +1,7 @@
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 from bson import ObjectId
+from .instrumentation import timed
 from .models import User, Team, Activity, Leaderboard, Workout
 
 
@@ -16,23 +18,123 @@ class ObjectIdField(serializers.Field):
             raise serializers.ValidationError('Invalid ObjectId')
 
 
-class TeamSerializer(serializers.ModelSerializer):
+def parse_pk(data):
+    """
+    ``data`` as an integer primary key. Raises ``TypeError`` or
+    ``ValueError`` for anything but a whole number, so ``1.5`` and ``True``
+    are rejected rather than read as user 1.
+    """
+    if isinstance(data, bool) or not isinstance(data, (int, float, str)):
+        raise TypeError(data)
+    if isinstance(data, float) and not data.is_integer():
+        raise ValueError(data)
+    return int(data)
+
+
+class PreloadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Primary key field that resolves against a ``{pk: instance}`` map in the
+    serializer context when one is given under ``context_key``, so
+    validating a list costs one bulk lookup instead of one query per item.
+    """
+
+    def __init__(self, context_key, **kwargs):
+        self.context_key = context_key
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        preloaded = self.context.get(self.context_key)
+        if preloaded is None:
+            return super().to_internal_value(data)
+        try:
+            return preloaded[parse_pk(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
+def _names(value):
+    return [name.strip() for name in (value or '').split(',') if name.strip()]
+
+
+def selected_fields(params, available):
+    """
+    The names out of ``available`` (in that order) that ``?fields=`` keeps
+    and ``?exclude=`` does not drop, or ``None`` when neither is given.
+    Both take comma-separated field names.
+    """
+    fields, exclude = _names(params.get('fields')), _names(params.get('exclude'))
+    if not fields and not exclude:
+        return None
+    for param, names in (('fields', fields), ('exclude', exclude)):
+        unknown = [name for name in names if name not in available]
+        if unknown:
+            raise serializers.ValidationError({
+                param: f'Unknown field(s): {", ".join(unknown)}. Choose from: {", ".join(available)}.'
+            })
+    return [name for name in available if (not fields or name in fields) and name not in exclude]
+
+
+class FieldSelectionMixin:
+    """
+    Serializer that drops the fields a read request leaves out with
+    ``?fields=``/``?exclude=`` before serializing, so their method fields
+    and related lookups never run. Writes always see every field.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self._context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return
+        selected = selected_fields(getattr(request, 'query_params', request.GET), list(self.fields))
+        if selected is not None:
+            for name in set(self.fields) - set(selected):
+                self.fields.pop(name)
+
+
+class TimedListSerializer(serializers.ListSerializer):
+    """List serializer whose output time is reported as ``serialize``."""
+
+    @property
+    def data(self):
+        with timed('serialize'):
+            return super().data
+
+
+class TimedModelSerializer(FieldSelectionMixin, serializers.ModelSerializer):
+    """
+    Model serializer whose output time is reported as ``serialize``;
+    subclasses set ``Meta.list_serializer_class = TimedListSerializer`` so
+    ``many=True`` is timed too. Reads honour ``?fields=``/``?exclude=``.
+    """
+
+    @property
+    def data(self):
+        with timed('serialize'):
+            return super().data
+
+
+class TeamSerializer(TimedModelSerializer):
     id = serializers.SerializerMethodField()
 
     class Meta:
         model = Team
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'name', 'description', 'created_at']
 
     def get_id(self, obj):
         return str(obj.pk)
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedModelSerializer):
     id = serializers.SerializerMethodField()
     team_name = serializers.SerializerMethodField()
 
     class Meta:
         model = User
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'name', 'email', 'team', 'team_name', 'avatar', 'fitness_level', 'created_at']
 
     def get_id(self, obj):
@@ -44,12 +146,14 @@ class UserSerializer(serializers.ModelSerializer):
         return None
 
 
-class ActivitySerializer(serializers.ModelSerializer):
+class ActivitySerializer(TimedModelSerializer):
     id = serializers.SerializerMethodField()
+    user = PreloadedPrimaryKeyRelatedField('users', queryset=User.objects.all())
     user_name = serializers.SerializerMethodField()
 
     class Meta:
         model = Activity
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'user', 'user_name', 'activity_type', 'duration', 'date', 'notes']
 
     def get_id(self, obj):
@@ -59,13 +163,14 @@ class ActivitySerializer(serializers.ModelSerializer):
         return obj.user.name if obj.user else None
 
 
-class LeaderboardSerializer(serializers.ModelSerializer):
+class LeaderboardSerializer(TimedModelSerializer):
     id = serializers.SerializerMethodField()
     user_name = serializers.SerializerMethodField()
     team_name = serializers.SerializerMethodField()
 
     class Meta:
         model = Leaderboard
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'user', 'user_name', 'team_name', 'score', 'rank']
 
     def get_id(self, obj):
@@ -80,11 +185,12 @@ class LeaderboardSerializer(serializers.ModelSerializer):
         return None
 
 
-class WorkoutSerializer(serializers.ModelSerializer):
+class WorkoutSerializer(TimedModelSerializer):
     id = serializers.SerializerMethodField()
 
     class Meta:
         model = Workout
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'name', 'description', 'exercises', 'difficulty']
 
     def get_id(self, obj):
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
 import os
+from importlib.util import find_spec
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -59,6 +60,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'octofit_tracker.instrumentation.PerformanceMiddleware',
+    'octofit_tracker.renderers.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -93,16 +96,118 @@ WSGI_APPLICATION = 'octofit_tracker.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+_write_concern = os.environ.get('OCTOFIT_MONGO_WRITE_CONCERN', '1')
+
 DATABASES = {
     'default': {
-        'ENGINE': 'djongo',
+        # djongo, on the shared client from octofit_tracker/mongo.py
+        'ENGINE': 'octofit_tracker.mongo_backend',
         'NAME': 'octofit_db',
         'ENFORCE_SCHEMA': False,
+        # MongoClient options of the one client (and connection pool) per
+        # process shared by the ORM, pymongo code and management commands.
+        # Size maxPoolSize to the threads of one worker process.
         'CLIENT': {
-            'host': 'localhost',
-            'port': 27017,
+            'host': os.environ.get('OCTOFIT_MONGO_HOST', 'localhost'),
+            'port': int(os.environ.get('OCTOFIT_MONGO_PORT', '27017')),
+            'maxPoolSize': int(os.environ.get('OCTOFIT_MONGO_MAX_POOL_SIZE', '50')),
+            'minPoolSize': int(os.environ.get('OCTOFIT_MONGO_MIN_POOL_SIZE', '0')),
+            'connectTimeoutMS': int(os.environ.get('OCTOFIT_MONGO_CONNECT_TIMEOUT_MS', '5000')),
+            'serverSelectionTimeoutMS': int(os.environ.get('OCTOFIT_MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000')),
+            'socketTimeoutMS': int(os.environ.get('OCTOFIT_MONGO_SOCKET_TIMEOUT_MS', '30000')),
+            'waitQueueTimeoutMS': int(os.environ.get('OCTOFIT_MONGO_WAIT_QUEUE_TIMEOUT_MS', '5000')),
+            'w': int(_write_concern) if _write_concern.isdigit() else _write_concern,
+            'readPreference': os.environ.get('OCTOFIT_MONGO_READ_PREFERENCE', 'primary'),
+        }
+    }
+}
+
+# Dotted paths of the client classes; the benchmark settings swap in mongomock.
+OCTOFIT_MONGO_CLIENT_CLASS = 'pymongo.MongoClient'
+# Used by the async views (async_views.py).
+OCTOFIT_MONGO_ASYNC_CLIENT_CLASS = 'motor.motor_asyncio.AsyncIOMotorClient'
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# Backs the response cache of the leaderboard, teams and workouts endpoints.
+# Local memory is per process; set OCTOFIT_CACHE_DIR to share a file-based
+# cache (and its invalidations) between worker processes.
+
+OCTOFIT_CACHE_DIR = os.environ.get('OCTOFIT_CACHE_DIR')
+if OCTOFIT_CACHE_DIR:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': OCTOFIT_CACHE_DIR,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'octofit',
         }
     }
+
+# Seconds a cached API response is kept; writes invalidate it sooner.
+OCTOFIT_RESPONSE_CACHE_TIMEOUT = 300
+
+
+# Data backend of the hot read paths (octofit_tracker/repository.py):
+# 'orm' goes through djongo, 'native' queries the collections with pymongo.
+
+OCTOFIT_DATA_BACKEND = os.environ.get('OCTOFIT_DATA_BACKEND', 'orm')
+
+
+# Performance instrumentation
+# PerformanceMiddleware adds Server-Timing headers, logs a JSON line per
+# request on 'octofit_tracker.performance' and feeds the /metrics histograms.
+# Only the sampled fraction of requests is instrumented. Per-request lines
+# are INFO; requests slower than OCTOFIT_SLOW_REQUEST_MS log at WARNING.
+
+OCTOFIT_METRICS_SAMPLE_RATE = float(os.environ.get('OCTOFIT_METRICS_SAMPLE_RATE', '0.1'))
+OCTOFIT_SLOW_REQUEST_MS = float(os.environ.get('OCTOFIT_SLOW_REQUEST_MS', '1000'))
+
+# Live leaderboard push (live.py). InProcessBroker only reaches streams in
+# the process that made the write; use MongoBroker with several workers.
+OCTOFIT_LIVE_BROKER = os.environ.get('OCTOFIT_LIVE_BROKER', 'octofit_tracker.live.InProcessBroker')
+OCTOFIT_LIVE_COALESCE_MS = float(os.environ.get('OCTOFIT_LIVE_COALESCE_MS', '250'))
+OCTOFIT_LIVE_HISTORY = 100
+OCTOFIT_LIVE_TOP_N = int(os.environ.get('OCTOFIT_LIVE_TOP_N', '100'))
+OCTOFIT_LIVE_KEEPALIVE_SECONDS = 15
+
+# Workout recommendations (recommendations.py): the activity window that
+# shapes a user's profile, and how long a cached profile is kept at most.
+OCTOFIT_RECOMMENDATION_PROFILE_DAYS = 28
+OCTOFIT_RECOMMENDATION_PROFILE_TIMEOUT = 3600
+
+# Background jobs (tasks.py). Each process runs OCTOFIT_TASK_WORKERS worker
+# threads; with 0 a job runs in the thread that enqueued it. Failed jobs are
+# retried up to OCTOFIT_TASK_MAX_ATTEMPTS times, waiting
+# OCTOFIT_TASK_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1) in between.
+OCTOFIT_TASK_WORKERS = int(os.environ.get('OCTOFIT_TASK_WORKERS', '0'))
+OCTOFIT_TASK_MAX_ATTEMPTS = 5
+OCTOFIT_TASK_RETRY_BACKOFF_SECONDS = 2
+# A running job not finished within the lease is handed to another worker.
+OCTOFIT_TASK_LEASE_SECONDS = 600
+
+# Columnar activity snapshot written by export_snapshot (snapshot.py).
+OCTOFIT_SNAPSHOT_DIR = os.environ.get('OCTOFIT_SNAPSHOT_DIR') or BASE_DIR / 'snapshot'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'octofit_tracker.performance': {
+            'handlers': ['console'],
+            'level': os.environ.get('OCTOFIT_PERFORMANCE_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
 }
 
 
@@ -147,6 +252,24 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Django REST framework
+# List endpoints use keyset pagination; clients may request up to
+# KeysetPagination.max_page_size rows with ?page_size=. MessagePack is
+# offered next to JSON when the optional msgpack package is installed.
+
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'octofit_tracker.pagination.KeysetPagination',
+    'PAGE_SIZE': 100,
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        *(['octofit_tracker.renderers.MessagePackRenderer'] if find_spec('msgpack') else []),
+    ],
+}
+
+# Responses at least this large are brotli/gzip compressed (renderers.py).
+OCTOFIT_COMPRESSION_MIN_BYTES = 1024
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_METHODS = [
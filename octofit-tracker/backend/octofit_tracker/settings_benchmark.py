@@ -0,0 +1,39 @@
+"""
+Settings for the API benchmark suite (``manage.py benchmark_api``).
+
+    DJANGO_SETTINGS_MODULE=octofit_tracker.settings_benchmark \\
+        python manage.py benchmark_api --users 500
+
+Benchmarks seed and wipe their own ``octofit_benchmark`` database, never
+``octofit_db``. Set ``OCTOFIT_BENCHMARK_BACKEND=mongomock`` (needs
+``pip install mongomock``, plus ``mongomock-motor`` for the async views) to
+run fully offline without a MongoDB server; numbers are only comparable
+with baselines recorded on the same backend.
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES
+
+DATABASES['default']['NAME'] = os.environ.get('OCTOFIT_BENCHMARK_DB', 'octofit_benchmark')
+
+OCTOFIT_BENCHMARK_BACKEND = os.environ.get('OCTOFIT_BENCHMARK_BACKEND', 'mongodb')
+if OCTOFIT_BENCHMARK_BACKEND == 'mongomock':
+    try:
+        import mongomock  # noqa: F401
+    except ImportError:
+        raise ImproperlyConfigured('OCTOFIT_BENCHMARK_BACKEND=mongomock requires: pip install mongomock')
+    OCTOFIT_MONGO_CLIENT_CLASS = 'mongomock.MongoClient'
+    OCTOFIT_MONGO_ASYNC_CLIENT_CLASS = 'octofit_tracker.settings_benchmark.mongomock_async_client'
+elif OCTOFIT_BENCHMARK_BACKEND != 'mongodb':
+    raise ImproperlyConfigured('OCTOFIT_BENCHMARK_BACKEND must be "mongodb" or "mongomock"')
+
+
+def mongomock_async_client(**options):
+    """Async mongomock client over the same in-memory store as ``get_client``."""
+    from mongomock_motor import AsyncMongoMockClient
+
+    from .mongo import get_client
+    return AsyncMongoMockClient(mock_mongo_client=get_client())
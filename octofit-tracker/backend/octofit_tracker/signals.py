@@ -0,0 +1,115 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import caching, leaderboard, live, recommendations, rollups, search, tasks
+from .models import Activity, Leaderboard, Team, User, Workout
+
+# Cached resources whose responses embed data from each model.
+INVALIDATES = {
+    Team: ('teams', 'leaderboard', 'rollups'),
+    User: ('leaderboard', 'rollups'),
+    Leaderboard: ('leaderboard',),
+    Workout: ('workouts',),
+}
+# Models whose rows appear in the live leaderboard feed.
+LIVE = (Leaderboard, Team, User)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_cached_responses(sender, **kwargs):
+    resources = INVALIDATES.get(sender)
+    if resources:
+        caching.invalidate(*resources)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def publish_live_leaderboard(sender, **kwargs):
+    if sender in LIVE:
+        live.table_changed()
+
+
+@receiver(pre_save, sender=Activity)
+def remember_previous_activity(sender, instance, raw=False, **kwargs):
+    instance._previous = None
+    if not raw and not instance._state.adding:
+        instance._previous = Activity.objects.filter(pk=instance.pk).first()
+
+
+@receiver(post_save, sender=Activity)
+def roll_up_saved_activity(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous', None)
+    if previous is None:
+        rollups.activity_created(instance)
+    else:
+        rollups.activity_updated(previous, instance)
+
+
+@receiver(post_delete, sender=Activity)
+def roll_up_deleted_activity(sender, instance, **kwargs):
+    rollups.activity_deleted(instance)
+
+
+@receiver(post_save, sender=Activity)
+def score_saved_activity(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous', None)
+    if previous is None:
+        leaderboard.activity_created(instance)
+    else:
+        leaderboard.activity_updated(previous, instance)
+
+
+@receiver(post_delete, sender=Activity)
+def score_deleted_activity(sender, instance, **kwargs):
+    leaderboard.activity_deleted(instance)
+
+
+@receiver(post_delete, sender=Leaderboard)
+def close_rank_gap(sender, instance, **kwargs):
+    leaderboard.entry_deleted(instance)
+
+
+@receiver(pre_save, sender=User)
+def remember_previous_team(sender, instance, raw=False, **kwargs):
+    instance._previous_team_id = None
+    if not raw and not instance._state.adding:
+        instance._previous_team_id = User.objects.filter(pk=instance.pk).values_list('team_id', flat=True).first()
+
+
+@receiver(post_save, sender=User)
+def move_team_rollups(sender, instance, created, raw=False, **kwargs):
+    if not (raw or created):
+        rollups.user_team_changed(instance.pk, instance._previous_team_id, instance.team_id)
+
+
+@receiver(post_delete, sender=Team)
+def move_deleted_team_rollups(sender, instance, **kwargs):
+    rollups.team_deleted(instance.pk)
+
+
+@receiver(post_save, sender=Activity)
+@receiver(post_delete, sender=Activity)
+@receiver(post_save, sender=User)
+def refresh_recommendation_profiles(sender, instance, **kwargs):
+    if sender is User:
+        recommendations.profiles_changed(instance.pk)
+        return
+    previous = getattr(instance, '_previous', None)
+    tasks.users_changed(instance.user_id, *([previous.user_id] if previous else []))
+
+
+@receiver(post_save)
+def index_for_search(sender, instance, raw=False, **kwargs):
+    if sender in search.KIND_OF and not raw:
+        search.instance_saved(instance)
+
+
+@receiver(post_delete)
+def unindex_for_search(sender, instance, **kwargs):
+    if sender in search.KIND_OF:
+        search.instance_deleted(instance)
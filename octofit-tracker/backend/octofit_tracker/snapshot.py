@@ -0,0 +1,308 @@
+"""
+Columnar, memory-mapped snapshot of the activities for analytics.
+
+``export`` writes one raw NumPy file per column into a directory::
+
+    activity_id.i8  user_id.i8  team_id.i8  type.u1  duration.f8  date.i8
+
+``team_id`` is -1 for users without a team, ``type`` indexes ``TYPES`` and
+``date`` holds microseconds since the Unix epoch (UTC). ``manifest.json``
+records the committed row count, the highest exported activity id and the
+value range of each key column. Exports are incremental: activities with a
+higher id than the last export are appended to the files, and the manifest
+is replaced last, so readers never see a half-written batch. Activities
+that are later edited or deleted, and team changes, are only picked up by
+a ``full`` export, which writes a new generation of files
+(``activity_id.<generation>.i8``, ...) next to the live ones, switches the
+manifest over to it and only then unlinks the previous generation; readers
+that already mapped it keep their pages. Like the team rollups, activities
+are credited to the team their user belonged to when they were exported.
+
+``Snapshot`` memory-maps the columns and answers group-by/time-bucket
+totals in chunks with vectorized NumPy operations, without touching Mongo.
+"""
+import json
+import os
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Activity, User
+from .mongo import get_collection
+
+TYPES = [activity_type for activity_type, _ in Activity.ACTIVITY_TYPES]
+COLUMNS = {
+    'activity_id': np.int64,
+    'user_id': np.int64,
+    'team_id': np.int64,
+    'type': np.uint8,
+    'duration': np.float64,
+    'date': np.int64,
+}
+GROUP_BY_CHOICES = ('user', 'team', 'activity_type', 'day', 'week', 'month')
+MANIFEST = 'manifest.json'
+CHUNK_ROWS = 8_000_000
+# Largest key space summed with bincount; sparser groupings fall back to np.unique.
+DENSE_GROUPS = 1 << 22
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECONDS_PER_DAY = 86_400_000_000
+
+
+def default_directory():
+    return Path(getattr(settings, 'OCTOFIT_SNAPSHOT_DIR', None) or Path(settings.BASE_DIR) / 'snapshot')
+
+
+def _microseconds(value):
+    if timezone.is_aware(value):
+        value = value.astimezone(dt_timezone.utc).replace(tzinfo=None)
+    return (value - _EPOCH) // timedelta(microseconds=1)
+
+
+def _column_path(directory, generation, name, dtype):
+    suffix = np.dtype(dtype).str[1:]
+    return Path(directory) / (f'{name}.{generation}.{suffix}' if generation else f'{name}.{suffix}')
+
+
+def _read_manifest(directory):
+    path = Path(directory) / MANIFEST
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_manifest(directory, manifest):
+    path = Path(directory) / MANIFEST
+    temporary = path.with_suffix('.tmp')
+    with open(temporary, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temporary, path)
+
+
+def _widen(ranges, name, values):
+    if len(values):
+        low, high = int(values.min()), int(values.max())
+        if name in ranges:
+            low, high = min(low, ranges[name][0]), max(high, ranges[name][1])
+        ranges[name] = [low, high]
+
+
+def export(directory=None, full=False, batch_size=100_000):
+    """
+    Append the activities added since the last export (every activity with
+    ``full``) and return ``(appended_rows, total_rows)``.
+    """
+    directory = Path(directory or default_directory())
+    directory.mkdir(parents=True, exist_ok=True)
+    previous = _read_manifest(directory)
+    if full or previous is None:
+        generation = previous.get('generation', 0) + 1 if previous else 0
+        manifest = {'rows': 0, 'last_id': 0, 'types': TYPES, 'ranges': {}, 'generation': generation}
+    elif previous['types'] != TYPES:
+        raise ValueError('Activity types changed since the snapshot was written; export with full=True')
+    else:
+        manifest = previous
+
+    teams = {
+        user['id']: user.get('team_id')
+        for user in get_collection(User).find({}, {'_id': False, 'id': True, 'team_id': True})
+    }
+    codes = {activity_type: code for code, activity_type in enumerate(TYPES)}
+    files = {}
+    for name, dtype in COLUMNS.items():
+        path = _column_path(directory, manifest.get('generation', 0), name, dtype)
+        f = open(path, 'r+b' if path.exists() else 'wb')
+        # Drop whatever an interrupted export left past the committed rows.
+        f.truncate(manifest['rows'] * np.dtype(dtype).itemsize)
+        f.seek(0, os.SEEK_END)
+        files[name] = f
+
+    appended = 0
+    try:
+        cursor = get_collection(Activity).find(
+            {'id': {'$gt': manifest['last_id']}},
+            {'_id': False, 'id': True, 'user_id': True, 'activity_type': True, 'duration': True, 'date': True},
+        ).sort('id', 1).batch_size(batch_size)
+        batch = []
+        for document in cursor:
+            batch.append(document)
+            if len(batch) == batch_size:
+                appended += _append(files, manifest, batch, teams, codes)
+                batch = []
+        if batch:
+            appended += _append(files, manifest, batch, teams, codes)
+    finally:
+        for f in files.values():
+            f.close()
+    manifest['exported_at'] = timezone.now().isoformat()
+    _write_manifest(directory, manifest)
+    if previous is not None and previous.get('generation', 0) != manifest['generation']:
+        for name, dtype in COLUMNS.items():
+            _column_path(directory, previous.get('generation', 0), name, dtype).unlink(missing_ok=True)
+    return appended, manifest['rows']
+
+
+def _append(files, manifest, batch, teams, codes):
+    user_ids = np.fromiter((document['user_id'] for document in batch), np.int64, len(batch))
+    columns = {
+        'activity_id': np.fromiter((document['id'] for document in batch), np.int64, len(batch)),
+        'user_id': user_ids,
+        'team_id': np.fromiter(
+            (teams.get(user_id) or -1 for user_id in user_ids.tolist()), np.int64, len(batch),
+        ),
+        'type': np.fromiter(
+            (codes.get(document['activity_type'], codes['other']) for document in batch), np.uint8, len(batch),
+        ),
+        'duration': np.fromiter((document['duration'] for document in batch), np.float64, len(batch)),
+        'date': np.fromiter((_microseconds(document['date']) for document in batch), np.int64, len(batch)),
+    }
+    for name, values in columns.items():
+        files[name].write(values.tobytes())
+        files[name].flush()
+    for name in ('user_id', 'team_id', 'date'):
+        _widen(manifest['ranges'], name, columns[name])
+    manifest['rows'] += len(batch)
+    manifest['last_id'] = int(columns['activity_id'][-1])
+    return len(batch)
+
+
+def _week_start(day):
+    # Day 0 (1970-01-01) was a Thursday; weeks start on Monday.
+    return day - (day + 3) % 7
+
+
+def _label(group_by, value):
+    if group_by == 'team':
+        return None if value < 0 else value
+    if group_by == 'activity_type':
+        return TYPES[value]
+    if group_by == 'day':
+        return (date(1970, 1, 1) + timedelta(days=value)).isoformat()
+    if group_by == 'week':
+        year, week, _ = (date(1970, 1, 1) + timedelta(days=value)).isocalendar()
+        return f'{year}-W{week:02d}'
+    if group_by == 'month':
+        return f'{1970 + value // 12}-{value % 12 + 1:02d}'
+    return value
+
+
+class Snapshot:
+    """Read-only, memory-mapped view of an exported snapshot."""
+
+    def __init__(self, directory=None):
+        self.directory = Path(directory or default_directory())
+        while True:
+            self.manifest = _read_manifest(self.directory)
+            if self.manifest is None:
+                raise FileNotFoundError(f'No snapshot in {self.directory}; run export_snapshot')
+            self.rows = self.manifest['rows']
+            generation = self.manifest.get('generation', 0)
+            try:
+                self.columns = {
+                    name: (
+                        np.memmap(_column_path(self.directory, generation, name, dtype), dtype=dtype, mode='r',
+                                  shape=(self.rows,))
+                        if self.rows else np.empty(0, dtype)
+                    )
+                    for name, dtype in COLUMNS.items()
+                }
+                return
+            except FileNotFoundError:
+                # A full export replaced this generation after we read the manifest.
+                latest = _read_manifest(self.directory)
+                if latest is None or latest.get('generation', 0) == generation:
+                    raise
+
+    def _keys(self, group_by, chunk):
+        """
+        Key codes of ``chunk`` (a slice), the key value of code 0 and the
+        number of codes. Week codes count weeks from a Monday day number.
+        """
+        ranges = self.manifest['ranges']
+        if group_by in ('user', 'team'):
+            low, high = ranges[f'{group_by}_id']
+            return self.columns[f'{group_by}_id'][chunk] - low, low, high - low + 1
+        if group_by == 'activity_type':
+            return self.columns['type'][chunk].astype(np.int64), 0, len(TYPES)
+        days = self.columns['date'][chunk] // _MICROSECONDS_PER_DAY
+        first, last = (value // _MICROSECONDS_PER_DAY for value in ranges['date'])
+        if group_by == 'day':
+            return days - first, first, last - first + 1
+        if group_by == 'week':
+            first, last = _week_start(first), _week_start(last)
+            return (_week_start(days) - first) // 7, first, (last - first) // 7 + 1
+        months = self.columns['date'][chunk].astype('datetime64[us]').astype('datetime64[M]').astype(np.int64)
+        first, last = (
+            int(np.datetime64(value, 'us').astype('datetime64[M]').astype(np.int64)) for value in ranges['date']
+        )
+        return months - first, first, last - first + 1
+
+    def aggregate(self, group_by, date_after=None, date_before=None):
+        """
+        Total duration and count per combination of the ``group_by`` keys
+        (any of ``GROUP_BY_CHOICES``), for activities dated within the
+        optional inclusive bounds. Returns ``[{key: value, ...,
+        'total_duration', 'count'}]`` in key order.
+        """
+        group_by = tuple(group_by)
+        unknown = set(group_by) - set(GROUP_BY_CHOICES)
+        if unknown or not group_by:
+            raise ValueError(', '.join(sorted(unknown)) or 'group_by is empty')
+        if not self.rows:
+            return []
+        after = _microseconds(date_after) if date_after is not None else None
+        before = _microseconds(date_before) if date_before is not None else None
+
+        dense = None
+        sparse = {}
+        for start in range(0, self.rows, CHUNK_ROWS):
+            chunk = slice(start, min(start + CHUNK_ROWS, self.rows))
+            dates = self.columns['date'][chunk]
+            mask = None
+            if after is not None:
+                mask = dates >= after
+            if before is not None:
+                mask = dates <= before if mask is None else mask & (dates <= before)
+
+            combined = np.zeros(chunk.stop - chunk.start, np.int64)
+            offsets, sizes = [], []
+            for name in group_by:
+                keys, offset, size = self._keys(name, chunk)
+                combined = combined * size + keys
+                offsets.append(offset)
+                sizes.append(size)
+            durations = self.columns['duration'][chunk]
+            if mask is not None:
+                combined, durations = combined[mask], durations[mask]
+            domain = int(np.prod(sizes, dtype=np.float64))
+
+            if domain <= DENSE_GROUPS:
+                if dense is None:
+                    dense = (np.zeros(domain), np.zeros(domain, np.int64))
+                dense[0][:] += np.bincount(combined, weights=durations, minlength=domain)
+                dense[1][:] += np.bincount(combined, minlength=domain)
+            else:
+                keys, inverse = np.unique(combined, return_inverse=True)
+                totals = np.bincount(inverse, weights=durations)
+                counts = np.bincount(inverse)
+                for key, total, count in zip(keys.tolist(), totals.tolist(), counts.tolist()):
+                    previous = sparse.get(key, (0.0, 0))
+                    sparse[key] = (previous[0] + total, previous[1] + count)
+
+        if dense is not None:
+            present = np.flatnonzero(dense[1])
+            sparse = dict(zip(present.tolist(), zip(dense[0][present].tolist(), dense[1][present].tolist())))
+
+        results = []
+        for key in sorted(sparse):
+            total, count = sparse[key]
+            row = {}
+            for name, offset, size in reversed(list(zip(group_by, offsets, sizes))):
+                key, code = divmod(key, size)
+                row[name] = _label(name, offset + code * (7 if name == 'week' else 1))
+            results.append({**{name: row[name] for name in group_by}, 'total_duration': total, 'count': count})
+        return results
@@ -0,0 +1,295 @@
+"""
+Activity statistics computed by Mongo aggregation pipelines.
+
+Every grouping runs as a single ``aggregate`` call: the date range is
+matched first so the ``date`` index bounds the scan, and only the grouped
+totals travel back to Python. Once the daily rollups are built, ranges
+that fall on whole UTC days (including no range) are answered from them
+instead, grouping O(days) documents rather than O(activities). With
+``source='snapshot'`` the totals come from the columnar export in
+``snapshot.py`` and Mongo is only asked for labels.
+"""
+import asyncio
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from . import repository, rollups, snapshot
+from .models import Activity, Leaderboard, Team, User
+from .mongo import get_async_database, get_collection
+
+GROUP_BY_CHOICES = ('user', 'team', 'activity_type', 'day', 'week')
+WINDOW_CHOICES = rollups.WINDOWS + ('all',)
+SOURCES = ('mongo', 'snapshot')
+
+_DATE_FORMATS = {'day': '%Y-%m-%d', 'week': '%G-W%V'}
+
+_GROUP_KEYS = {
+    'user': '$user_id',
+    'activity_type': '$activity_type',
+    **{name: {'$dateToString': {'format': format, 'date': '$date'}} for name, format in _DATE_FORMATS.items()},
+}
+
+
+def parse_date_bound(value, end=False):
+    """
+    Parse a ``date_after``/``date_before`` query value.
+
+    Accepts an ISO datetime or a bare ``YYYY-MM-DD`` date. A bare date used
+    as an upper bound covers the whole day. Raises ``ValueError`` for
+    anything else.
+    """
+    day = parse_date(value)
+    if day is not None:
+        if end:
+            day += timedelta(days=1)
+        moment = datetime.combine(day, time.min)
+        if end:
+            moment -= timedelta(microseconds=1)
+    else:
+        moment = parse_datetime(value)
+        if moment is None:
+            raise ValueError(value)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, dt_timezone.utc)
+    return moment
+
+
+def window_start(window, now=None):
+    """
+    Start of the current ``day``, ``week`` (Monday) or ``month`` at UTC
+    midnight, or ``None`` for ``all``.
+    """
+    if window not in WINDOW_CHOICES:
+        raise ValueError(window)
+    if window == 'all':
+        return None
+    return rollups.period(window, now or timezone.now())[1].replace(tzinfo=dt_timezone.utc)
+
+
+def _date_match(date_after, date_before):
+    bounds = {}
+    if date_after is not None:
+        bounds['$gte'] = date_after
+    if date_before is not None:
+        bounds['$lte'] = date_before
+    return [{'$match': {'date': bounds}}] if bounds else []
+
+
+def _totals(group_key):
+    return {
+        '$group': {
+            '_id': group_key,
+            'total_duration': {'$sum': '$duration'},
+            'count': {'$sum': 1},
+        }
+    }
+
+
+def _pipeline(group_by, date_after, date_before):
+    pipeline = _date_match(date_after, date_before)
+    if group_by != 'team':
+        return pipeline + [_totals(_GROUP_KEYS[group_by])]
+
+    # Collapse to one row per user before joining, so the lookup runs once
+    # per active user instead of once per activity.
+    return pipeline + [
+        _totals('$user_id'),
+        {'$lookup': {
+            'from': User._meta.db_table,
+            'localField': '_id',
+            'foreignField': 'id',
+            'as': 'user',
+        }},
+        {'$unwind': '$user'},
+        {'$group': {
+            '_id': '$user.team_id',
+            'total_duration': {'$sum': '$total_duration'},
+            'count': {'$sum': '$count'},
+        }},
+    ]
+
+
+def _rollup_pipeline(group_by, date_after, date_before):
+    """Return ``(collection, pipeline)`` over the rollups, or ``None``."""
+    if rollups.day_range(date_after, date_before) is None or not rollups.ready():
+        return None
+    pipeline = rollups.day_match(date_after, date_before)
+    if group_by == 'user':
+        name, key = rollups.USER_DAILY, '$user_id'
+    else:
+        # Team documents are the fewest per day and carry every activity.
+        name, key = rollups.TEAM_DAILY, '$team_id'
+    if group_by in _DATE_FORMATS:
+        key = {'$dateToString': {'format': _DATE_FORMATS[group_by], 'date': '$day'}}
+    if group_by == 'activity_type':
+        pipeline += [
+            {'$project': {'types': {'$objectToArray': '$types'}}},
+            {'$unwind': '$types'},
+            {'$project': {'key': '$types.k', 'total_duration': '$types.v.duration', 'count': '$types.v.count'}},
+        ]
+        key = '$key'
+    return name, pipeline + [
+        {'$group': {'_id': key, 'total_duration': {'$sum': '$total_duration'}, 'count': {'$sum': '$count'}}},
+        {'$match': {'count': {'$gt': 0}}},
+    ]
+
+
+def _labels(group_by, keys):
+    model = {'user': User, 'team': Team}.get(group_by)
+    if model is None:
+        return {key: key for key in keys}
+    return {key: name for key, (name,) in repository.names(model, keys).items()}
+
+
+def _rows(group_by, date_after, date_before, source):
+    if source == 'snapshot':
+        return [
+            {'_id': row[group_by], 'total_duration': row['total_duration'], 'count': row['count']}
+            for row in snapshot.Snapshot().aggregate((group_by,), date_after, date_before)
+        ]
+    rollup = _rollup_pipeline(group_by, date_after, date_before)
+    if rollup is None:
+        return list(get_collection(Activity).aggregate(_pipeline(group_by, date_after, date_before)))
+    name, pipeline = rollup
+    return list(rollups.collection(name).aggregate(pipeline))
+
+
+def activity_stats(group_by, date_after=None, date_before=None, source='mongo'):
+    """
+    Return total/count/average duration per ``group_by`` bucket.
+
+    Buckets are sorted by descending total duration, except ``day`` and
+    ``week`` which are returned chronologically. ``source='snapshot'``
+    raises ``FileNotFoundError`` when no snapshot has been exported.
+    """
+    if group_by not in GROUP_BY_CHOICES:
+        raise ValueError(group_by)
+    rows = _rows(group_by, date_after, date_before, source)
+    labels = _labels(group_by, [row['_id'] for row in rows])
+
+    groups = []
+    for row in rows:
+        groups.append({
+            'key': row['_id'],
+            'label': labels.get(row['_id']),
+            'total_duration': row['total_duration'],
+            'count': row['count'],
+            'average_duration': row['total_duration'] / row['count'],
+        })
+    if group_by in ('day', 'week'):
+        groups.sort(key=lambda group: group['key'])
+    else:
+        groups.sort(key=lambda group: (-group['total_duration'], str(group['key'])))
+
+    total_duration = sum(group['total_duration'] for group in groups)
+    count = sum(group['count'] for group in groups)
+    return {
+        'group_by': group_by,
+        'date_after': date_after,
+        'date_before': date_before,
+        'total_duration': total_duration,
+        'count': count,
+        'average_duration': total_duration / count if count else None,
+        'groups': groups,
+    }
+
+
+def _team_totals_pipelines(use_rollups, since=None):
+    """
+    ``(collection, pipeline)`` pairs yielding team totals keyed by team id,
+    counting only activities from ``since`` on when it is given.
+    """
+    members = (User._meta.db_table, [
+        {'$match': {'team_id': {'$ne': None}}},
+        {'$group': {'_id': '$team_id', 'member_count': {'$sum': 1}}},
+    ])
+    if use_rollups:
+        return [members, (rollups.TEAM_DAILY, [
+            *rollups.day_match(since),
+            {'$match': {'team_id': {'$ne': None}}},
+            {'$group': {'_id': '$team_id', 'total_score': {'$sum': '$total_duration'}}},
+        ])]
+    if since is not None:
+        return [members, (Activity._meta.db_table, _pipeline('team', since, None) + [
+            {'$project': {'total_score': '$total_duration'}},
+        ])]
+    # Grouped from the users side: each user matches at most one entry, so
+    # the lookup stays on a scalar key.
+    return [(User._meta.db_table, [
+        {'$match': {'team_id': {'$ne': None}}},
+        {'$lookup': {
+            'from': Leaderboard._meta.db_table,
+            'localField': 'id',
+            'foreignField': 'user_id',
+            'as': 'entry',
+        }},
+        {'$unwind': {'path': '$entry', 'preserveNullAndEmptyArrays': True}},
+        {'$group': {
+            '_id': '$team_id',
+            'member_count': {'$sum': 1},
+            'total_score': {'$sum': '$entry.score'},
+        }},
+    ])]
+
+
+def _find_teams(collection):
+    return collection.find({}, {'_id': False, 'id': True, 'name': True, 'description': True})
+
+
+def _team_summary(teams, *results):
+    totals = {}
+    for rows in results:
+        for row in rows:
+            totals.setdefault(row['_id'], {}).update(row)
+    summary = []
+    for team in teams:
+        row = totals.get(team['id'], {})
+        member_count, total_score = row.get('member_count', 0), float(row.get('total_score', 0))
+        summary.append({
+            'id': str(team['id']),
+            'name': team['name'],
+            'description': team.get('description', ''),
+            'member_count': member_count,
+            'total_score': total_score,
+            'average_score': total_score / member_count if member_count else None,
+        })
+    summary.sort(key=lambda team: (-team['total_score'], int(team['id'])))
+    return summary
+
+
+def team_summary(since=None):
+    """
+    Member count and total/average leaderboard score of every team, highest
+    total first. Teams without members are included. Scores come from the
+    team rollups once they are built. With ``since``, scores only count the
+    activity durations from that moment on.
+    """
+    database = get_collection(Team).database
+    use_rollups = rollups.day_range(since) is not None and rollups.ready()
+    return _team_summary(
+        _find_teams(get_collection(Team)),
+        *(database[name].aggregate(pipeline) for name, pipeline in _team_totals_pipelines(use_rollups, since)),
+    )
+
+
+def team_leaderboard(window='all', now=None):
+    """Teams ranked by the summed score of their members over ``window``."""
+    since = window_start(window, now)
+    teams = team_summary(since)
+    for rank, team in enumerate(teams, start=1):
+        team['rank'] = rank
+    return {'window': window, 'since': since, 'teams': teams}
+
+
+async def ateam_summary(since=None):
+    """``team_summary`` through the Motor client, for async views."""
+    database = get_async_database()
+    use_rollups = rollups.day_range(since) is not None and await rollups.aready()
+    pipelines = _team_totals_pipelines(use_rollups, since)
+    teams, *results = await asyncio.gather(
+        _find_teams(database[Team._meta.db_table]).to_list(length=None),
+        *(database[name].aggregate(pipeline).to_list(length=None) for name, pipeline in pipelines),
+    )
+    return _team_summary(teams, *results)
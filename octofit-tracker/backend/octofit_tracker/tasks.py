@@ -0,0 +1,344 @@
+"""
+Background jobs for recomputations that should not hold up a request.
+
+Jobs live in the ``tasks`` collection, so they survive restarts and any
+process can work them off::
+
+    {'_id': ObjectId(...), 'name': 'rebuild_rollups', 'args': {},
+     'key': 'rebuild_rollups', 'status': 'queued', 'attempts': 0, 'run_at': ...}
+
+The queue is for rebuilds, repairs and per-user refreshes. Per-write
+leaderboard updates stay inline as ``$inc`` deltas
+(``leaderboard.apply_score_delta``): they are cheap, and a recompute job
+per write would cost more round trips and race other workers for ranks.
+Activity writes and bulk ingest call ``users_changed``, which queues one
+``refresh_profile`` job per user under the key ``user:<id>``, so a burst of
+writes by one user costs a single profile rebuild.
+
+``enqueue`` coalesces jobs by ``key``: while a job with the same key is
+still queued, enqueuing again returns that job instead of adding one. A
+queued job also carries its key as ``queued_key``, under a sparse unique
+index, which keeps it that way under races. A job that is already running
+does not absorb new ones, since it may have read the data before the
+change that asked for it.
+
+Workers claim the oldest due job with one ``find_one_and_update``. A job
+that raises is queued again after ``OCTOFIT_TASK_RETRY_BACKOFF_SECONDS *
+2 ** (attempts - 1)`` (at most ``MAX_BACKOFF``) until it has been tried
+``OCTOFIT_TASK_MAX_ATTEMPTS`` times, then marked ``failed``. A running job
+whose worker died is claimed again once its lease runs out. Finished jobs
+expire after ``KEEP_DONE``, failed ones after ``KEEP_FAILED``.
+
+Every process starts ``OCTOFIT_TASK_WORKERS`` daemon threads on its first
+enqueue. With 0 workers ``enqueue`` runs the job right away in the calling
+thread, which keeps development and tests synchronous; that includes a job
+it coalesced into whose retry is still backing off, since nothing else in
+the process would run it. ``run_tasks`` runs a dedicated pool, and also
+picks up retries and ``defer``-red jobs that no web process is polling for.
+"""
+import logging
+import os
+import threading
+from datetime import timedelta
+from datetime import timezone as dt_timezone
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from . import leaderboard, recommendations, rollups
+from .mongo import get_database
+
+logger = logging.getLogger(__name__)
+
+TASKS = 'tasks'
+STATUSES = ('queued', 'running', 'done', 'failed')
+MAX_BACKOFF = timedelta(minutes=5)
+KEEP_DONE = timedelta(days=1)
+KEEP_FAILED = timedelta(days=7)
+POLL_SECONDS = 1.0
+
+INDEXES = {
+    TASKS: [
+        (f'{TASKS}_status_run_at_idx', [('status', ASCENDING), ('run_at', ASCENDING)], {}),
+        (f'{TASKS}_queued_key_idx', [('queued_key', ASCENDING)], {'unique': True, 'sparse': True}),
+        (f'{TASKS}_expires_at_idx', [('expires_at', ASCENDING)], {'expireAfterSeconds': 0}),
+    ],
+}
+
+# name -> (function, whether the status endpoint may enqueue it)
+_registry = {}
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def task(name, manual=False):
+    """Register the decorated function as the handler of jobs called ``name``."""
+    def register(function):
+        _registry[name] = (function, manual)
+        return function
+    return register
+
+
+def manual_tasks():
+    return sorted(name for name, (_, manual) in _registry.items() if manual)
+
+
+def collection():
+    return get_database()[TASKS]
+
+
+def workers():
+    return getattr(settings, 'OCTOFIT_TASK_WORKERS', 0)
+
+
+def enqueue(name, args=None, key=None, defer=False):
+    """
+    Queue a ``name`` job and return its document. Jobs with the same
+    ``key`` coalesce while queued. Without workers the job runs before this
+    returns, unless ``defer`` leaves it for a ``run_tasks`` process.
+    """
+    if name not in _registry:
+        raise ValueError(f'Unknown task {name!r}')
+    now = timezone.now()
+    job_id = ObjectId()
+    document = {
+        '_id': job_id,
+        'name': name,
+        'args': args or {},
+        'key': key or str(job_id),
+        'queued_key': key or str(job_id),
+        'status': 'queued',
+        'attempts': 0,
+        'max_attempts': getattr(settings, 'OCTOFIT_TASK_MAX_ATTEMPTS', 5),
+        'created_at': now,
+        'run_at': now,
+        'error': None,
+        'result': None,
+    }
+    while True:
+        try:
+            job = collection().find_one_and_update(
+                {'queued_key': document['key']},
+                {'$setOnInsert': document},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            break
+        except DuplicateKeyError:
+            # Another enqueue inserted the same key first; coalesce with it.
+            continue
+
+    if defer:
+        return job
+    if workers() > 0:
+        get_pool().wake()
+        return job
+    claimed = claim(job_id=job['_id'])
+    return run(claimed) if claimed is not None else job
+
+
+def users_changed(*user_ids):
+    """Drop the recommendation profiles of ``user_ids`` and queue their rebuild."""
+    recommendations.profiles_changed(*user_ids)
+    for user_id in set(user_ids):
+        enqueue('refresh_profile', {'user_id': user_id}, key=f'user:{user_id}')
+
+
+def claim(job_id=None, now=None):
+    """
+    Mark the oldest due job as running and return it, or ``None`` when
+    there is nothing to do. A queued ``job_id`` is claimed even before its
+    ``run_at``.
+    """
+    now = now or timezone.now()
+    lease = timedelta(seconds=getattr(settings, 'OCTOFIT_TASK_LEASE_SECONDS', 600))
+    due = {'$or': [
+        {'status': 'queued', 'run_at': {'$lte': now}},
+        {'status': 'running', 'lease_until': {'$lt': now}},
+    ]}
+    if job_id is not None:
+        due = {'_id': job_id, '$or': [
+            {'status': 'queued'},
+            {'status': 'running', 'lease_until': {'$lt': now}},
+        ]}
+    return collection().find_one_and_update(
+        due,
+        {
+            '$set': {'status': 'running', 'started_at': now, 'lease_until': now + lease, 'worker': _worker_name()},
+            '$unset': {'queued_key': ''},
+            '$inc': {'attempts': 1},
+        },
+        sort=[('run_at', ASCENDING)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def _worker_name():
+    return f'{os.getpid()}:{threading.current_thread().name}'
+
+
+def backoff(attempts):
+    """Delay before retrying a job that has failed ``attempts`` times."""
+    delay = timedelta(seconds=getattr(settings, 'OCTOFIT_TASK_RETRY_BACKOFF_SECONDS', 2) * 2 ** (attempts - 1))
+    return min(delay, MAX_BACKOFF)
+
+
+def run(job):
+    """Run a claimed job, record how it went and return the updated document."""
+    function = _registry.get(job['name'], (None,))[0]
+    try:
+        if function is None:
+            raise ValueError(f'Unknown task {job["name"]!r}')
+        result = function(**job['args'])
+    except Exception as exc:
+        now = timezone.now()
+        error = f'{type(exc).__name__}: {exc}'
+        if job['attempts'] < job['max_attempts']:
+            logger.warning('Task %s (%s) failed, retrying: %s', job['name'], job['_id'], error)
+            update = {
+                'status': 'queued', 'queued_key': job['key'], 'run_at': now + backoff(job['attempts']), 'error': error,
+            }
+        else:
+            logger.exception('Task %s (%s) failed for good', job['name'], job['_id'])
+            update = {'status': 'failed', 'finished_at': now, 'expires_at': now + KEEP_FAILED, 'error': error}
+        try:
+            return _finish(job, update)
+        except DuplicateKeyError:
+            # A newer job with the same key was queued meanwhile and takes over the retry.
+            return _finish(job, {
+                'status': 'failed', 'finished_at': now, 'expires_at': now + KEEP_FAILED,
+                'error': f'{error} (superseded by a queued job)',
+            })
+    now = timezone.now()
+    return _finish(job, {'status': 'done', 'finished_at': now, 'expires_at': now + KEEP_DONE, 'result': result})
+
+
+def _finish(job, update):
+    return collection().find_one_and_update(
+        {'_id': job['_id']},
+        {'$set': update, '$unset': {'lease_until': ''}},
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def run_pending(limit=None, now=None):
+    """Run due jobs in this thread until none are left (or ``limit`` ran); return how many ran."""
+    ran = 0
+    while limit is None or ran < limit:
+        job = claim(now=now)
+        if job is None:
+            break
+        run(job)
+        ran += 1
+    return ran
+
+
+def get(job_id):
+    try:
+        return collection().find_one({'_id': ObjectId(job_id)})
+    except (InvalidId, TypeError):
+        return None
+
+
+def counts():
+    totals = dict.fromkeys(STATUSES, 0)
+    for row in collection().aggregate([{'$group': {'_id': '$status', 'count': {'$sum': 1}}}]):
+        totals[row['_id']] = row['count']
+    return totals
+
+
+def recent(limit=20):
+    return list(collection().find({}).sort('created_at', -1).limit(limit))
+
+
+def public(job):
+    """A job document as the status endpoint shows it."""
+    fields = ('name', 'key', 'args', 'status', 'attempts', 'max_attempts', 'error', 'result')
+    dates = ('created_at', 'run_at', 'started_at', 'finished_at')
+    return {
+        'id': str(job['_id']),
+        **{field: job.get(field) for field in fields},
+        **{field: _aware(job.get(field)) for field in dates},
+    }
+
+
+def _aware(value):
+    if value is not None and timezone.is_naive(value):
+        return value.replace(tzinfo=dt_timezone.utc)
+    return value
+
+
+class WorkerPool:
+    """Daemon threads that claim and run jobs, polling when idle."""
+
+    def __init__(self, size, poll=POLL_SECONDS):
+        self.size = size
+        self.poll = poll
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for number in range(self.size):
+            thread = threading.Thread(target=self._work, name=f'octofit-task-{number}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _work(self):
+        while not self._stopping.is_set():
+            try:
+                job = claim()
+                if job is not None:
+                    run(job)
+            except PyMongoError:
+                logger.exception('Task worker could not reach MongoDB')
+                job = None
+            finally:
+                close_old_connections()
+            if job is None:
+                self._wake.wait(self.poll)
+                self._wake.clear()
+
+
+def get_pool():
+    """This process's ``WorkerPool``, started on first use (again after a fork)."""
+    global _pool
+    pool = _pool
+    if pool is None or pool[0] != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool[0] != os.getpid():
+                _pool = (os.getpid(), WorkerPool(workers()).start())
+            pool = _pool
+    return pool[1]
+
+
+# Jobs
+
+@task('rebuild_leaderboard', manual=True)
+def rebuild_leaderboard():
+    return {'entries': leaderboard.rebuild_leaderboard()}
+
+
+@task('rebuild_rollups', manual=True)
+def rebuild_rollups():
+    return {'documents': rollups.rebuild()}
+
+
+@task('refresh_profile')
+def refresh_profile(user_id):
+    return {'found': recommendations.refresh_profile(user_id) is not None}
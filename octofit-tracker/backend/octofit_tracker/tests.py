@@ -1,9 +1,36 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from rest_framework.test import APIClient
+from django.utils import timezone
+from pymongo.errors import BulkWriteError
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
 from rest_framework import status
+from . import (
+    caching, ingest, instrumentation, live, recommendations, renderers, rollups, search, snapshot, stats, tasks,
+)
+from .leaderboard import RANK_LOCK, apply_score_delta, rebuild_leaderboard, ranking_lock
 from .models import User, Team, Activity, Leaderboard, Workout
-from datetime import datetime
+from .mongo import PoolStats, get_client, get_collection, get_database
+from .pagination import KeysetPagination
+from .serializers import ActivitySerializer, LeaderboardSerializer, UserSerializer
+from datetime import datetime, timedelta, timezone as dt_timezone
 
 
 class TeamModelTest(TestCase):
@@ -160,3 +187,1444 @@ class APIEndpointsTest(TestCase):
         response = self.client.post('/api/workouts/', data, format='json')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(response.data['name'], 'Speed Force Training')
+
+
+class QueryCountTest(TestCase):
+    """List endpoints must load related rows in bulk, not once per row."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.team = Team.objects.create(name='Team Marvel')
+        self.next_id = 1
+
+    def _add_rows(self, count):
+        for _ in range(count):
+            user = User.objects.create(
+                name=f'Hero {self.next_id}',
+                email=f'hero{self.next_id}@avengers.com',
+                team=self.team
+            )
+            Activity.objects.create(
+                user=user,
+                activity_type='running',
+                duration=30.0,
+                date=timezone.now()
+            )
+            Leaderboard.objects.create(user=user, score=30.0, rank=self.next_id)
+            self.next_id += 1
+
+    def _count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries)
+
+    def test_list_query_count_is_constant(self):
+        for url in ('/api/users/', '/api/activities/', '/api/leaderboard/'):
+            self._add_rows(2)
+            small = self._count_queries(url)
+            self._add_rows(8)
+            large = self._count_queries(url)
+            self.assertEqual(small, large, url)
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(name='Tony Stark', email='ironman@avengers.com')
+        now = timezone.now()
+        # Two activities share a date so ties must be broken by id.
+        for days_ago in (0, 1, 1, 2, 3):
+            Activity.objects.create(
+                user=self.user,
+                activity_type='running',
+                duration=30.0,
+                date=now - timedelta(days=days_ago)
+            )
+
+    def _walk(self, url, link='next'):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append([row['id'] for row in response.data['results']])
+            url = response.data[link]
+        return pages
+
+    def test_pages_cover_every_row_once_in_order(self):
+        pages = self._walk('/api/activities/?page_size=2')
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        ids = [row_id for page in pages for row_id in page]
+        expected = Activity.objects.order_by('-date', '-id').values_list('id', flat=True)
+        self.assertEqual(ids, [str(pk) for pk in expected])
+
+    def test_previous_link_returns_to_first_page(self):
+        first = self.client.get('/api/activities/?page_size=2').data
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).data
+        back = self.client.get(second['previous']).data
+        self.assertEqual(back['results'], first['results'])
+        self.assertIsNone(back['previous'])
+
+    def test_page_size_is_capped(self):
+        paginator = KeysetPagination()
+        request = Request(APIRequestFactory().get('/api/activities/', {'page_size': 10 ** 6}))
+        self.assertEqual(paginator.get_page_size(request), KeysetPagination.max_page_size)
+
+    def test_reused_paginator_keeps_no_request_state(self):
+        paginator = KeysetPagination()
+        factory = APIRequestFactory()
+        small = Request(factory.get('/api/activities/', {'page_size': 2}))
+        self.assertEqual(len(paginator.paginate_queryset(Activity.objects.all(), small)), 2)
+        self.assertIsNotNone(paginator.get_next_link())
+        default = Request(factory.get('/api/activities/'))
+        self.assertEqual(len(paginator.paginate_queryset(Activity.objects.all(), default)), 5)
+        self.assertIsNone(paginator.get_next_link())
+        self.assertEqual((paginator.page_size, paginator.ordering), (KeysetPagination.page_size, ('id',)))
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/activities/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class LeaderboardMaintenanceTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.users = [
+            User.objects.create(name=name, email=f'{name.lower()}@avengers.com')
+            for name in ('Tony', 'Steve', 'Natasha', 'Bruce')
+        ]
+
+    def _log(self, user, duration):
+        response = self.client.post('/api/activities/', {
+            'user': user.pk,
+            'activity_type': 'running',
+            'duration': duration,
+            'date': timezone.now().isoformat(),
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+
+    def _standings(self):
+        return [
+            (entry.user_id, entry.score, entry.rank)
+            for entry in Leaderboard.objects.order_by('rank')
+        ]
+
+    def _assert_consistent(self):
+        standings = self._standings()
+        self.assertEqual([rank for _, _, rank in standings], list(range(1, len(standings) + 1)))
+        expected = sorted(standings, key=lambda entry: (-entry[1], entry[0]))
+        self.assertEqual(standings, expected)
+
+    def test_create_update_delete_keep_ranks_current(self):
+        tony, steve, natasha, bruce = self.users
+        self._log(tony, 30)
+        self._log(steve, 60)
+        natasha_run = self._log(natasha, 45)
+        self._log(bruce, 45)
+        self._assert_consistent()
+        self.assertEqual([uid for uid, _, _ in self._standings()], [steve.pk, natasha.pk, bruce.pk, tony.pk])
+
+        self._log(tony, 40)
+        self._assert_consistent()
+        self.assertEqual(self._standings()[0], (tony.pk, 70.0, 1))
+
+        response = self.client.patch(f'/api/activities/{natasha_run}/', {'user': bruce.pk}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self._assert_consistent()
+        self.assertEqual(self._standings()[0], (bruce.pk, 90.0, 1))
+
+        response = self.client.delete(f'/api/activities/{natasha_run}/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self._assert_consistent()
+        self.assertEqual(Leaderboard.objects.get(user=bruce).score, 45.0)
+
+    def test_rebuild_matches_incremental_scores(self):
+        for user, duration in zip(self.users, (20, 50, 35, 50)):
+            self._log(user, duration)
+        incremental = self._standings()
+        get_collection(Leaderboard).update_many({}, {'$set': {'score': 0.0, 'rank': 0}})
+        self.assertEqual(rebuild_leaderboard(), len(self.users))
+        self.assertEqual(self._standings(), incremental)
+
+    def test_orm_writes_and_user_deletes_keep_ranks_current(self):
+        tony, steve, natasha, bruce = self.users
+        run = Activity.objects.create(user=tony, activity_type='running', duration=30.0, date=timezone.now())
+        for user, duration in ((steve, 60.0), (natasha, 45.0), (bruce, 10.0)):
+            Activity.objects.create(user=user, activity_type='running', duration=duration, date=timezone.now())
+        run.duration = 70.0
+        run.save()
+        self.assertEqual(self._standings()[0], (tony.pk, 70.0, 1))
+
+        steve.delete()
+        self._assert_consistent()
+        self.assertEqual([uid for uid, _, _ in self._standings()], [tony.pk, natasha.pk, bruce.pk])
+
+        apply_score_delta(steve.pk, -60.0)
+        self.assertFalse(Leaderboard.objects.filter(user_id=steve.pk).exists())
+
+    def _seed(self, *scores):
+        for rank, (user, score) in enumerate(zip(self.users, scores), start=1):
+            Leaderboard.objects.create(user=user, score=score, rank=rank)
+
+    def test_concurrent_moves_keep_ranks_consistent(self):
+        tony, steve, natasha, _ = self.users
+        self._seed(100.0, 50.0, 10.0)
+        movers = [
+            threading.Thread(target=apply_score_delta, args=(tony.pk, -100.0)),
+            threading.Thread(target=apply_score_delta, args=(natasha.pk, 190.0)),
+        ]
+        with ranking_lock():
+            for mover in movers:
+                mover.start()
+            time.sleep(0.05)
+            # Both wait for the lock rather than shifting ranks from a stale read.
+            self.assertEqual(self._standings()[0], (tony.pk, 100.0, 1))
+        for mover in movers:
+            mover.join(5)
+        self._assert_consistent()
+        self.assertEqual(self._standings(), [(natasha.pk, 200.0, 1), (steve.pk, 50.0, 2), (tony.pk, 0.0, 3)])
+
+    def test_expired_lock_is_taken_over(self):
+        tony, steve, _, _ = self.users
+        self._seed(20.0, 10.0)
+        get_database()[RANK_LOCK].replace_one(
+            {'_id': 'ranks'},
+            {'owner': 'gone', 'expires_at': timezone.now() - timedelta(seconds=1)},
+            upsert=True,
+        )
+        apply_score_delta(steve.pk, 20.0)
+        self.assertEqual(self._standings(), [(steve.pk, 30.0, 1), (tony.pk, 20.0, 2)])
+        self.assertIsNone(get_database()[RANK_LOCK].find_one({'_id': 'ranks'})['owner'])
+
+
+class ActivityStatsTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.marvel = Team.objects.create(name='Team Marvel')
+        self.dc = Team.objects.create(name='Team DC')
+        self.tony = User.objects.create(name='Tony Stark', email='ironman@avengers.com', team=self.marvel)
+        self.steve = User.objects.create(name='Steve Rogers', email='captain@avengers.com', team=self.marvel)
+        self.clark = User.objects.create(name='Clark Kent', email='superman@justiceleague.com', team=self.dc)
+        day = datetime(2026, 3, 2, 12, tzinfo=dt_timezone.utc)  # a Monday
+        for user, activity_type, duration, days in (
+            (self.tony, 'running', 30.0, 0),
+            (self.tony, 'cycling', 60.0, 1),
+            (self.steve, 'running', 90.0, 1),
+            (self.clark, 'swimming', 20.0, 7),
+        ):
+            Activity.objects.create(
+                user=user, activity_type=activity_type, duration=duration, date=day + timedelta(days=days)
+            )
+
+    def _groups(self, **params):
+        response = self.client.get('/api/activities/stats/', params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return {group['label']: (group['total_duration'], group['count']) for group in response.data['groups']}
+
+    def test_group_by_user(self):
+        self.assertEqual(self._groups(group_by='user'), {
+            'Tony Stark': (90.0, 2), 'Steve Rogers': (90.0, 1), 'Clark Kent': (20.0, 1),
+        })
+
+    def test_group_by_team(self):
+        self.assertEqual(self._groups(group_by='team'), {
+            'Team Marvel': (180.0, 3), 'Team DC': (20.0, 1),
+        })
+
+    def test_group_by_type_and_week(self):
+        self.assertEqual(self._groups(group_by='activity_type')['running'], (120.0, 2))
+        self.assertEqual(self._groups(group_by='week'), {
+            '2026-W10': (180.0, 3), '2026-W11': (20.0, 1),
+        })
+
+    def test_date_range(self):
+        response = self.client.get('/api/activities/stats/', {
+            'group_by': 'day', 'date_after': '2026-03-03', 'date_before': '2026-03-03',
+        })
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(response.data['total_duration'], 150.0)
+        self.assertEqual(response.data['average_duration'], 75.0)
+
+    def test_invalid_parameters(self):
+        for params in ({'group_by': 'planet'}, {'date_after': 'yesterday'}):
+            response = self.client.get('/api/activities/stats/', params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class EnsureIndexesCommandTest(TestCase):
+    def test_creates_then_verifies_declared_indexes(self):
+        get_collection(Activity).drop_indexes()
+        with self.assertRaises(CommandError):
+            call_command('ensure_indexes', check=True, stdout=StringIO())
+        call_command('ensure_indexes', stdout=StringIO())
+        call_command('ensure_indexes', check=True, stdout=StringIO())
+        keys = [info['key'] for info in get_collection(Activity).index_information().values()]
+        self.assertIn([('user_id', 1), ('date', -1), ('id', -1)], keys)
+
+
+class BulkActivityIngestTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.tony = User.objects.create(name='Tony Stark', email='ironman@avengers.com')
+        self.steve = User.objects.create(name='Steve Rogers', email='captain@avengers.com')
+
+    def _session(self, user, duration, key=None):
+        item = {
+            'user': user.pk,
+            'activity_type': 'running',
+            'duration': duration,
+            'date': timezone.now().isoformat(),
+        }
+        if key is not None:
+            item['dedupe_key'] = key
+        return item
+
+    def test_bulk_create_reports_per_item_errors(self):
+        payload = [
+            self._session(self.tony, 30, 'watch-1'),
+            {'user': self.tony.pk, 'activity_type': 'flying', 'duration': 10},
+            self._session(self.steve, 45),
+        ]
+        response = self.client.post('/api/activities/bulk/', payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data['created'], response.data['error']), (2, 1))
+        self.assertEqual([r['status'] for r in response.data['results']], ['created', 'error', 'created'])
+        self.assertIn('activity_type', response.data['results'][1]['errors'])
+        self.assertEqual(Activity.objects.filter(user=self.tony).count(), 1)
+
+        listed = self.client.get('/api/activities/').data['results']
+        self.assertEqual(len(listed), 2)
+        created_id = response.data['results'][0]['id']
+        self.assertEqual(self.client.get(f'/api/activities/{created_id}/').data['user_name'], 'Tony Stark')
+
+    def test_retry_with_dedupe_key_is_idempotent(self):
+        payload = [self._session(self.tony, 30, 'watch-1'), self._session(self.tony, 20, 'watch-2')]
+        first = self.client.post('/api/activities/bulk/', payload, format='json')
+        self.assertEqual(first.data['created'], 2)
+
+        payload.append(self._session(self.tony, 10, 'watch-3'))
+        retry = self.client.post('/api/activities/bulk/', payload, format='json')
+        self.assertEqual([r['status'] for r in retry.data['results']], ['duplicate', 'duplicate', 'created'])
+        self.assertEqual(retry.data['results'][0]['id'], first.data['results'][0]['id'])
+
+        self.assertEqual(Activity.objects.filter(user=self.tony).count(), 3)
+        entry = Leaderboard.objects.get(user=self.tony)
+        self.assertEqual((entry.score, entry.rank), (60.0, 1))
+
+    def test_partial_failure_credits_inserted_rows(self):
+        now = timezone.now()
+        items = [
+            ({'user': self.tony, 'activity_type': 'running', 'duration': 30, 'date': now}, 'watch-1'),
+            ({'user': self.steve, 'activity_type': 'running', 'duration': 45, 'date': now}, 'watch-2'),
+        ]
+        collection = get_collection(Activity)
+        insert_many = type(collection).insert_many
+
+        def fail_second(self, documents, ordered=True):
+            if self.name != collection.name:
+                return insert_many(self, documents, ordered=ordered)
+            insert_many(self, documents[:1], ordered=ordered)
+            raise BulkWriteError({'writeErrors': [{'index': 1, 'code': 2, 'errmsg': 'bad value'}], 'nInserted': 1})
+
+        with mock.patch.object(type(collection), 'insert_many', autospec=True, side_effect=fail_second):
+            with self.assertRaises(BulkWriteError):
+                ingest.insert_activities(items)
+        self.assertEqual(Activity.objects.count(), 1)
+        self.assertEqual(Leaderboard.objects.get(user=self.tony).score, 30.0)
+        self.assertFalse(Leaderboard.objects.filter(user=self.steve).exists())
+
+    def test_rejects_non_integral_user_keys(self):
+        payload = []
+        for user in (self.tony.pk + 0.5, True, str(float(self.tony.pk)), float(self.tony.pk)):
+            payload.append({**self._session(self.tony, 30), 'user': user})
+        response = self.client.post('/api/activities/bulk/', payload, format='json')
+        self.assertEqual([r['status'] for r in response.data['results']], ['error', 'error', 'error', 'created'])
+        for result in response.data['results'][:3]:
+            self.assertEqual(result['errors']['user'][0].code, 'incorrect_type')
+
+    def test_rejects_non_list_body(self):
+        response = self.client.post('/api/activities/bulk/', self._session(self.tony, 30), format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ResponseCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.team = Team.objects.create(name='Team Marvel')
+
+    def test_hit_after_miss_and_conditional_get(self):
+        first = self.client.get('/api/teams/')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.client.get('/api/teams/')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(second.data, first.data)
+
+        not_modified = self.client.get('/api/teams/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(caching.get_stats()['teams'], {'hits': 1, 'misses': 1, 'not_modified': 1})
+
+    def test_writes_invalidate(self):
+        etag = self.client.get('/api/teams/')['ETag']
+        self.client.post('/api/teams/', {'name': 'Team DC'}, format='json')
+        response = self.client.get('/api/teams/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_activity_write_invalidates_leaderboard(self):
+        user = User.objects.create(name='Tony Stark', email='ironman@avengers.com', team=self.team)
+        self.assertEqual(self.client.get('/api/leaderboard/').data['results'], [])
+        self.client.post('/api/activities/', {
+            'user': user.pk, 'activity_type': 'running', 'duration': 30, 'date': timezone.now().isoformat(),
+        }, format='json')
+        response = self.client.get('/api/leaderboard/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['user_name'], 'Tony Stark')
+
+    def test_if_modified_since_alone_does_not_validate(self):
+        first = self.client.get('/api/teams/')
+        self.client.post('/api/teams/', {'name': 'Team DC'}, format='json')
+        response = self.client.get('/api/teams/', HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_rescheduled_activity_keeps_all_time_leaderboard_cached(self):
+        self.addCleanup(rollups.clear)
+        user = User.objects.create(name='Tony Stark', email='ironman@avengers.com', team=self.team)
+        activity = self.client.post('/api/activities/', {
+            'user': user.pk, 'activity_type': 'running', 'duration': 30, 'date': timezone.now().isoformat(),
+        }, format='json').data
+        self.client.get('/api/leaderboard/')
+        self.client.get('/api/leaderboard/', {'window': 'day'})
+        self.client.patch(f"/api/activities/{activity['id']}/", {
+            'date': (timezone.now() - timedelta(days=40)).isoformat(),
+        }, format='json')
+        self.assertEqual(self.client.get('/api/leaderboard/')['X-Cache'], 'HIT')
+        response = self.client.get('/api/leaderboard/', {'window': 'day'})
+        self.assertEqual((response['X-Cache'], response.data['results']), ('MISS', []))
+
+    def test_cache_stats_endpoint(self):
+        self.client.get('/api/workouts/')
+        response = self.client.get('/api/cache-stats/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['workouts']['misses'], 1)
+
+
+class ActivityExportTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.marvel = Team.objects.create(name='Team Marvel')
+        self.tony = User.objects.create(name='Tony Stark', email='ironman@avengers.com', team=self.marvel)
+        self.clark = User.objects.create(name='Clark Kent', email='superman@justiceleague.com')
+        day = datetime(2026, 3, 2, 12, tzinfo=dt_timezone.utc)
+        for user, days in ((self.tony, 0), (self.tony, 1), (self.tony, 2), (self.clark, 1)):
+            Activity.objects.create(user=user, activity_type='running', duration=30.0, date=day + timedelta(days=days))
+
+    def _export(self, **params):
+        response = self.client.get('/api/activities/export/', params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_ndjson_matches_serializer_output(self):
+        response, body = self._export(batch_size=2)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = sorted((json.loads(line) for line in body.splitlines()), key=lambda row: int(row['id']))
+        expected = ActivitySerializer(Activity.objects.order_by('id'), many=True).data
+        self.assertEqual(rows, json.loads(json.dumps(expected)))
+
+    def test_csv_with_filters(self):
+        response, body = self._export(output='csv', team=self.marvel.pk, date_after='2026-03-03')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(body.splitlines()))
+        self.assertEqual(len(rows), 2)
+        self.assertTrue(all(row['user_name'] == 'Tony Stark' for row in rows))
+
+    def test_invalid_output(self):
+        response = self.client.get('/api/activities/export/', {'output': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class LeanSerializerTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        team = Team.objects.create(name='Team Marvel')
+        tony = User.objects.create(name='Tony Stark', email='ironman@avengers.com', team=team, avatar='🦾')
+        loner = User.objects.create(name='Frank Castle', email='punisher@nyc.com')
+        for rank, user in enumerate((tony, loner), start=1):
+            Activity.objects.create(user=user, activity_type='yoga', duration=25.5, date=timezone.now(), notes='zen')
+            Leaderboard.objects.create(user=user, score=25.5, rank=rank)
+
+    def test_list_output_matches_model_serializers(self):
+        for url, model, serializer_class in (
+            ('/api/users/', User, UserSerializer),
+            ('/api/activities/', Activity, ActivitySerializer),
+            ('/api/leaderboard/', Leaderboard, LeaderboardSerializer),
+        ):
+            listed = self.client.get(url, {'page_size': 10}).json()['results']
+            expected = serializer_class(model.objects.all(), many=True).data
+            expected = json.loads(json.dumps(expected))
+            self.assertEqual(
+                sorted(listed, key=lambda row: row['id']),
+                sorted(expected, key=lambda row: row['id']),
+                url,
+            )
+
+    def test_benchmark_command_reports_every_endpoint(self):
+        out = StringIO()
+        call_command('benchmark_serializers', rows=50, repeat=1, stdout=out)
+        for name in ('users', 'activities', 'leaderboard'):
+            self.assertRegex(out.getvalue(), rf'{name} .* rows/s')
+        self.assertNotIn('differs', out.getvalue())
+
+
+class ActivityFilterTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.marvel = Team.objects.create(name='Team Marvel')
+        self.tony = User.objects.create(name='Tony Stark', email='ironman@avengers.com', team=self.marvel)
+        self.steve = User.objects.create(name='Steve Rogers', email='captain@avengers.com', team=self.marvel)
+        self.clark = User.objects.create(name='Clark Kent', email='superman@justiceleague.com')
+        day = datetime(2026, 3, 2, 12, tzinfo=dt_timezone.utc)
+        for user, activity_type, days in (
+            (self.tony, 'running', 0),
+            (self.tony, 'cycling', 1),
+            (self.steve, 'running', 2),
+            (self.clark, 'running', 3),
+        ):
+            Activity.objects.create(user=user, activity_type=activity_type, duration=30.0, date=day + timedelta(days=days))
+
+    def _list(self, **params):
+        response = self.client.get('/api/activities/', params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(row['user_name'], row['activity_type'], row['date'][:10]) for row in response.data['results']]
+
+    def test_filters_combine(self):
+        self.assertEqual(len(self._list(user=self.tony.pk)), 2)
+        self.assertEqual(len(self._list(team=self.marvel.pk)), 3)
+        self.assertEqual(self._list(team=self.marvel.pk, activity_type='running'), [
+            ('Steve Rogers', 'running', '2026-03-04'), ('Tony Stark', 'running', '2026-03-02'),
+        ])
+        self.assertEqual(self._list(date_after='2026-03-03', date_before='2026-03-04'), [
+            ('Steve Rogers', 'running', '2026-03-04'), ('Tony Stark', 'cycling', '2026-03-03'),
+        ])
+
+    def test_ordering_pages_oldest_first(self):
+        first = self.client.get('/api/activities/', {'ordering': 'date', 'page_size': 3}).data
+        self.assertEqual([row['date'][:10] for row in first['results']], ['2026-03-02', '2026-03-03', '2026-03-04'])
+        second = self.client.get(first['next']).data
+        self.assertEqual([row['user_name'] for row in second['results']], ['Clark Kent'])
+        self.assertIsNone(second['next'])
+
+    def test_invalid_parameters(self):
+        for params in ({'user': 'tony'}, {'activity_type': 'flying'}, {'ordering': 'duration'},
+                       {'date_before': 'tomorrow'}):
+            response = self.client.get('/api/activities/', params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+    def test_benchmark_command_times_every_combination(self):
+        out = StringIO()
+        call_command('benchmark_activity_filters', requests=1, stdout=out)
+        for label in ('no filter', 'team + activity_type', 'user + ordering=date'):
+            self.assertIn(label, out.getvalue())
+
+
+class ApiBenchmarkCommandTest(TestCase):
+    def setUp(self):
+        # populate_db builds the rollups, which live outside the test database flush.
+        self.addCleanup(rollups.clear)
+
+    def test_baseline_round_trip_and_regression(self):
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = os.path.join(directory, 'baseline.json')
+            options = {'requests': 2, 'baseline': baseline, 'stdout': StringIO()}
+            call_command('benchmark_api', users=6, activities_per_user=3, save_baseline=True, **options)
+            with open(baseline) as f:
+                recorded = json.load(f)
+            self.assertIn('activity-stats', recorded['endpoints'])
+            self.assertIn('leaderboard-detail', recorded['endpoints'])
+
+            # Generous tolerance: only the query counts can fail here.
+            call_command('benchmark_api', tolerance=1000, **options)
+            recorded['endpoints']['activity-list']['queries'] -= 1
+            with open(baseline, 'w') as f:
+                json.dump(recorded, f)
+            with self.assertRaisesMessage(CommandError, 'activity-list: queries'):
+                call_command('benchmark_api', tolerance=1000, **options)
+
+    def test_timed_requests_bypass_the_response_cache(self):
+        with mock.patch.object(caching, '_count') as count:
+            call_command('benchmark_api', users=6, activities_per_user=3, requests=2,
+                         baseline=os.devnull, save_baseline=True, stdout=StringIO())
+        outcomes = {outcome for _, outcome in (c.args for c in count.call_args_list)}
+        self.assertEqual(outcomes, {'misses'})
+
+    def test_users_refuses_the_development_database(self):
+        with mock.patch.dict(settings.DATABASES['default'], NAME='octofit_db'):
+            for command in ('benchmark_api', 'benchmark_concurrency'):
+                with self.assertRaisesMessage(CommandError, '--users wipes the database'):
+                    call_command(command, users=6, stdout=StringIO())
+
+
+class PerformanceMiddlewareTest(TestCase):
+    def setUp(self):
+        instrumentation.reset()
+        self.client = APIClient()
+        tony = User.objects.create(name='Tony Stark', email='ironman@avengers.com')
+        Activity.objects.create(user=tony, activity_type='running', duration=30.0, date=timezone.now())
+
+    @override_settings(OCTOFIT_METRICS_SAMPLE_RATE=1.0)
+    def test_sampled_request_reports_breakdown(self):
+        with self.assertLogs('octofit_tracker.performance', level='INFO') as logs:
+            response = self.client.get('/api/activities/')
+        timing = dict(
+            (part.split(';')[0], part) for part in response['Server-Timing'].split(', ')
+        )
+        self.assertEqual(set(timing), {'total', 'db', 'mongo', 'serialize', 'render', 'size'})
+        self.assertIn('desc="2 queries"', timing['db'])
+        self.assertIn(f'desc="{len(response.content)} bytes"', timing['size'])
+
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual((entry['view'], entry['status'], entry['queries']), ('activity-list', 200, 2))
+
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('octofit_db_queries_bucket{view="activity-list",method="GET",le="2"} 1', body)
+        self.assertIn('octofit_render_duration_seconds_count{view="activity-list",method="GET"} 1', body)
+
+    @override_settings(OCTOFIT_METRICS_SAMPLE_RATE=1.0, OCTOFIT_COMPRESSION_MIN_BYTES=0)
+    def test_render_time_excludes_compression(self):
+        def slow_compress(coding, data):
+            time.sleep(0.2)
+            return gzip.compress(data)
+        with mock.patch.object(renderers, 'compress', slow_compress), self.assertLogs('octofit_tracker.performance'):
+            response = self.client.get('/api/activities/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        timing = dict(part.split(';')[:2] for part in response['Server-Timing'].split(', '))
+        self.assertLess(float(timing['render'][4:]), 200)
+        self.assertGreaterEqual(float(timing['total'][4:]), 200)
+
+    def test_queries_in_executor_threads_are_counted(self):
+        def count_users():
+            try:
+                return User.objects.count()
+            finally:
+                connection.close()
+
+        record = instrumentation.RequestMetrics()
+        with instrumentation.PerformanceMiddleware._instrumented(record):
+            # A fresh thread with its own connection, like ASGI's sync view executor.
+            self.assertEqual(asyncio.run(sync_to_async(count_users, thread_sensitive=False)()), 1)
+        self.assertEqual(record.queries, 1)
+
+    @override_settings(OCTOFIT_METRICS_SAMPLE_RATE=0.0)
+    def test_unsampled_request_is_only_counted(self):
+        response = self.client.get('/api/activities/')
+        self.assertNotIn('Server-Timing', response)
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('octofit_http_requests_total{view="activity-list",method="GET",status="200"} 1', body)
+        self.assertNotIn('octofit_request_duration_seconds_count{view="activity-list"', body)
+
+
+class NativeRepositoryTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.marvel = Team.objects.create(name='Team Marvel')
+        self.tony = User.objects.create(name='Tony Stark', email='ironman@avengers.com', team=self.marvel)
+        loner = User.objects.create(name='Frank Castle', email='punisher@nyc.com')
+        day = datetime(2026, 3, 2, 12, tzinfo=dt_timezone.utc)
+        for days, (user, activity_type) in enumerate(
+            [(self.tony, 'running'), (self.tony, 'yoga'), (loner, 'running'), (self.tony, 'running')]
+        ):
+            Activity.objects.create(user=user, activity_type=activity_type, duration=30.0 + days,
+                                    date=day + timedelta(days=days), notes='zen')
+        rebuild_leaderboard()
+
+    def _both(self, url, params=None):
+        responses = {}
+        for backend in ('orm', 'native'):
+            cache.clear()
+            with self.settings(OCTOFIT_DATA_BACKEND=backend):
+                response = self.client.get(url, params or {})
+            self.assertEqual(response.status_code, status.HTTP_200_OK, (backend, url))
+            responses[backend] = response.json()
+        return responses['orm'], responses['native']
+
+    def test_native_output_matches_orm(self):
+        activity = Activity.objects.order_by('id').first()
+        for url, params in (
+            ('/api/users/', None),
+            (f'/api/users/{self.tony.pk}/', None),
+            ('/api/activities/', {'team': self.marvel.pk, 'activity_type': 'running'}),
+            ('/api/activities/', {'ordering': 'date', 'date_after': '2026-03-03'}),
+            (f'/api/activities/{activity.pk}/', None),
+            ('/api/leaderboard/', None),
+            ('/api/activities/stats/', {'group_by': 'team'}),
+            ('/api/activities/', {'fields': 'notes', 'ordering': 'date', 'page_size': 2}),
+            (f'/api/users/{self.tony.pk}/', {'exclude': 'email,team'}),
+            ('/api/leaderboard/', {'fields': 'team_name,rank'}),
+        ):
+            orm, native = self._both(url, params)
+            self.assertEqual(native, orm, url)
+
+    @override_settings(OCTOFIT_DATA_BACKEND='native')
+    def test_native_paging_issues_no_sql(self):
+        with CaptureQueriesContext(connection) as queries:
+            first = self.client.get('/api/activities/', {'page_size': 3}).data
+            second = self.client.get(first['next']).data
+            previous = self.client.get(second['previous']).data
+        self.assertEqual(len(queries), 0)
+        self.assertEqual([row['date'][:10] for row in first['results']], ['2026-03-05', '2026-03-04', '2026-03-03'])
+        self.assertEqual([row['date'][:10] for row in second['results']], ['2026-03-02'])
+        self.assertEqual(previous['results'], first['results'])
+        self.assertEqual(self.client.get('/api/users/999/').status_code, status.HTTP_404_NOT_FOUND)
+
+
+class SharedMongoClientTest(TestCase):
+    def test_orm_and_pymongo_share_one_client(self):
+        User.objects.count()
+        self.assertIs(connection.client_connection, get_client())
+        self.assertIs(get_database().client, get_client())
+        connection.close()
+        User.objects.count()
+        self.assertIs(connection.client_connection, get_client())
+
+    def test_pool_stats_track_checkouts(self):
+        stats = PoolStats()
+        stats.connection_created(None)
+        stats.connection_check_out_started(None)
+        stats.connection_checked_out(None)
+        self.assertEqual((stats.snapshot()['open_connections'], stats.snapshot()['checked_out']), (1, 1))
+        stats.connection_checked_in(None)
+        stats.connection_check_out_failed(None)
+        snapshot = stats.snapshot()
+        self.assertEqual((snapshot['checked_out'], snapshot['checkouts'], snapshot['checkout_failures']), (0, 1, 1))
+
+    def test_health_and_metrics_report_the_pool(self):
+        response = APIClient().get('/api/health/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'ok')
+        self.assertIn('checked_out', response.data['pool'])
+        self.assertIn('octofit_mongo_pool_checked_out ', APIClient().get('/metrics').content.decode())
+
+
+class AsyncReadEndpointTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.marvel = Team.objects.create(name='Team Marvel', description='Earth’s mightiest héroes')
+        Team.objects.create(name='Team Empty')
+        tony = User.objects.create(name='Tony Stark', email='ironman@avengers.com', team=self.marvel)
+        steve = User.objects.create(name='Steve Rogers', email='cap@avengers.com', team=self.marvel)
+        day = datetime(2026, 3, 2, 12, tzinfo=dt_timezone.utc)
+        for days, (user, activity_type) in enumerate([(tony, 'running'), (steve, 'yoga'), (tony, 'running')]):
+            Activity.objects.create(user=user, activity_type=activity_type, duration=30.0 + days,
+                                    date=day + timedelta(days=days))
+        rebuild_leaderboard()
+
+    async def test_async_views_match_sync_views(self):
+        for sync_url, async_url, params in (
+            ('/api/leaderboard/', '/api/async/leaderboard/', {}),
+            ('/api/activities/', '/api/async/activities/', {'team': self.marvel.pk, 'page_size': 2}),
+            ('/api/activities/', '/api/async/activities/', {'ordering': 'date', 'activity_type': 'running'}),
+            ('/api/teams/summary/', '/api/async/teams/summary/', {}),
+        ):
+            expected = await self.async_client.get(sync_url, params)
+            response = await self.async_client.get(async_url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK, async_url)
+            self.assertEqual(response['Content-Type'], expected['Content-Type'], async_url)
+            self.assertEqual(response.content.replace(b'/api/async/', b'/api/'), expected.content, async_url)
+
+        summary = json.loads((await self.async_client.get('/api/async/teams/summary/')).content)
+        self.assertEqual([(team['name'], team['member_count']) for team in summary],
+                         [('Team Marvel', 2), ('Team Empty', 0)])
+        self.assertEqual(summary[0]['total_score'], 93.0)
+        self.assertIsNone(summary[1]['average_score'])
+
+    async def test_async_team_summary_honours_since(self):
+        since = datetime(2026, 3, 3, tzinfo=dt_timezone.utc)
+        expected = await sync_to_async(stats.team_summary)(since)
+        self.assertEqual(await stats.ateam_summary(since), expected)
+        self.assertEqual(expected[0]['total_score'], 63.0)
+
+    async def test_async_paging_and_errors(self):
+        first = json.loads((await self.async_client.get('/api/async/activities/', {'page_size': 2})).content)
+        second = json.loads((await self.async_client.get(first['next'])).content)
+        self.assertEqual([row['duration'] for row in first['results'] + second['results']], [32.0, 31.0, 30.0])
+        self.assertIsNone(second['next'])
+
+        response = await self.async_client.get('/api/async/activities/', {'activity_type': 'flying'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('activity_type', json.loads(response.content))
+        response = await self.async_client.get('/api/async/leaderboard/', {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = await self.async_client.post('/api/async/leaderboard/')
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+
+@override_settings(OCTOFIT_LIVE_COALESCE_MS=50)
+class LiveLeaderboardTest(TestCase):
+    def setUp(self):
+        self.tony = User.objects.create(name='Tony Stark', email='ironman@avengers.com')
+        self.steve = User.objects.create(name='Steve Rogers', email='cap@avengers.com')
+        Activity.objects.create(user=self.tony, activity_type='running', duration=50.0, date=timezone.now())
+        Activity.objects.create(user=self.steve, activity_type='running', duration=10.0, date=timezone.now())
+        rebuild_leaderboard()
+
+    async def test_bursts_coalesce_into_one_delta_and_clients_resume(self):
+        feed = live.get_feed()
+        first = await feed.subscribe()
+        snapshot = json.loads((await first.get(timeout=1)).data)
+        self.assertEqual(snapshot['type'], 'snapshot')
+        self.assertEqual([row['user_name'] for row in snapshot['rows']], ['Tony Stark', 'Steve Rogers'])
+
+        for _ in range(3):
+            await sync_to_async(apply_score_delta)(self.steve.pk, 20.0)
+        delta = json.loads((await first.get(timeout=2)).data)
+        self.assertEqual(delta['type'], 'delta')
+        self.assertEqual(
+            sorted((row['user_name'], row['rank'], row['score']) for row in delta['rows']),
+            [('Steve Rogers', 1, 70.0), ('Tony Stark', 2, 50.0)],
+        )
+        self.assertIsNone(await first.get(timeout=0.2))
+
+        resumed = await feed.subscribe(snapshot['id'])
+        current = await feed.subscribe(delta['id'])
+        stale = await feed.subscribe('gone-1')
+        self.assertEqual((await resumed.get(timeout=1)).id, delta['id'])
+        self.assertIsNone(await current.get(timeout=0.1))
+        self.assertEqual((await stale.get(timeout=1)).kind, 'snapshot')
+        for subscription in (first, resumed, current, stale):
+            subscription.close()
+        self.assertIsNone(feed.task)
+
+    @override_settings(OCTOFIT_LIVE_TOP_N=1)
+    async def test_feed_only_covers_the_top_ranks(self):
+        feed = live.get_feed()
+        subscription = await feed.subscribe()
+        snapshot = json.loads((await subscription.get(timeout=1)).data)
+        self.assertEqual([row['user_name'] for row in snapshot['rows']], ['Tony Stark'])
+
+        # Moves below the top N are never read or sent.
+        await sync_to_async(apply_score_delta)(self.steve.pk, 5.0)
+        self.assertIsNone(await subscription.get(timeout=0.2))
+
+        await sync_to_async(apply_score_delta)(self.steve.pk, 50.0)
+        delta = json.loads((await subscription.get(timeout=2)).data)
+        self.assertEqual([(row['user_name'], row['rank']) for row in delta['rows']], [('Steve Rogers', 1)])
+        entries = await sync_to_async(dict)(Leaderboard.objects.values_list('user_id', 'id'))
+        self.assertEqual(delta['removed'], [str(entries[self.tony.pk])])
+        self.assertEqual(list(feed.rows), [str(entries[self.steve.pk])])
+        subscription.close()
+
+    async def test_sse_and_websocket_streams(self):
+        from .asgi import application
+
+        for scope, connect, disconnect in (
+            ({'type': 'http', 'method': 'GET', 'path': live.SSE_PATH}, None, 'http.disconnect'),
+            ({'type': 'websocket', 'path': live.WEBSOCKET_PATH}, 'websocket.connect', 'websocket.disconnect'),
+        ):
+            incoming, sent = asyncio.Queue(), asyncio.Queue()
+            if connect:
+                incoming.put_nowait({'type': connect})
+            task = asyncio.ensure_future(application(scope, incoming.get, sent.put))
+            messages = [await asyncio.wait_for(sent.get(), 1) for _ in range(2 if connect else 3)]
+            incoming.put_nowait({'type': disconnect})
+            await asyncio.wait_for(task, 1)
+
+            if connect:
+                self.assertEqual(messages[0]['type'], 'websocket.accept')
+                self.assertEqual(json.loads(messages[1]['text'])['type'], 'snapshot')
+            else:
+                self.assertEqual(messages[0]['status'], 200)
+                self.assertIn(b'event: snapshot', messages[2]['body'])
+
+        response = await self.async_client.get(live.SSE_PATH)
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+class RollupTest(TestCase):
+    def setUp(self):
+        rollups.clear()
+        self.addCleanup(rollups.clear)
+        self.client = APIClient()
+        self.marvel = Team.objects.create(name='Team Marvel')
+        self.dc = Team.objects.create(name='Team DC')
+        self.tony = User.objects.create(name='Tony Stark', email='ironman@avengers.com', team=self.marvel)
+        self.clark = User.objects.create(name='Clark Kent', email='superman@justiceleague.com', team=self.dc)
+        # Monday noon of this week, so the current periods are in play.
+        now = timezone.now().astimezone(dt_timezone.utc)
+        self.day = (now - timedelta(days=now.weekday())).replace(hour=12, minute=0, second=0, microsecond=0)
+
+    def _documents(self):
+        return {
+            name: sorted(
+                (document['_id'], document.get('team_id'), document['count'], document['total_duration'],
+                 sorted((k, v['count'], v['duration']) for k, v in document['types'].items() if v['count']))
+                for document in rollups.collection(name).find()
+            )
+            for name in (rollups.USER_DAILY, rollups.TEAM_DAILY)
+        } | {
+            'periods': sorted(
+                (document['_id'], document['count'], document['score'], document['expires_at'])
+                for document in rollups.collection(rollups.USER_PERIODS).find()
+            ),
+        }
+
+    def test_incremental_updates_match_rebuild(self):
+        running = Activity.objects.create(user=self.tony, activity_type='running', duration=30.0, date=self.day)
+        Activity.objects.create(user=self.clark, activity_type='swimming', duration=20.0, date=self.day)
+        response = self.client.post('/api/activities/bulk/', [
+            {'user': self.tony.pk, 'activity_type': 'cycling', 'duration': 60.0,
+             'date': (self.day + timedelta(days=1)).isoformat()},
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        running.duration, running.date = 45.0, self.day + timedelta(days=2)
+        running.save()
+        Activity.objects.filter(user=self.clark).get().delete()
+        self.tony.team = self.dc
+        self.tony.save()
+        self.marvel.delete()
+
+        incremental = self._documents()
+        self.assertEqual(rollups.rebuild(), sum(len(documents) for documents in incremental.values()))
+        self.assertEqual(self._documents(), incremental)
+
+    def test_readers_use_rollups_once_built(self):
+        for user, activity_type, duration, days in (
+            (self.tony, 'running', 30.0, 0), (self.tony, 'cycling', 60.0, 1), (self.clark, 'running', 20.0, 7),
+        ):
+            Activity.objects.create(user=user, activity_type=activity_type, duration=duration,
+                                    date=self.day + timedelta(days=days))
+        rebuild_leaderboard()
+        raw = {group_by: stats.activity_stats(group_by) for group_by in stats.GROUP_BY_CHOICES}
+        raw_summary = stats.team_summary()
+        out = StringIO()
+        call_command('rebuild_rollups', stdout=out)
+        self.assertIn('rollup documents', out.getvalue())
+        self.assertTrue(rollups.ready())
+
+        for group_by, expected in raw.items():
+            self.assertEqual(stats.activity_stats(group_by), expected)
+        self.assertEqual(stats.team_summary(), raw_summary)
+        self.assertIsNotNone(stats._rollup_pipeline('day', stats.parse_date_bound('2026-03-02'), None))
+        self.assertIsNone(stats._rollup_pipeline('day', self.day, None))
+
+
+class TeamLeaderboardTest(TestCase):
+    def setUp(self):
+        rollups.clear()
+        self.addCleanup(rollups.clear)
+        self.client = APIClient()
+        marvel = Team.objects.create(name='Team Marvel')
+        dc = Team.objects.create(name='Team DC')
+        Team.objects.create(name='Team Empty')
+        tony = User.objects.create(name='Tony Stark', email='ironman@avengers.com', team=marvel)
+        clark = User.objects.create(name='Clark Kent', email='superman@justiceleague.com', team=dc)
+        now = timezone.now()
+        for user, duration, days_ago in ((tony, 100.0, 60), (tony, 10.0, 0), (clark, 30.0, 0)):
+            Activity.objects.create(user=user, activity_type='running', duration=duration,
+                                    date=now - timedelta(days=days_ago))
+        rebuild_leaderboard()
+
+    def _ranking(self, **params):
+        response = self.client.get('/api/teams/leaderboard/', params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(team['rank'], team['name'], team['total_score']) for team in response.data['teams']]
+
+    def test_windows_from_activities_and_rollups(self):
+        for build in (False, True):
+            if build:
+                rollups.rebuild()
+                cache.clear()
+            self.assertEqual(self._ranking(), [
+                (1, 'Team Marvel', 110.0), (2, 'Team DC', 30.0), (3, 'Team Empty', 0.0),
+            ])
+            self.assertEqual(self._ranking(window='week'), [
+                (1, 'Team DC', 30.0), (2, 'Team Marvel', 10.0), (3, 'Team Empty', 0.0),
+            ])
+        self.assertEqual(
+            self.client.get('/api/teams/leaderboard/', {'window': 'year'}).status_code,
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+    def test_window_start(self):
+        now = datetime(2026, 3, 5, 18, tzinfo=dt_timezone.utc)  # a Thursday
+        self.assertEqual(stats.window_start('week', now), datetime(2026, 3, 2, tzinfo=dt_timezone.utc))
+        self.assertEqual(stats.window_start('month', now), datetime(2026, 3, 1, tzinfo=dt_timezone.utc))
+        self.assertIsNone(stats.window_start('all', now))
+
+
+class WindowedLeaderboardTest(TestCase):
+    def setUp(self):
+        rollups.clear()
+        self.addCleanup(rollups.clear)
+        self.client = APIClient()
+        team = Team.objects.create(name='Team Marvel')
+        self.users = [
+            User.objects.create(name=name, email=f'{name.split()[0].lower()}@avengers.com', team=team)
+            for name in ('Tony Stark', 'Steve Rogers', 'Bruce Banner', 'Natasha Romanoff')
+        ]
+        tony, steve, bruce, natasha = self.users
+        now = timezone.now()
+        for user, duration, when in (
+            (tony, 500.0, now - timedelta(days=400)),
+            (steve, 30.0, now), (steve, 15.0, now),
+            (bruce, 45.0, now),
+            (natasha, 20.0, now),
+        ):
+            Activity.objects.create(user=user, activity_type='running', duration=duration, date=when)
+        rebuild_leaderboard()
+
+    def _board(self, **params):
+        response = self.client.get('/api/leaderboard/', params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_top_and_my_rank_from_activities_and_rollups(self):
+        tony, steve, bruce, natasha = self.users
+        for build in (False, True):
+            if build:
+                rollups.rebuild()
+                cache.clear()
+            for window in ('day', 'week', 'month'):
+                board = self._board(window=window, top=2, user=natasha.pk)
+                self.assertEqual(
+                    [(row['rank'], row['user_name'], row['score'], row['count']) for row in board['results']],
+                    [(1, 'Steve Rogers', 45.0, 2), (2, 'Bruce Banner', 45.0, 1)],
+                )
+                self.assertEqual((board['me']['rank'], board['me']['score']), (3, 20.0))
+            self.assertIsNone(self._board(window='week', user=tony.pk)['me'])
+
+        # Incremental writes land in the current period only.
+        response = self.client.post('/api/activities/', {
+            'user': tony.pk, 'activity_type': 'yoga', 'duration': 50.0, 'date': timezone.now().isoformat(),
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        board = self._board(window='week', top=1, user=bruce.pk)
+        self.assertEqual([(row['user_name'], row['score']) for row in board['results']], [('Tony Stark', 50.0)])
+        self.assertEqual(board['me']['rank'], 3)
+        self.assertEqual(self._board()['results'][0]['score'], 550.0)
+        self.assertEqual(self.client.get('/api/leaderboard/', {'window': 'year'}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+    def test_periods(self):
+        moment = datetime(2026, 12, 31, 23, tzinfo=dt_timezone.utc)  # a Thursday
+        self.assertEqual(rollups.period('day', moment),
+                         ('2026-12-31', datetime(2026, 12, 31), datetime(2027, 1, 1)))
+        self.assertEqual(rollups.period('week', moment),
+                         ('2026-W53', datetime(2026, 12, 28), datetime(2027, 1, 4)))
+        self.assertEqual(rollups.period('month', moment),
+                         ('2026-12', datetime(2026, 12, 1), datetime(2027, 1, 1)))
+
+
+class WorkoutRecommendationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.peter = User.objects.create(name='Peter Parker', email='spidey@avengers.com', fitness_level='beginner')
+        Workout.objects.create(name='Speedster Sprint Training', difficulty='beginner', exercises=[
+            {'name': 'Sprint Intervals', 'sets': 10}, {'name': 'High Knees', 'sets': 5},
+        ])
+        Workout.objects.create(name='Atlantean Swim Power', difficulty='beginner', exercises=[
+            {'name': 'Freestyle Swimming', 'sets': 3}, {'name': 'Treading Water', 'sets': 3},
+        ])
+        Workout.objects.create(name='Amazonian Sprints', difficulty='god-tier', exercises=[
+            {'name': 'Sprint Intervals', 'sets': 10},
+        ])
+        Activity.objects.create(user=self.peter, activity_type='running', duration=60.0, date=timezone.now())
+
+    def _names(self, **params):
+        response = self.client.get('/api/workouts/recommended/', {'user': self.peter.pk, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [workout['name'] for workout in response.data['results']]
+
+    def test_ranks_by_activity_mix_and_level_and_refreshes(self):
+        self.assertEqual(self._names(), [
+            'Speedster Sprint Training', 'Amazonian Sprints', 'Atlantean Swim Power',
+        ])
+        # New activities drop the cached profile.
+        Activity.objects.create(user=self.peter, activity_type='swimming', duration=600.0, date=timezone.now())
+        self.assertEqual(self._names(limit=1), ['Atlantean Swim Power'])
+        # Old activities fall outside the profile window.
+        Activity.objects.create(user=self.peter, activity_type='yoga', duration=5000.0,
+                                date=timezone.now() - timedelta(days=90))
+        self.assertEqual(self._names(limit=1), ['Atlantean Swim Power'])
+
+        # Workout writes rebuild the index.
+        Workout.objects.create(name='Triathlon Base', difficulty='beginner', exercises=[
+            {'name': 'Swimming', 'sets': 10}, {'name': 'Sprint', 'sets': 1},
+        ])
+        self.assertEqual(self._names(limit=1), ['Triathlon Base'])
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.client.get('/api/workouts/recommended/').status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get('/api/workouts/recommended/', {'user': 999999})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        search.collection().drop()
+        self.addCleanup(search.collection().drop)
+        self.client = APIClient()
+        self.avengers = Team.objects.create(name='Avengers', description='Earth mightiest heroes')
+        self.peter = User.objects.create(name='Peter Parker', email='spidey@avengers.com', team=self.avengers)
+        User.objects.create(name='Pepper Potts', email='pepper@stark.com')
+        User.objects.create(name='José Parkour', email='jose@example.com')
+        Workout.objects.create(name='Parkour Drills', description='Peter approved rooftop runs')
+
+    def _labels(self, q, **params):
+        response = self.client.get('/api/search/', {'q': q, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(entry['type'], entry['label']) for entry in response.data['results']]
+
+    def test_prefix_lookup_follows_writes(self):
+        self.assertEqual(self._labels('pe'), [
+            ('user', 'Pepper Potts'), ('user', 'Peter Parker'), ('workout', 'Parkour Drills'),
+        ])
+        self.assertEqual(self._labels('peter par'), [('user', 'Peter Parker'), ('workout', 'Parkour Drills')])
+        self.assertEqual(self._labels('jose'), [('user', 'José Parkour')])
+        self.assertEqual(self._labels('parkour', type='workout'), [('workout', 'Parkour Drills')])
+        self.assertEqual(self._labels('aven'), [('team', 'Avengers'), ('user', 'Peter Parker')])
+        self.assertEqual(self._labels(''), [])
+
+        self.peter.name = 'Miles Morales'
+        self.peter.save()
+        self.avengers.delete()
+        self.assertEqual(self._labels('mil'), [('user', 'Miles Morales')])
+        self.assertEqual(self._labels('peter', type='user'), [])
+        self.assertEqual(self._labels('aven'), [('user', 'Miles Morales')])
+        self.assertEqual(self.client.get('/api/search/', {'q': 'x', 'type': 'planet'}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+    def test_rebuild_indexes_pymongo_rows_and_admin_uses_index(self):
+        from django.contrib.admin.sites import site
+
+        get_collection(User).insert_one({'id': 999999, 'name': 'Bulk Loaded', 'email': 'bulk@octofit.test'})
+        self.assertEqual(self._labels('bulk'), [])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 6 ', out.getvalue())
+        self.assertEqual(self._labels('bulk'), [('user', 'Bulk Loaded')])
+
+        Activity.objects.create(user=self.peter, activity_type='running', duration=5.0, date=timezone.now())
+        queryset, _ = site._registry[Activity].get_search_results(None, Activity.objects.all(), 'peter')
+        self.assertEqual([activity.user_id for activity in queryset], [self.peter.pk])
+        queryset, _ = site._registry[User].get_search_results(None, User.objects.all(), 'pep')
+        self.assertEqual([user.name for user in queryset], ['Pepper Potts'])
+
+
+class ActivitySnapshotTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.client = APIClient()
+        marvel = Team.objects.create(name='Team Marvel')
+        self.tony = User.objects.create(name='Tony Stark', email='ironman@avengers.com', team=marvel)
+        self.loner = User.objects.create(name='Frank Castle', email='punisher@example.com')
+        day = datetime(2026, 2, 27, 12, tzinfo=dt_timezone.utc)  # a Friday
+        for user, activity_type, duration, days in (
+            (self.tony, 'running', 30.0, 0),
+            (self.tony, 'running', 15.0, 3),
+            (self.tony, 'yoga', 60.0, 4),
+            (self.loner, 'cycling', 20.0, 4),
+        ):
+            Activity.objects.create(
+                user=user, activity_type=activity_type, duration=duration, date=day + timedelta(days=days)
+            )
+
+    def test_incremental_export_and_vectorized_aggregation(self):
+        out = StringIO()
+        call_command('export_snapshot', directory=self.directory, stdout=out)
+        self.assertIn('Appended 4 activities', out.getvalue())
+        Activity.objects.create(user=self.loner, activity_type='cycling', duration=10.0,
+                                date=datetime(2026, 3, 3, 9, tzinfo=dt_timezone.utc))
+        self.assertEqual(snapshot.export(self.directory), (1, 5))
+        self.assertEqual(snapshot.export(self.directory), (0, 5))
+
+        data = snapshot.Snapshot(self.directory)
+        team = self.tony.team_id
+        self.assertEqual(
+            [tuple(row.values()) for row in data.aggregate(('team', 'activity_type', 'week'))],
+            [(None, 'cycling', '2026-W10', 30.0, 2), (team, 'running', '2026-W09', 30.0, 1),
+             (team, 'running', '2026-W10', 15.0, 1), (team, 'yoga', '2026-W10', 60.0, 1)],
+        )
+        self.assertEqual(
+            [(row['month'], row['count']) for row in data.aggregate(['month'])],
+            [('2026-02', 1), ('2026-03', 4)],
+        )
+        bounded = data.aggregate(
+            ['day'], stats.parse_date_bound('2026-03-02'), stats.parse_date_bound('2026-03-03', end=True),
+        )
+        self.assertEqual([(row['day'], row['total_duration']) for row in bounded],
+                         [('2026-03-02', 15.0), ('2026-03-03', 90.0)])
+
+    def test_full_export_leaves_the_live_snapshot_readable(self):
+        snapshot.export(self.directory)
+        before = snapshot.Snapshot(self.directory)
+        Activity.objects.filter(user=self.tony).delete()
+        append = snapshot._append
+        seen = []
+
+        def read_between_batches(*args):
+            appended = append(*args)
+            seen.append(snapshot.Snapshot(self.directory).aggregate(['user']))
+            return appended
+
+        with mock.patch.object(snapshot, '_append', side_effect=read_between_batches):
+            self.assertEqual(snapshot.export(self.directory, full=True, batch_size=1), (1, 1))
+        totals = [(self.tony.pk, 105.0, 3), (self.loner.pk, 20.0, 1)]
+        self.assertEqual([tuple(row.values()) for row in seen[0]], totals)
+        self.assertEqual([tuple(row.values()) for row in before.aggregate(['user'])], totals)
+        self.assertEqual([tuple(row.values()) for row in snapshot.Snapshot(self.directory).aggregate(['user'])],
+                         [(self.loner.pk, 20.0, 1)])
+        columns = [snapshot._column_path(self.directory, 1, name, dtype) for name, dtype in snapshot.COLUMNS.items()]
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         sorted([snapshot.MANIFEST] + [path.name for path in columns]))
+
+    def test_stats_endpoint_reads_snapshot(self):
+        with override_settings(OCTOFIT_SNAPSHOT_DIR=self.directory):
+            response = self.client.get('/api/activities/stats/', {'source': 'snapshot'})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            snapshot.export()
+            for group_by in stats.GROUP_BY_CHOICES:
+                params = {'group_by': group_by, 'date_after': '2026-03-01'}
+                expected = self.client.get('/api/activities/stats/', params).data
+                self.assertEqual(self.client.get('/api/activities/stats/', {**params, 'source': 'snapshot'}).data,
+                                 expected)
+
+
+class TaskQueueTest(TestCase):
+    def setUp(self):
+        tasks.collection().drop()
+        self.addCleanup(tasks.collection().drop)
+        self.client = APIClient()
+        self.tony = User.objects.create(name='Tony Stark', email='ironman@avengers.com')
+        self.steve = User.objects.create(name='Steve Rogers', email='cap@avengers.com')
+
+    def _flaky(self, failures):
+        calls = []
+
+        def flaky():
+            calls.append(1)
+            if len(calls) <= failures:
+                raise RuntimeError('not yet')
+            return len(calls)
+        tasks.task('test_flaky')(flaky)
+        self.addCleanup(tasks._registry.pop, 'test_flaky', None)
+        return calls
+
+    def test_deferred_rebuilds_coalesce(self):
+        self.addCleanup(rollups.clear)
+        response = self.client.post('/api/activities/', {
+            'user': self.tony.pk, 'activity_type': 'running', 'duration': 30, 'date': timezone.now().isoformat(),
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        # Activity writes move the leaderboard inline; only the profile refresh is a job.
+        self.assertEqual(Leaderboard.objects.get(user=self.tony).score, 30.0)
+        self.assertEqual(tasks.collection().distinct('name'), ['refresh_profile'])
+
+        first = tasks.enqueue('rebuild_leaderboard', key='rebuild_leaderboard', defer=True)
+        again = tasks.enqueue('rebuild_leaderboard', key='rebuild_leaderboard', defer=True)
+        tasks.enqueue('rebuild_rollups', key='rebuild_rollups', defer=True)
+        self.assertEqual(first['_id'], again['_id'])
+        Activity.objects.create(user=self.tony, activity_type='yoga', duration=15.0, date=timezone.now())
+        Activity.objects.create(user=self.steve, activity_type='running', duration=60.0, date=timezone.now())
+        self.assertEqual(tasks.run_pending(), 2)
+        self.assertEqual(
+            list(Leaderboard.objects.order_by('rank').values_list('user_id', 'score', 'rank')),
+            [(self.steve.pk, 60.0, 1), (self.tony.pk, 45.0, 2)],
+        )
+
+    @override_settings(OCTOFIT_TASK_MAX_ATTEMPTS=3, OCTOFIT_TASK_RETRY_BACKOFF_SECONDS=10)
+    def test_failed_jobs_retry_with_backoff(self):
+        calls = self._flaky(failures=5)
+        job = tasks.enqueue('test_flaky')
+        self.assertEqual((job['status'], job['attempts'], job['error']), ('queued', 1, 'RuntimeError: not yet'))
+        self.assertEqual(tasks.run_pending(), 0)
+        later = timezone.now() + timedelta(seconds=15)
+        self.assertEqual(tasks.run_pending(now=later), 1)
+        job = tasks.get(str(job['_id']))
+        self.assertEqual((job['status'], job['attempts']), ('queued', 2))
+        self.assertGreater(tasks._aware(job['run_at']), timezone.now() + timedelta(seconds=19))
+        self.assertEqual(tasks.run_pending(now=later + timedelta(minutes=1)), 1)
+        self.assertEqual(tasks.get(str(job['_id']))['status'], 'failed')
+        self.assertEqual(len(calls), 3)
+
+        calls = self._flaky(failures=1)
+        job = tasks.enqueue('test_flaky')
+        tasks.run_pending(now=timezone.now() + timedelta(minutes=1))
+        self.assertEqual(tasks.get(str(job['_id']))['result'], 2)
+
+    def test_inline_enqueue_runs_a_job_waiting_for_its_retry(self):
+        calls = self._flaky(failures=1)
+        job = tasks.enqueue('test_flaky', key='flaky')
+        self.assertEqual((job['status'], len(calls)), ('queued', 1))
+        again = tasks.enqueue('test_flaky', key='flaky')
+        self.assertEqual(again['_id'], job['_id'])
+        self.assertEqual((again['status'], again['attempts'], again['result']), ('done', 2, 2))
+        self.assertEqual(len(calls), 2)
+
+    def test_status_endpoint(self):
+        Activity.objects.create(user=self.steve, activity_type='running', duration=60.0, date=timezone.now())
+        response = self.client.post('/api/tasks/', {'name': 'rebuild_leaderboard'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual((response.data['status'], response.data['result']), ('done', {'entries': 2}))
+        self.assertEqual(Leaderboard.objects.get(rank=1).user_id, self.steve.pk)
+
+        detail = self.client.get(f"/api/tasks/{response.data['id']}/")
+        self.assertEqual(detail.data['name'], 'rebuild_leaderboard')
+        listing = self.client.get('/api/tasks/').data
+        self.assertEqual(listing['counts'], {'queued': 0, 'running': 0, 'done': 2, 'failed': 0})
+        self.assertEqual([job['name'] for job in listing['recent']], ['rebuild_leaderboard', 'refresh_profile'])
+        self.assertEqual(listing['recent'][0]['id'], response.data['id'])
+
+        self.assertEqual(self.client.get('/api/tasks/nope/').status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.post('/api/tasks/', {'name': 'nope'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_writes_by_one_user_coalesce_into_one_refresh(self):
+        with mock.patch.object(tasks, 'workers', return_value=2), mock.patch.object(tasks, 'get_pool'):
+            for duration in (10, 20, 30):
+                self.client.post('/api/activities/', {
+                    'user': self.tony.pk, 'activity_type': 'running', 'duration': duration,
+                    'date': timezone.now().isoformat(),
+                }, format='json')
+            self.client.post('/api/activities/bulk/', [{
+                'user': self.tony.pk, 'activity_type': 'yoga', 'duration': 15, 'date': timezone.now().isoformat(),
+            }], format='json')
+        queued = list(tasks.collection().find({'status': 'queued'}))
+        self.assertEqual([(job['name'], job['key'], job['args']) for job in queued],
+                         [('refresh_profile', f'user:{self.tony.pk}', {'user_id': self.tony.pk})])
+        key = recommendations._PROFILE_KEY.format(self.tony.pk)
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(tasks.run_pending(), 1)
+        self.assertEqual(cache.get(key), recommendations.build_profile(self.tony.pk))
+
+    def test_worker_pool_runs_queued_jobs(self):
+        Activity.objects.create(user=self.tony, activity_type='running', duration=25.0, date=timezone.now())
+        pool = tasks.WorkerPool(2, poll=0.05).start()
+        self.addCleanup(pool.stop)
+        job = tasks.enqueue('rebuild_leaderboard', key='rebuild_leaderboard', defer=True)
+        pool.wake()
+        deadline = time.monotonic() + 5
+        while tasks.get(str(job['_id']))['status'] != 'done' and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(tasks.get(str(job['_id']))['status'], 'done')
+        self.assertEqual(Leaderboard.objects.get(user=self.tony).score, 25.0)
+
+    def test_populate_with_deferred_rebuilds_resets_derived_data(self):
+        self.addCleanup(rollups.clear)
+        self.addCleanup(search.collection().drop)
+        rollups.rebuild()
+        search.rebuild()
+        stale = tasks.enqueue('rebuild_rollups', key='stale', defer=True)
+        call_command('populate_db', users=3, activities_per_user=2, teams=1, defer_rebuilds=True, stdout=StringIO())
+        self.assertFalse(rollups.ready())
+        self.assertIsNone(tasks.get(str(stale['_id'])))
+        self.assertEqual(tasks.counts()['queued'], 2)
+        self.assertIsNone(search.collection().find_one({'label': 'Tony Stark'}))
+
+
+class FieldSelectionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        rollups.clear()
+        self.addCleanup(rollups.clear)
+        self.client = APIClient()
+        team = Team.objects.create(name='Team Marvel')
+        self.tony = User.objects.create(name='Tony Stark', email='ironman@avengers.com', team=team)
+        Activity.objects.create(user=self.tony, activity_type='running', duration=42.0, date=timezone.now())
+        self.entry = Leaderboard.objects.get(user=self.tony)
+
+    def _get(self, url, params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data, len(ctx.captured_queries)
+
+    def test_lists_skip_dropped_lookups(self):
+        full, full_queries = self._get('/api/leaderboard/', {})
+        data, queries = self._get('/api/leaderboard/', {'fields': 'id,user_name,score'})
+        self.assertEqual(data['results'], [{'id': str(self.entry.pk), 'user_name': 'Tony Stark', 'score': 42.0}])
+        self.assertEqual(queries, full_queries - 1)
+        data, queries = self._get('/api/leaderboard/', {'exclude': 'user_name,team_name'})
+        self.assertEqual(list(data['results'][0]), ['id', 'user', 'score', 'rank'])
+        self.assertEqual(queries, full_queries - 2)
+
+        for url in ('/api/users/', '/api/activities/', '/api/leaderboard/'):
+            full = self.client.get(url).data['results']
+            every = ','.join(full[0])
+            self.assertEqual(self.client.get(url, {'fields': every}).data['results'], full, url)
+        activities = self.client.get('/api/activities/', {'fields': 'duration', 'page_size': 1}).data
+        self.assertEqual(activities['results'], [{'duration': 42.0}])
+
+        windowed = self.client.get('/api/leaderboard/', {'window': 'week', 'fields': 'user,rank'}).data
+        self.assertEqual(windowed['results'], [{'user': self.tony.pk, 'rank': 1}])
+
+    def test_model_serializers_skip_dropped_method_fields(self):
+        with mock.patch.object(LeaderboardSerializer, 'get_team_name', side_effect=AssertionError):
+            response = self.client.get(f'/api/leaderboard/{self.entry.pk}/', {'fields': 'id,user_name,score'})
+        self.assertEqual(response.data, {'id': str(self.entry.pk), 'user_name': 'Tony Stark', 'score': 42.0})
+        response = self.client.get(f'/api/users/{self.tony.pk}/', {'exclude': 'team,team_name,avatar,created_at'})
+        self.assertEqual(list(response.data), ['id', 'name', 'email', 'fitness_level'])
+
+        response = self.client.get('/api/users/', {'fields': 'id,nickname'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('nickname', str(response.data['fields']))
+
+        response = self.client.post('/api/activities/?fields=id', {
+            'user': self.tony.pk, 'activity_type': 'yoga', 'duration': 10, 'date': timezone.now().isoformat(),
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+
+class CompactFormatTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        for number in range(40):
+            user = User.objects.create(name=f'Hero {number}', email=f'hero{number}@avengers.com')
+            Activity.objects.create(user=user, activity_type='running', duration=30.0, date=timezone.now())
+
+    def test_negotiates_content_coding(self):
+        self.assertEqual(renderers.negotiate('gzip, deflate'), 'gzip')
+        self.assertEqual(renderers.negotiate('gzip;q=0, br;q=0'), None)
+        self.assertEqual(renderers.negotiate('identity'), None)
+        self.assertEqual(renderers.negotiate('br;q=0.5, gzip;q=0.8'), 'gzip')
+        self.assertEqual(renderers.negotiate('*'), renderers.encodings()[0])
+
+        plain = self.client.get('/api/users/')
+        self.assertNotIn('Content-Encoding', plain)
+        zipped = self.client.get('/api/users/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(zipped['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', zipped['Vary'])
+        self.assertEqual(gzip.decompress(zipped.content), plain.content)
+        self.assertLess(len(zipped.content), len(plain.content))
+
+        exported = self.client.get('/api/activities/export/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(exported['Content-Encoding'], 'gzip')
+        self.assertEqual(len(gzip.decompress(b''.join(exported.streaming_content)).splitlines()), 40)
+
+    @skipUnless(renderers.brotli, 'brotli is not installed')
+    def test_brotli(self):
+        plain = self.client.get('/api/activities/')
+        response = self.client.get('/api/activities/', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(renderers.brotli.decompress(response.content), plain.content)
+
+    @skipUnless(renderers.msgpack, 'msgpack is not installed')
+    def test_messagepack(self):
+        plain = self.client.get('/api/users/', {'page_size': 5})
+        response = self.client.get('/api/users/', {'page_size': 5}, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(renderers.msgpack.unpackb(response.content), plain.json())
+        self.assertLess(len(response.content), len(plain.content))
+        response = self.client.get('/api/tasks/', {'format': 'msgpack'})
+        self.assertEqual(renderers.msgpack.unpackb(response.content)['counts']['failed'], 0)
@@ -4,8 +4,10 @@ from django.conf import settings as django_settings
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from . import async_views, live
+from .instrumentation import metrics
 from .views import (
-    api_root, UserViewSet, TeamViewSet, ActivityViewSet,
+    api_root, cache_stats, health, task_detail, task_list, typeahead, UserViewSet, TeamViewSet, ActivityViewSet,
     LeaderboardViewSet, WorkoutViewSet
 )
 
@@ -34,7 +36,17 @@ django_settings.REST_FRAMEWORK.setdefault('DEFAULT_API_BASE_URL', base_url)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics, name='metrics'),
     path('api/', api_root, name='api-root'),
+    path('api/cache-stats/', cache_stats, name='cache-stats'),
+    path('api/health/', health, name='health'),
+    path('api/search/', typeahead, name='search'),
+    path('api/tasks/', task_list, name='task-list'),
+    path('api/tasks/<str:job_id>/', task_detail, name='task-detail'),
+    path('api/leaderboard/live/', live.unavailable, name='leaderboard-live'),
+    path('api/async/leaderboard/', async_views.LeaderboardView.as_view(), name='async-leaderboard'),
+    path('api/async/activities/', async_views.ActivityListView.as_view(), name='async-activities'),
+    path('api/async/teams/summary/', async_views.TeamSummaryView.as_view(), name='async-team-summary'),
     path('api/', include(router.urls)),
     path('', api_root, name='api-root-home'),
 ]
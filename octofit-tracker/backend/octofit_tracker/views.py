@@ -1,12 +1,23 @@
+import time
+
+from django.http import StreamingHttpResponse
+from pymongo.errors import PyMongoError
 from rest_framework import viewsets, status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import action, api_view
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
 
+from . import caching, export, filters, ingest, leaderboard, mongo, recommendations, search, stats, tasks
+from .caching import CachedResponseMixin
+from .fast_serializers import (
+    LeanListMixin, UserLeanSerializer, ActivityLeanSerializer, LeaderboardLeanSerializer,
+    WindowedLeaderboardLeanSerializer,
+)
 from .models import User, Team, Activity, Leaderboard, Workout
 from .serializers import (
     UserSerializer, TeamSerializer, ActivitySerializer,
-    LeaderboardSerializer, WorkoutSerializer
+    LeaderboardSerializer, WorkoutSerializer, parse_pk, selected_fields
 )
 
 
@@ -21,26 +32,287 @@ def api_root(request, format=None):
     })
 
 
-class UserViewSet(viewsets.ModelViewSet):
-    queryset = User.objects.all()
+@api_view(['GET'])
+def health(request, format=None):
+    """Ping MongoDB through the shared client and report its pool counters."""
+    started = time.perf_counter()
+    try:
+        mongo.get_database().command('ping')
+    except PyMongoError as exc:
+        return Response(
+            {'status': 'unavailable', 'error': str(exc), 'pool': mongo.pool_stats()},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+    return Response({
+        'status': 'ok',
+        'ping_ms': round((time.perf_counter() - started) * 1000, 2),
+        'pool': mongo.pool_stats(),
+    })
+
+
+@api_view(['GET'])
+def cache_stats(request, format=None):
+    """Hit, miss and 304 counters of the response cache, per resource."""
+    return Response(caching.get_stats())
+
+
+MAX_SEARCH_RESULTS = 50
+
+
+@api_view(['GET'])
+def typeahead(request, format=None):
+    """
+    Users, teams and workouts whose words start with ``?q=``. ``?type=``
+    narrows to a comma-separated subset of user, team and workout;
+    ``?limit=`` defaults to 10.
+    """
+    kinds = [kind for kind in request.query_params.get('type', '').split(',') if kind] or search.KINDS
+    unknown = set(kinds) - set(search.KINDS)
+    if unknown:
+        raise ValidationError({'type': f'Must be among: {", ".join(search.KINDS)}.'})
+    limit = max(1, min(filters.int_param(request.query_params, 'limit') or 10, MAX_SEARCH_RESULTS))
+    entries = search.lookup(request.query_params.get('q', ''), kinds, limit)
+    return Response({
+        'query': request.query_params.get('q', ''),
+        'results': [
+            {'type': entry['kind'], 'id': str(entry['ref']), 'label': entry['label'], 'detail': entry['detail']}
+            for entry in entries
+        ],
+    })
+
+
+@api_view(['GET', 'POST'])
+def task_list(request, format=None):
+    """
+    Job counts per status and the most recent jobs. POST ``{"name": ...}``
+    queues one of the rebuilds (coalesced with one already queued).
+    """
+    if request.method == 'POST':
+        name = request.data.get('name') if isinstance(request.data, dict) else None
+        if name not in tasks.manual_tasks():
+            raise ValidationError({'name': f'Must be one of: {", ".join(tasks.manual_tasks())}.'})
+        job = tasks.enqueue(name, key=name)
+        return Response(tasks.public(job), status=status.HTTP_202_ACCEPTED)
+    return Response({
+        'workers': tasks.workers(),
+        'counts': tasks.counts(),
+        'recent': [tasks.public(job) for job in tasks.recent()],
+    })
+
+
+@api_view(['GET'])
+def task_detail(request, job_id, format=None):
+    job = tasks.get(job_id)
+    if job is None:
+        raise NotFound(f'Task {job_id} does not exist.')
+    return Response(tasks.public(job))
+
+
+class UserViewSet(LeanListMixin, viewsets.ModelViewSet):
+    queryset = User.objects.prefetch_related('team')
     serializer_class = UserSerializer
+    lean_serializer_class = UserLeanSerializer
 
 
-class TeamViewSet(viewsets.ModelViewSet):
+class TeamViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Team.objects.all()
     serializer_class = TeamSerializer
+    cache_resource = 'teams'
+
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        """Member count and total/average leaderboard score of every team."""
+        return Response(stats.team_summary())
+
+    def get_cache_resource(self, request):
+        if self.action == 'leaderboard':
+            return 'leaderboard' if request.query_params.get('window', 'all') == 'all' else 'rollups'
+        return super().get_cache_resource(request)
+
+    @action(detail=False, methods=['get'])
+    def leaderboard(self, request):
+        """
+        Teams ranked by their members' summed score, over the current
+        ``?window=day``, ``week``, ``month`` or ``all`` (the default).
+        """
+        return self._cached(request, self._leaderboard)
 
+    def _leaderboard(self, request):
+        window = request.query_params.get('window', 'all')
+        if window not in stats.WINDOW_CHOICES:
+            raise ValidationError({'window': f'Must be one of: {", ".join(stats.WINDOW_CHOICES)}.'})
+        return Response(stats.team_leaderboard(window))
 
-class ActivityViewSet(viewsets.ModelViewSet):
-    queryset = Activity.objects.all()
+
+class ActivityViewSet(LeanListMixin, viewsets.ModelViewSet):
+    queryset = Activity.objects.prefetch_related('user')
+    keyset_ordering = ('-date', '-id')
+    filter_backends = [filters.ActivityFilterBackend]
     serializer_class = ActivitySerializer
+    lean_serializer_class = ActivityLeanSerializer
+    MAX_BULK_ACTIVITIES = 1000
+    MAX_EXPORT_BATCH_SIZE = 10000
+
+    def get_keyset_ordering(self):
+        return filters.activity_ordering(self.request.query_params, self.keyset_ordering)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Create up to ``MAX_BULK_ACTIVITIES`` activities in one request.
+
+        The body is a list of activity objects, each optionally carrying a
+        ``dedupe_key``; resending an item with the same key for the same
+        user is reported as a duplicate instead of stored twice. Valid items
+        are written even if others fail, and every item gets a result entry.
+        """
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError({'non_field_errors': ['Expected a list of activities.']})
+        if len(items) > self.MAX_BULK_ACTIVITIES:
+            raise ValidationError({'non_field_errors': [
+                f'At most {self.MAX_BULK_ACTIVITIES} activities per request.'
+            ]})
+
+        user_pks = set()
+        for item in items:
+            try:
+                user_pks.add(parse_pk(item['user']))
+            except (KeyError, TypeError, ValueError):
+                pass
+        context = self.get_serializer_context()
+        context['users'] = User.objects.in_bulk(user_pks)
+        serializer = self.get_serializer(many=True, context=context)
 
+        results = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            try:
+                if not isinstance(item, dict):
+                    raise ValidationError({'non_field_errors': ['Expected an activity object.']})
+                dedupe_key = item.get('dedupe_key')
+                if dedupe_key is not None and (not isinstance(dedupe_key, str) or not 0 < len(dedupe_key) <= 100):
+                    raise ValidationError({'dedupe_key': ['Must be a non-empty string of at most 100 characters.']})
+                valid.append((index, serializer.child.run_validation(item), dedupe_key))
+            except ValidationError as exc:
+                results[index] = {'index': index, 'status': 'error', 'errors': exc.detail}
 
-class LeaderboardViewSet(viewsets.ModelViewSet):
-    queryset = Leaderboard.objects.all().order_by('rank')
+        outcomes = ingest.insert_activities([(data, key) for _, data, key in valid])
+        for (index, _, _), (outcome, activity_id) in zip(valid, outcomes):
+            results[index] = {
+                'index': index,
+                'status': outcome,
+                'id': str(activity_id) if activity_id is not None else None,
+            }
+
+        counts = {outcome: 0 for outcome in ('created', 'duplicate', 'error')}
+        for result in results:
+            counts[result['status']] += 1
+        if counts['created']:
+            code = status.HTTP_201_CREATED
+        elif counts['error'] == len(items) and items:
+            code = status.HTTP_400_BAD_REQUEST
+        else:
+            code = status.HTTP_200_OK
+        return Response({**counts, 'results': results}, status=code)
+
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        """
+        Totals, counts and averages grouped by ``?group_by=`` (user, team,
+        activity_type, day or week), optionally limited to
+        ``?date_after=``/``?date_before=``. ``?source=snapshot`` answers from
+        the exported columnar snapshot instead of Mongo.
+        """
+        group_by = request.query_params.get('group_by', 'user')
+        if group_by not in stats.GROUP_BY_CHOICES:
+            raise ValidationError({'group_by': f'Must be one of: {", ".join(stats.GROUP_BY_CHOICES)}.'})
+        source = request.query_params.get('source', 'mongo')
+        if source not in stats.SOURCES:
+            raise ValidationError({'source': f'Must be one of: {", ".join(stats.SOURCES)}.'})
+        try:
+            result = stats.activity_stats(group_by, **filters.date_bounds(request.query_params), source=source)
+        except FileNotFoundError:
+            raise ValidationError({'source': 'No snapshot has been exported; run export_snapshot.'})
+        return Response(result)
+
+    @action(detail=False, methods=['get'], url_path='export', url_name='export')
+    def export_activities(self, request):
+        """
+        Stream every matching activity as NDJSON (default) or CSV, chosen
+        with ``?output=``. Takes the list filters (``?user=``, ``?team=``,
+        ``?activity_type=``, ``?date_after=``/``?date_before=``);
+        ``?batch_size=`` sets the Mongo cursor batch size.
+        """
+        output = request.query_params.get('output', 'ndjson')
+        if output not in export.FORMATS:
+            raise ValidationError({'output': f'Must be one of: {", ".join(export.FORMATS)}.'})
+        query = filters.activity_filters(request.query_params)
+        batch_size = filters.int_param(request.query_params, 'batch_size') or export.DEFAULT_BATCH_SIZE
+        batch_size = max(1, min(batch_size, self.MAX_EXPORT_BATCH_SIZE))
+
+        response = StreamingHttpResponse(
+            export.stream(output, export.activity_query(**query), batch_size),
+            content_type=export.FORMATS[output],
+        )
+        response['Content-Disposition'] = f'attachment; filename="activities.{output}"'
+        return response
+
+
+class LeaderboardViewSet(CachedResponseMixin, LeanListMixin, viewsets.ModelViewSet):
+    queryset = Leaderboard.objects.prefetch_related('user__team').order_by('rank')
+    keyset_ordering = ('rank', 'id')
     serializer_class = LeaderboardSerializer
+    lean_serializer_class = LeaderboardLeanSerializer
+    cache_resource = 'leaderboard'
+    MAX_WINDOW_TOP = 100
+
+    def get_cache_resource(self, request):
+        if self.action == 'list' and request.query_params.get('window', 'all') != 'all':
+            return 'rollups'
+        return super().get_cache_resource(request)
+
+    def list(self, request, *args, **kwargs):
+        """
+        The all-time leaderboard, or with ``?window=day|week|month`` the
+        current period's top ``?top=`` entries (default 10) plus the entry
+        of ``?user=`` as ``me``.
+        """
+        window = request.query_params.get('window', 'all')
+        if window == 'all':
+            return super().list(request, *args, **kwargs)
+        if window not in stats.WINDOW_CHOICES:
+            raise ValidationError({'window': f'Must be one of: {", ".join(stats.WINDOW_CHOICES)}.'})
+        return self._cached(request, self._windowed, window)
 
+    def _windowed(self, request, window):
+        top = filters.int_param(request.query_params, 'top') or 10
+        board = leaderboard.windowed(
+            window, max(1, min(top, self.MAX_WINDOW_TOP)), filters.int_param(request.query_params, 'user'),
+        )
+        me = board['me']
+        fields = selected_fields(request.query_params, WindowedLeaderboardLeanSerializer.field_names())
+        rows = WindowedLeaderboardLeanSerializer.serialize(board['results'] + ([me] if me else []), fields)
+        return Response({**board, 'results': rows[:len(board['results'])], 'me': rows[-1] if me else None})
 
-class WorkoutViewSet(viewsets.ModelViewSet):
+
+class WorkoutViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Workout.objects.all()
     serializer_class = WorkoutSerializer
+    cache_resource = 'workouts'
+    MAX_RECOMMENDATIONS = 50
+
+    @action(detail=False, methods=['get'])
+    def recommended(self, request):
+        """
+        The ``?limit=`` (default 10) workouts that best fit ``?user=``'s
+        fitness level and recent activity mix.
+        """
+        user_id = filters.int_param(request.query_params, 'user')
+        if user_id is None:
+            raise ValidationError({'user': 'This parameter is required.'})
+        limit = filters.int_param(request.query_params, 'limit') or 10
+        result = recommendations.recommend(user_id, max(1, min(limit, self.MAX_RECOMMENDATIONS)))
+        if result is None:
+            raise NotFound(f'User {user_id} does not exist.')
+        return Response(result)
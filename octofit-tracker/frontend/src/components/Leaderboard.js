@@ -6,29 +6,64 @@ function Leaderboard() {
   const [error, setError] = useState(null);
 
   const apiUrl = `https://${process.env.REACT_APP_CODESPACE_NAME}-8000.app.github.dev/api/leaderboard/`;
+  const liveUrl = `${apiUrl}live/`;
 
   useEffect(() => {
-    console.log('Leaderboard component: fetching from', apiUrl);
-    fetch(apiUrl)
-      .then((response) => {
-        if (!response.ok) {
-          throw new Error(`HTTP error! status: ${response.status}`);
-        }
-        return response.json();
-      })
-      .then((data) => {
-        console.log('Leaderboard component: fetched data', data);
-        // Support both paginated (.results) and plain array responses
-        const leaderboardList = Array.isArray(data) ? data : data.results || [];
-        setEntries(leaderboardList);
-        setLoading(false);
-      })
-      .catch((err) => {
-        console.error('Leaderboard component: error fetching data', err);
-        setError(err.message);
-        setLoading(false);
+    const fetchOnce = () => {
+      console.log('Leaderboard component: fetching from', apiUrl);
+      fetch(apiUrl)
+        .then((response) => {
+          if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+          }
+          return response.json();
+        })
+        .then((data) => {
+          console.log('Leaderboard component: fetched data', data);
+          // Support both paginated (.results) and plain array responses
+          const leaderboardList = Array.isArray(data) ? data : data.results || [];
+          setEntries(leaderboardList);
+          setLoading(false);
+        })
+        .catch((err) => {
+          console.error('Leaderboard component: error fetching data', err);
+          setError(err.message);
+          setLoading(false);
+        });
+    };
+
+    if (typeof EventSource === 'undefined') {
+      fetchOnce();
+      return undefined;
+    }
+
+    // Live updates: a snapshot on connect, then deltas of the rows that
+    // changed. EventSource reconnects with Last-Event-ID by itself.
+    const source = new EventSource(liveUrl);
+    let received = false;
+    source.addEventListener('snapshot', (event) => {
+      received = true;
+      setEntries(JSON.parse(event.data).rows);
+      setLoading(false);
+    });
+    source.addEventListener('delta', (event) => {
+      const { rows, removed } = JSON.parse(event.data);
+      setEntries((current) => {
+        const byId = new Map(current.map((entry) => [entry.id, entry]));
+        removed.forEach((id) => byId.delete(id));
+        rows.forEach((row) => byId.set(row.id, row));
+        return [...byId.values()].sort((a, b) => a.rank - b.rank);
       });
-  }, [apiUrl]);
+    });
+    source.onerror = () => {
+      // Not served over ASGI: fall back to a one-off fetch.
+      if (!received) {
+        source.close();
+        fetchOnce();
+      }
+    };
+    return () => source.close();
+  }, [apiUrl, liveUrl]);
 
   if (loading) return <div className="text-center mt-4"><div className="spinner-border" role="status" /></div>;
   if (error) return <div className="alert alert-danger mt-4">Error: {error}</div>;
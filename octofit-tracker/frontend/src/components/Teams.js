@@ -4,8 +4,10 @@ function Teams() {
   const [teams, setTeams] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
+  const [period, setPeriod] = useState('all');
 
-  const apiUrl = `https://${process.env.REACT_APP_CODESPACE_NAME}-8000.app.github.dev/api/teams/`;
+  // Ranked server-side by the members' summed score over the window.
+  const apiUrl = `https://${process.env.REACT_APP_CODESPACE_NAME}-8000.app.github.dev/api/teams/leaderboard/?window=${period}`;
 
   useEffect(() => {
     console.log('Teams component: fetching from', apiUrl);
@@ -18,9 +20,7 @@ function Teams() {
       })
       .then((data) => {
         console.log('Teams component: fetched data', data);
-        // Support both paginated (.results) and plain array responses
-        const teamList = Array.isArray(data) ? data : data.results || [];
-        setTeams(teamList);
+        setTeams(data.teams || []);
         setLoading(false);
       })
       .catch((err) => {
@@ -36,25 +36,37 @@ function Teams() {
   return (
     <div className="container mt-4">
       <h2>Teams</h2>
+      <div className="btn-group mb-3" role="group">
+        {[['week', 'This week'], ['month', 'This month'], ['all', 'All time']].map(([value, label]) => (
+          <button
+            key={value}
+            type="button"
+            className={`btn btn-outline-primary${period === value ? ' active' : ''}`}
+            onClick={() => setPeriod(value)}
+          >
+            {label}
+          </button>
+        ))}
+      </div>
       <table className="table table-striped table-bordered">
         <thead className="table-dark">
           <tr>
+            <th>Rank</th>
             <th>Team Name</th>
             <th>Members</th>
+            <th>Score</th>
           </tr>
         </thead>
         <tbody>
           {teams.length === 0 ? (
-            <tr><td colSpan="2" className="text-center">No teams found.</td></tr>
+            <tr><td colSpan="4" className="text-center">No teams found.</td></tr>
           ) : (
             teams.map((team, index) => (
-              <tr key={team._id || team.id || index}>
+              <tr key={team.id || index}>
+                <td>{team.rank}</td>
                 <td>{team.name}</td>
-                <td>
-                  {Array.isArray(team.members)
-                    ? team.members.join(', ')
-                    : team.members}
-                </td>
+                <td>{team.member_count}</td>
+                <td>{team.total_score}</td>
               </tr>
             ))
           )}